@@ -1,11 +1,6 @@
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from functools import partial
-import itertools
-import numpy as np
 import os
 import pandas as pd
-import threading
 
 # OPTIONAL: set your own environment
 ##ef = const.load_env(r'E:\_UNHCR\CODE\unhcr_module\.env')
@@ -32,72 +27,26 @@ if const.LOCAL:
 
 
 #!!!!!! upload new gb data to db concurrent -- update all_api_gbs using unhcr_module\gb_serial_nums.py
-global_counter = itertools.count(0)
-counter_lock = threading.Lock()
-
-def process_chunk_new(chunk, param1, param2, param3, param4):
-    with counter_lock:
-        chunk_count = next(param4)  # Thread-safe chunk count
-    chunk_size = len(chunk)
-    print(f"Processing chunk #{chunk_count} with {chunk_size} items")
-
-    results = []
-    item_count = itertools.count(0)  # Reset counter for each chunk
-    item_lock = threading.Lock()
-
-    for item in chunk:
-        with item_lock:
-            current_item_count = next(item_count)  # Now it's per chunk
-
-        print(f"Processing chunk #{chunk_count} item #{current_item_count}")
-        msg = f'{chunk_count}:{current_item_count} of {chunk_size}'
-        result = gb_eyedro.upsert_gb_data(s_num=item, engine=param1, epoch_cutoff=param2, MAX_EMPTY=param3, msg=msg, logger=logger)  # Apply function to each item
-        #########result = add_constraints(db_eng=param1, serial=item)
-        results.append(result)
-
-    return results
-
-def process_chunk_historical(chunk, param1, param2, param3, param4):
-    with counter_lock:
-        chunk_count = next(param4)  # Thread-safe chunk count
-
-    chunk_size = len(chunk)
-    print(f"Processing chunk #{chunk_count} with {chunk_size} items")
-    results = []
-    item_count = itertools.count(0)  # Reset counter for each chunk
-    item_lock = threading.Lock()
-
-    for item in chunk:
-        with item_lock:
-            current_item_count = next(item_count)  # Now it's per chunk
-        print(f"Processing chunk #{chunk_count} item #{current_item_count}")
-        msg = f'{chunk_count}:{current_item_count} of {chunk_size}'
-        result = gb_eyedro.upsert_gb_data(s_num=item, engine=param1, epoch_start=param2, MAX_EMPTY=param3, msg=msg, logger=logger)  # Apply function to each item
-        results.append(result)
-    return results
-
 run_dt = datetime.now().date()
 #ILTERED_GB_SN_PATH=const.add_csv_dt(const.ALL_API_GBS_CSV_PATH, (run_dt - timedelta(days=1)).isoformat()) #const.add_csv_dt(const.ALL_API_GBS_CSV_PATH, run_dt.isoformat())
 FILTERED_GB_SN_PATH=const.add_csv_dt(const.ALL_API_GBS_CSV_PATH, (run_dt).isoformat()) #const.add_csv_dt(const.ALL_API_GBS_CSV_PATH, run_dt.isoformat())
 
-if os.path.exists(FILTERED_GB_SN_PATH):
-    df = pd.read_csv(FILTERED_GB_SN_PATH)
-    filtered_gb_sn_df = df[df['gb_serial'].str.startswith('B') | df['gb_serial'].str.startswith('009')]['gb_serial'].drop_duplicates()
-else:
-    df, err = gb_eyedro.api_get_user_info_as_df()
-    if err:
-        logger.error(f"api_get_user_info_as_df ERROR: {err}")
+# one GetUserInfo call gives the serials and their last communication
+df, err = gb_eyedro.api_get_user_info_as_df()
+if err:
+    logger.error(f"api_get_user_info_as_df ERROR: {err}")
+    if not os.path.exists(FILTERED_GB_SN_PATH):
         exit(1)
+    df = pd.read_csv(FILTERED_GB_SN_PATH)
 
-    filtered_gb_sn_df = df[df['gb_serial'].str.startswith('B') | df['gb_serial'].str.startswith('009')]['gb_serial'].drop_duplicates()
+filtered_gb_sn_df = df[df['gb_serial'].str.startswith('B') | df['gb_serial'].str.startswith('009')]['gb_serial'].drop_duplicates()
+# a cached csv may be stale, only trust last comm from the live call
+last_comm_map = gb_eyedro.gb_last_comm_map(df) if not err else None
 
 sn_array = sorted(filtered_gb_sn_df.str.replace('-', '').tolist())
 
 #!!!!sn_array = ['00980AA3']
 
-num_parts = 10
-chunks = [list(chunk) for chunk in np.array_split(sn_array, num_parts)]  # Ensure list format
-
 days = 3
 dt_start = datetime.now(timezone.utc)
 cutoff = datetime.now(timezone.utc) - timedelta(days=days)
@@ -105,19 +54,39 @@ epoch_cutoff = app_utils.get_previous_midnight_epoch(int(cutoff.timestamp()))
 db_eng = db.set_local_defaultdb_engine()
 MAX_EMPTY = days
 
+# new: walk back from the last comm, historical: walk back from epoch_start, gaps: only the days holding open gaps
+mode = 'new'
 
-with ThreadPoolExecutor(max_workers=num_parts) as executor:
-    item_counter = itertools.count(0)
-    results = list(executor.map(partial(process_chunk_new, param1=db_eng, param2=epoch_cutoff, param3=MAX_EMPTY, param4=global_counter), chunks))
-
-# epoch_start = gb_eyedro.epoch_2024 + 86400
-# with ThreadPoolExecutor(max_workers=num_parts) as executor:
-#     item_counter = itertools.count(0)
-#     results = list(executor.map(partial(process_chunk_historical, param1=db_eng, param2=epoch_start, param3=MAX_EMPTY, param4=global_counter), chunks))
-
+# one eyedro.gb_1min hypertable for the fleet: moves any per serial tables over and adds the views for new serials
+if const.GB_LONG_TABLE:
+    res, err = gb_eyedro.db_migrate_gb_to_1min(sn_array, db_eng, logger=logger)
+    if err:
+        logger.error(f"db_migrate_gb_to_1min ERROR: {err}")
+        exit(1)
 
-# Flatten results
-final_output = [item for sublist in results for item in sublist]
+# days already fully ingested or confirmed empty are not requested again
+gb_eyedro.db_create_gb_coverage_table(db_eng)
+coverage, err = gb_eyedro.db_get_gb_coverage(db_eng, sn_array)
+if err:
+    coverage = None
+
+if mode == 'new':
+    # all serials share one keep-alive session, at most const.GB_API_MAX_CONCURRENCY day requests in flight
+    final_output = gb_eyedro.upsert_gb_fleet(sn_array, db_eng, epoch_cutoff=epoch_cutoff, MAX_EMPTY=MAX_EMPTY, logger=logger,
+                                             last_comm_map=last_comm_map, coverage=coverage)
+elif mode == 'historical':
+    epoch_start = gb_eyedro.epoch_2024 + 86400
+    final_output = gb_eyedro.upsert_gb_fleet(sn_array, db_eng, epoch_start=epoch_start, MAX_EMPTY=MAX_EMPTY, logger=logger,
+                                             coverage=coverage)
+elif mode == 'gaps':
+    # scales with the missing data: gaps are marked resolved or unrecoverable afterwards
+    final_output = gb_eyedro.gb_backfill_gaps(db_eng, serials=sn_array, logger=logger)
+
+# opt in: compression (GB_COMPRESS_AFTER) and retention (GB_RAW_RETENTION) for hypertables that do not have it yet
+if const.GB_COMPRESS_AFTER or const.GB_RAW_RETENTION:
+    res, err = gb_eyedro.db_set_gb_storage_policies(db_eng, logger=logger)
+    if err:
+        logger.error(f"db_set_gb_storage_policies ERROR: {err}")
 
 # Compute elapsed time
 elapsed = datetime.now(timezone.utc) - dt_start
@@ -1,5 +1,4 @@
-from datetime import datetime, timezone
-import time
+from datetime import datetime, timedelta, timezone
 
 from unhcr import app_utils
 from unhcr import constants as const
@@ -28,7 +27,7 @@ if const.LOCAL:
     logger, app_utils, const, db, api_solarman, err_handler = res
 
 db_eng = db.set_local_defaultdb_engine()
-epochs = []
+epochs = {}
 
 
 
@@ -42,30 +41,27 @@ for deviceSn in devices:
     if err:
         logger.error(err)
         continue
-    epochs.append(epoch)
+    epochs[deviceSn] = epoch
 if not epochs:
     logger.warning(f'No epochs for weather devices found to process {df_weather_devices["device_sn"]}')
     exit(1)
-epoch = min(epochs)
-epoch_now = int(time.time())
-epoch = epoch_now - (5 * 86400)
-epoch = epoch - (epoch % 86400)
-MAX_LOOPS = 1000
-while epoch < epoch_now:
-    date_str = (
-        datetime.fromtimestamp(epoch, tz=timezone.utc).date().strftime("%Y-%m-%d")
-    )
-    df_data, err = err_handler.error_wrapper(lambda: api_solarman.api_get_weather_data(date_str, df_weather_devices))
-    if err:
-        logger.error(f"sm_weather db_update_weather (next day) ERROR: {err}")
-    else:
-        res, err = api_solarman.db_update_weather(df_data, epoch, db_eng)
-    if err:
-        logger.error(f"sm_weather db_update_weather (next day) ERROR: {err}")
+# each device catches up on the last five days, or from its own latest reading when it has been
+# behind longer, but never past SM_WEATHER_MAX_CATCHUP_DAYS so a dead station can not drag every run
+end_date = datetime.now(timezone.utc).date()
+start_date = end_date - timedelta(days=const.SM_WEATHER_MAX_CATCHUP_DAYS)
+recent = end_date - timedelta(days=5)
+starts = {}
+for deviceSn in devices:
+    epoch = epochs.get(deviceSn)  # None: device without readings yet, or its epoch could not be read
+    last = datetime.fromtimestamp(epoch, tz=timezone.utc).date() if epoch else recent
+    starts[deviceSn] = max(start_date, min(last, recent))
+start_date = min(starts.values())
 
-    #next day
-    epoch = epoch + 86400
-    MAX_LOOPS -= 1
-    if MAX_LOOPS <= 0:
-        logger.warning("Max loops reached, exiting...")
-        break
+# (device, day) requests run concurrently under the shared SolarMan rate limit, the whole range
+# is written with one db_update_weather call
+res, err = api_solarman.ingest_weather_range(df_weather_devices, start_date, end_date, db_eng, logger=logger,
+                                             starts=starts)
+if err:
+    logger.error(f"sm_weather ingest_weather_range ERROR: {err}")
+    exit(1)
+logger.info(f"sm_weather {start_date} - {end_date}: {res}")
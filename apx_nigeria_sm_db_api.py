@@ -1,8 +1,6 @@
 import calendar
-from concurrent.futures import ThreadPoolExecutor
 from datetime import UTC, datetime, timedelta, timezone
 from dateutil.relativedelta import relativedelta
-import itertools
 import json
 import logging
 import numpy as np
@@ -13,7 +11,6 @@ from psycopg2 import DatabaseError
 import requests
 from sqlalchemy import text
 import sys
-import threading
 import time
 
 from unhcr import api_solarman
@@ -21,6 +18,7 @@ from unhcr import app_utils
 from unhcr import constants as const
 from unhcr import db
 from unhcr import err_handler
+from unhcr import gb_eyedro
 
 mods=[
     ["api_solarman", "api_solarman"],
@@ -28,13 +26,14 @@ mods=[
     ["constants", "const"],
     ["db", "db"],
     ["err_handler", "err_handler"],
+    ["gb_eyedro", "gb_eyedro"],
 ]
 
 res =app_utils.app_init(mods=mods,  log_file="unhcr.app_nigeria_sm_db_api.log", version= '0.4.8', level="INFO", override=True, quiet=False)
 logger = res[0]
 # local testing ===================================
 if const.LOCAL:  # testing with local python files
-    logger, api_solarman, app_utils, const, db, err_handler = res
+    logger, api_solarman, app_utils, const, db, err_handler, gb_eyedro = res
 
 
 #!!!!!!!!!!!!!!!!!!!!
@@ -126,132 +125,18 @@ pass
 # Fetch inverter serial numbers
 inverters_sn = api_solarman.db_get_inverter_sns(db_eng)
 
-# Get the initial date from the database
-res, err = db.sql_execute(
-    """
-    WITH x AS (
-        SELECT device_sn, MIN(ts) ts 
-        FROM solarman.inverter_data 
-        GROUP BY 1
-    ) 
-    SELECT MAX(ts)::date FROM x;
-    """,
-    db_eng
-)
-
-if err:
-    logger.error(err)
-    exit(9)
-
-start_dt = res[0][0]
-num_threads = len(inverters_sn)  # Number of parallel threads (adjust as needed)
-#num_threads = 1  # For testing, set to 1 to avoid parallel processing
-
-# Split inverter list into chunks for parallel processing
-chunks = [list(chunk) for chunk in np.array_split(inverters_sn, num_threads)]  
-
-# Thread-safe counters
-  # Tracks processed chunks
-  # Tracks processed inverters within chunks
-counter_lock = threading.Lock()
-api_lock = threading.Lock()
-def process_chunk(chunk, date, engine):
-    """Fetch inverter data for a chunk of inverters in parallel."""
-    with counter_lock:
-        chunk_count = next(global_counter)  # Thread-safe chunk count
-    chunk_size = len(chunk)
-    print(f"Processing chunk #{chunk_count} on {date} with {chunk_size} inverters")
-
-    results = []
-    item_lock = threading.Lock()
-    item_counter = itertools.count(0)
-    for sn in chunk:
-        with item_lock:
-            item_count = next(item_counter)  # Thread-safe item count
-
-        #print(f"Processing chunk #{chunk_count} | SN {sn} | Item #{item_count}")
-
-
-        start_time = time.time()
-        # this blocks till the API call returns. The solarman API server seems to have changed, it used to be async
-        # I used to be able to calls this in parallel, but now it slows down.
-        with api_lock:
-            res, err = api_solarman.get_inverter_data(sn=sn, start_date=date, type=1)
-        if err:
-            logger.error(f"Error fetching data for SN {sn}: {err}")
-        else:
-            res, err = err_handler.error_wrapper(lambda: api_solarman.insert_inverter_data(db_eng, res))
-            if err:
-                logger.error(f"Error fetching data for SN {sn}: {err}")
-        end_time = time.time()
-        print(f"SN: {sn} | Execution time: {((end_time - start_time)):.2f} secs")
-
-        results.append((sn, res, err))
-
-    return results
-
-# **MAIN PROCESS LOOP**
-###!!! if getting new data   start_dt = datetime.today().date()
-start_dt = datetime.strptime('2025-03-22', "%Y-%m-%d").date()
-start_dt = datetime.today().date() + timedelta(days=1)
-x = 3
+# every missing (inverter, day) back to the site go-live, newest first; progress is kept in
+# solarman.inverter_backfill so a re-run only fetches what is still missing
 timing = time.time()
-while x > 0:
-    global_counter = itertools.count(1)
-
-    
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        results = list(
-            executor.map(lambda chunk: process_chunk(chunk, start_dt, db_eng), chunks)
-        )
-
-    print(f"Completed processing for {start_dt}. Moving to next day.")
-    # Compute elapsed time
-    et = time.time()
-    elapsed = et-timing
-    timing = et
-    print(f"Elapsed time: {elapsed:.2f} seconds")
-    x -= 1
-    start_dt -= timedelta(days=1)
-    if x <= 0 or start_dt < datetime.strptime('2024-10-01', "%Y-%m-%d").date():
-        break
-    #time.sleep(1)
-
-# Flatten results
-final_output = [item for sublist in results for item in sublist]
-pass
-
-
-
-
-
-
-
-
-
-
-
-
-inverters_sn = api_solarman.db_get_inverter_sns(db_eng)
-
-start_dt = datetime.today().date()
-res, err = db.sql_execute(f"with x as (select device_sn, min(ts) ts FROM solarman.inverter_data group by 1)select max(ts)::date from x;", db_eng)
+final_output, err = api_solarman.backfill_inverters(
+    inverters_sn, datetime.strptime('2024-10-01', "%Y-%m-%d").date(), db_eng, logger=logger
+)
 if err:
-    logger.error(err)
+    logger.error(f"backfill_inverters ERROR: {err}")
     exit(9)
-start_dt = res[0][0]
-while 1 == 1:
-    for sn in inverters_sn:
-        print("SN: ", sn, start_dt)
-        start_time = time.time()
-        res, err = api_solarman.get_inverter_data(sn=sn, start_date=start_dt, type=1, db_eng=db_eng)
-        end_time = time.time()
-        print(f'Execution time: {((end_time - start_time)/60):.2f} minutes')
-        pass
-    start_dt = start_dt - timedelta(days=1)
-pass
-# api_solarman.insert_inverter_data(data, db_eng=None)
-# pass
+print(f"Backfilled {len(final_output)} inverter days in {time.time() - timing:.2f} seconds")
+# the Eyedro and cursor code below was never reached behind the old endless inverter loop, keep it that way
+exit(0)
 
 
 
@@ -667,6 +552,9 @@ SELECT add_continuous_aggregate_policy('eyedro.gb_{serial}_hourly',
         logger.error(f"Unexpected error: {e}")
     finally:
         conn.close()  # ✅ Always close the connection
+    # same opt in compression / retention as the gb_eyedro tables
+    if const.GB_COMPRESS_AFTER or const.GB_RAW_RETENTION:
+        gb_eyedro.db_set_gb_storage_policies(engine, logger=logger)
 
 genset_gbs = ['00980b6d']
 #create_tables(genset_gbs)
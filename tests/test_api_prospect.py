@@ -1,3 +1,7 @@
+import gzip
+import json
+from unittest.mock import MagicMock, patch
+
 import pytest
 import requests
 import pandas as pd
@@ -5,6 +9,9 @@ from unhcr import constants as const
 from unhcr.api_prospect import (
     get_prospect_url_key,
     api_in_prospect,
+    api_in_prospect_batch,
+    get_column_map,
+    map_columns,
     get_prospect_last_data,
 )
 
@@ -187,3 +194,43 @@ def test_get_prospect_last_data(response_text, expected_timestamp):
     print("#################", timestamp, expected_timestamp)
     # Assert
     assert timestamp == expected_timestamp
+
+
+@pytest.mark.parametrize("ok, expected_err", [(True, None), (False, "api_in_prospect_batch HTTP 503: busy")],
+                         ids=["accepted", "rejected"])
+def test_api_in_prospect_batch(ok, expected_err):
+    """
+    Tests that api_in_prospect_batch posts the records gzip compressed over the pooled session and
+    reports a rejected batch as an error.
+    """
+    session = MagicMock()
+    session.post.return_value = MagicMock(ok=ok, status_code=200 if ok else 503, text="busy")
+
+    with patch("unhcr.api_prospect.get_session", return_value=session):
+        res, err = api_in_prospect_batch('[{"external_id": "sys_1"}]', local=True)
+
+    assert err == expected_err
+    assert (res is session.post.return_value) == ok
+    url = session.post.call_args[0][0]
+    kwargs = session.post.call_args[1]
+    assert url.endswith("/v1/in/custom")
+    assert kwargs["headers"]["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(kwargs["data"])) == {"data": [{"external_id": "sys_1"}]}
+
+
+def test_map_columns_caches_mapping():
+    """
+    Tests that map_columns renames to the Prospect field names and computes the mapping once per column set.
+    """
+    get_column_map.cache_clear()
+    df = pd.DataFrame({"datetimeserver": ["2024-08-15 12:00"], "hvb1_soc": [80], "external_id": ["sys_1"]})
+
+    mapped = map_columns(df)
+
+    assert list(mapped.columns) == ["DatetimeServer", "HVB1_SOC", "external_id"]
+    assert get_column_map(tuple(df.columns)) == {"datetimeserver": "DatetimeServer", "hvb1_soc": "HVB1_SOC"}
+    map_columns(df)
+    map_columns(df[["datetimeserver"]])
+    info = get_column_map.cache_info()
+    assert (info.hits, info.misses) == (2, 2)
+    get_column_map.cache_clear()
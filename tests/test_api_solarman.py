@@ -0,0 +1,480 @@
+import json
+import threading
+import time
+from datetime import date, datetime, timezone
+from unittest.mock import patch, MagicMock
+
+import pandas as pd
+import pytest
+import requests
+
+from unhcr import api_solarman
+from unhcr import db
+
+
+@pytest.fixture(autouse=True)
+def mock_dependencies():
+    with patch("unhcr.api_solarman.logger") as mock_logger, \
+            patch("unhcr.api_solarman.db") as mock_db:
+        mock_db.copy_merge.side_effect = db.copy_merge
+        yield mock_logger, mock_db
+
+
+# Test cases for the rate limiter
+def test_rate_limiter_spaces_calls():
+    limiter = api_solarman.RateLimiter(rate=20, burst=1)
+
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+
+    # the first token is available at once, the other four refill at 20 per second
+    assert time.monotonic() - start >= 0.19
+
+
+def test_rate_limiter_burst_is_free():
+    limiter = api_solarman.RateLimiter(rate=1, burst=3)
+
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire()
+
+    assert time.monotonic() - start < 0.1
+
+
+# Test cases for the fleet scheduler
+def test_inverter_days_to_fetch_interleaves_devices(mock_dependencies):
+    mock_logger, mock_db = mock_dependencies
+    mock_db.sql_execute.return_value = ([("A", datetime(2025, 3, 9, 12)), ("B", None)], None)
+
+    work, err = api_solarman.inverter_days_to_fetch(["A", "B"], date(2025, 3, 10), MagicMock(), default_days=3)
+
+    assert err is None
+    assert work == [
+        ("B", date(2025, 3, 10)), ("A", date(2025, 3, 10)),
+        ("B", date(2025, 3, 9)), ("A", date(2025, 3, 9)),
+        ("B", date(2025, 3, 8)),
+    ]
+
+
+@patch("unhcr.api_solarman.insert_inverter_data")
+@patch("unhcr.api_solarman.fetch_inverter_day")
+@patch("unhcr.api_solarman.inverter_days_to_fetch")
+def test_ingest_inverter_fleet_fetches_concurrently(mock_plan, mock_fetch, mock_insert, mock_dependencies):
+    work = [("A", date(2025, 3, 10)), ("B", date(2025, 3, 10)), ("C", date(2025, 3, 10)), ("A", date(2025, 3, 9))]
+    mock_plan.return_value = (work, None)
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def fetch(sn, day, type, client):
+        with lock:
+            in_flight.append(sn)
+            peak.append(len(in_flight))
+        time.sleep(0.05)
+        with lock:
+            in_flight.remove(sn)
+        if sn == "C":
+            return None, "API call not successful"
+        return [{"collectTime": 0, "dataList": []}], None
+
+    mock_fetch.side_effect = fetch
+    mock_insert.return_value = (1, None)
+
+    results, err = api_solarman.ingest_inverter_fleet(["A", "B", "C"], date(2025, 3, 10), MagicMock(),
+                                                      concurrency=4, rate=100)
+
+    assert err is None
+    assert max(peak) > 1
+    assert sorted(results) == sorted([
+        ("A", date(2025, 3, 10), 1, None), ("B", date(2025, 3, 10), 1, None),
+        ("C", date(2025, 3, 10), 0, "API call not successful"), ("A", date(2025, 3, 9), 1, None),
+    ])
+    # the three fetched days are written by the writer thread, not by the fetch workers
+    assert sum(len(call[0][1]) for call in mock_insert.call_args_list) == 3
+
+
+# Test cases for the shared client
+def _response(status, body=None, headers=None):
+    response = MagicMock()
+    response.status_code = status
+    response.headers = headers or {}
+    response.json.return_value = body or {}
+    response.text = str(body)
+    return response
+
+
+@patch("unhcr.api_solarman.time.sleep")
+def test_client_retries_throttled_calls(mock_sleep):
+    client = api_solarman.SolarmanClient(rate=1000, concurrency=2, retries=3, backoff=0.5)
+    client.session = MagicMock()
+    client.session.post.side_effect = [_response(429), _response(503), _response(200, {"success": True})]
+
+    response = client.post("https://sm/historical", "{}")
+
+    assert response.status_code == 200
+    assert client.session.post.call_count == 3
+    delays = [call[0][0] for call in mock_sleep.call_args_list]
+    assert 0.25 <= delays[0] <= 0.5 and 0.5 <= delays[1] <= 1.0
+
+
+@patch("unhcr.api_solarman.time.sleep")
+def test_client_gives_up_after_retries(mock_sleep):
+    client = api_solarman.SolarmanClient(rate=1000, retries=1)
+    client.session = MagicMock()
+    client.session.post.return_value = _response(429)
+
+    response = client.post("https://sm/historical", "{}")
+
+    assert response.status_code == 429
+    assert client.session.post.call_count == 2
+
+
+@patch("unhcr.api_solarman.time.sleep")
+def test_client_retries_connection_errors_and_api_throttling(mock_sleep):
+    client = api_solarman.SolarmanClient(rate=1000, retries=3, backoff=0.5)
+    client.session = MagicMock()
+    client.session.post.side_effect = [
+        requests.ConnectionError("reset"),
+        requests.Timeout("slow"),
+        _response(200, {"success": False, "code": "2101019", "msg": "request too frequently"}),
+        _response(200, {"success": True}),
+    ]
+
+    response = client.post("https://sm/historical", "{}")
+
+    assert response.json() == {"success": True}
+    assert client.session.post.call_count == 4
+    assert mock_sleep.call_count == 3
+
+
+@patch("unhcr.api_solarman.time.sleep")
+def test_client_raises_when_connection_keeps_failing(mock_sleep):
+    client = api_solarman.SolarmanClient(rate=1000, retries=1)
+    client.session = MagicMock()
+    client.session.post.side_effect = requests.ConnectionError("down")
+
+    with pytest.raises(requests.ConnectionError):
+        client.post("https://sm/historical", "{}")
+    assert client.session.post.call_count == 2
+
+
+def test_client_refreshes_rejected_token():
+    client = api_solarman.SolarmanClient(rate=1000)
+    client.token = "old"
+    client.session = MagicMock()
+    client.session.post.side_effect = [
+        _response(401),
+        _response(200, {"success": True, "access_token": "new", "expires_in": "5183999"}),
+        _response(200, {"success": True}),
+    ]
+
+    with patch.object(api_solarman.const, "SM_EMAIL", "a@b.c"), patch.object(api_solarman.const, "SM_PASSWORD", "pw"):
+        response = client.post("https://sm/historical", "{}")
+
+    assert response.status_code == 200
+    assert client.token == "new"
+    assert client.session.post.call_args[1]["headers"]["Authorization"] == "Bearer new"
+
+
+@patch("unhcr.api_solarman.get_client")
+def test_fetch_inverter_day_uses_shared_client(mock_get_client):
+    mock_get_client.return_value.post.return_value = _response(200, {"success": True, "paramDataList": [1, 2]})
+
+    data, err = api_solarman.fetch_inverter_day("2309200154", date(2025, 3, 10))
+
+    assert err is None
+    assert data == [1, 2]
+    url, payload = mock_get_client.return_value.post.call_args[0]
+    assert url == api_solarman.const.SM_HISTORY_URL
+    assert '"endTime": "2025-03-11"' in payload
+
+
+# Test cases for the columnar inverter upsert
+def _record(collect_time, sn="2309200154", power="1.5"):
+    return {"collectTime": collect_time, "dataList": [
+        {"key": "SN1", "value": sn},
+        {"key": "SYSTIM1", "value": "25-03-10 12:01:07"},
+        {"key": "DV1", "value": power},
+        {"key": "DV2", "value": "n/a"},
+        {"key": "UNKNOWN", "value": "x"},
+    ]}
+
+
+def test_inverter_rows_types_and_dedupes():
+    columns, _ = api_solarman.inverter_columns()
+    # 12:00:10 and 12:01:50 both round to 12:00
+    rows = api_solarman.inverter_rows([_record(1741608010), _record(1741608110, power="9"), _record(1741608310)])
+
+    assert len(rows) == 2
+    row = dict(zip(columns, rows[0]))
+    assert row["ts"] == datetime(2025, 3, 10, 12, 0)
+    assert row["device_sn"] == "2309200154"
+    assert row["system_time"] == "2025-03-10 12:01"
+    assert row["dc_voltage_pv1"] == 1.5
+    assert row["dc_voltage_pv2"] is None
+
+
+def test_insert_inverter_data_copies_and_merges():
+    db_eng = MagicMock()
+    conn = db_eng.raw_connection.return_value
+    conn.info = {}
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.rowcount = 2
+
+    cnt, err = api_solarman.insert_inverter_data(db_eng, [_record(1741608010), _record(1741608310)])
+
+    assert (cnt, err) == (2, None)
+    copy_sql, buf = cur.copy_expert.call_args[0]
+    assert copy_sql.startswith(f"COPY {api_solarman.INVERTER_STAGE_TABLE} (ts, device_sn,")
+    assert len(buf.getvalue().splitlines()) == 2
+    merge_sql = cur.execute.call_args_list[-1][0][0]
+    assert "ON CONFLICT (ts, device_sn) DO UPDATE" in merge_sql
+    conn.commit.assert_called_once()
+    conn.close.assert_called_once()
+
+
+# Test cases for the weather merge
+def _weather_response(sn, device_id, epochs):
+    body = {"deviceSn": sn, "deviceId": device_id, "paramDataList": [
+        {"collectTime": e, "dataList": [{"name": "SN", "value": sn}, {"name": "Environment Temp", "value": "21.5"}]}
+        for e in epochs
+    ]}
+    response = _response(200, body)
+    response.text = json.dumps(body)
+    return response
+
+
+@patch("unhcr.api_solarman.utils.str_to_float_or_zero", side_effect=float)
+@patch("unhcr.api_solarman.get_client")
+def test_api_get_weather_data_merges_devices_by_epoch(mock_get_client, mock_float):
+    mock_get_client.return_value.post.side_effect = [
+        _weather_response("W1", 1, [0, 600, 1200]),
+        _weather_response("W2", 2, [300, 600, 610, 900]),
+    ]
+    devices = pd.DataFrame({"station_id": [10, 20], "device_sn": ["W1", "W2"], "device_id": [1, 2]})
+
+    df = api_solarman.api_get_weather_data("2025-03-10", devices)
+
+    assert list(df["epoch"] - 3600) == [0, 300, 600, 600, 900, 1200]
+    # equal epochs keep the later device first, 610 collapses onto 600 within W2
+    assert list(df["device_sn"]) == ["W1", "W2", "W2", "W1", "W2", "W1"]
+    assert list(df["temp_c"]) == [21.5] * 6
+
+
+def test_db_update_weather_copies_and_merges_once():
+    engine = MagicMock()
+    conn = engine.raw_connection.return_value
+    conn.info = {}
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.rowcount = 1
+    cur.fetchone.return_value = (1, 0)
+    df = pd.DataFrame([
+        {"station_id": 10, "device_sn": "W1", "device_id": "1", "org_epoch": epoch, "epoch": epoch,
+         "ts": datetime(2025, 3, 10), "temp_c": 21.5, "panel_temp": 30.0, "humidity": 40.0,
+         "rainfall": 0.0, "irr": "800", "daily_irr": "2.5"}
+        for epoch in (100, 200)
+    ])
+
+    counts, err = api_solarman.db_update_weather(df, 150, engine)
+    api_solarman.db_update_weather(df, 150, engine)
+
+    assert err is None
+    assert counts == {"staged": 1, "inserted": 1, "updated": 0}
+    # the staging table is created once per connection, the older reading is filtered out
+    ddl = [c for c in cur.execute.call_args_list if "CREATE TEMP TABLE" in c[0][0]]
+    assert len(ddl) == 1
+    buf = cur.copy_expert.call_args[0][1]
+    assert buf.getvalue().startswith("10,W1,1,200,200,2025-03-10")
+    assert "ON CONFLICT (device_sn, ts) DO UPDATE" in cur.execute.call_args_list[-1][0][0]
+
+
+# Test cases for the bulk upserts
+def test_db_bulk_upsert_batches_and_dedupes():
+    from sqlalchemy.dialects import postgresql
+    from unhcr import models
+
+    eng = MagicMock()
+    conn = eng.begin.return_value.__enter__.return_value
+    conn.execute.return_value.rowcount = 2
+    rows = [{"device_sn": sn, "device_id": i, "device_type": "INVERTER", "connect_status": 1, "collection_time": i}
+            for i, sn in enumerate(["A", "B", "A", "C"])]
+
+    cnt, err = models.db_bulk_upsert(eng, models.Device, rows, ["device_sn"], batch=2)
+
+    assert (cnt, err) == (4, None)
+    stmts = [c[0][0] for c in conn.execute.call_args_list]
+    assert len(stmts) == 2
+    sql = str(stmts[0].compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (device_sn) DO UPDATE SET device_id = excluded.device_id" in sql
+    assert "updated = now()" in sql
+    # the later A wins and keeps its first position
+    assert stmts[0].compile().params["device_id_m0"] == 2
+
+
+@patch("unhcr.api_solarman.models.db_bulk_upsert", return_value=(1, None))
+def test_insert_station_data_daily_single_upsert(mock_upsert):
+    res, err = api_solarman.insert_station_data_daily(MagicMock(), [
+        {"site": "61", "year": 2025, "month": 3, "day": d, "generationValue": 10.0} for d in (1, 2)
+    ])
+
+    assert (res, err) == (1, None)
+    _, model, rows, keys = mock_upsert.call_args[0]
+    assert keys == ["station_id", "ts"]
+    assert [r["ts"] for r in rows] == [datetime(2025, 3, 1), datetime(2025, 3, 2)]
+    assert rows[0]["station_id"] == 61 and rows[0]["generation_value"] == 10.0
+
+
+# Test cases for the backfill planner
+def test_inverter_backfill_plan_reads_missing_days(mock_dependencies):
+    mock_logger, mock_db = mock_dependencies
+    mock_db.sql_execute.side_effect = [([(1,)], None), ([("B", date(2025, 3, 10)), ("A", date(2025, 3, 9))], None)]
+
+    work, err = api_solarman.inverter_backfill_plan(["A", "B"], date(2025, 3, 8), date(2025, 3, 10), MagicMock())
+
+    assert err is None
+    assert work == [("B", date(2025, 3, 10)), ("A", date(2025, 3, 9))]
+    plan_sql = mock_db.sql_execute.call_args_list[1][0][0]
+    assert "generate_series('2025-03-10'::date, '2025-03-08'::date" in plan_sql
+    assert "b.complete" in plan_sql
+
+
+@patch("unhcr.api_solarman.fetch_inverter_day")
+@patch("unhcr.api_solarman.insert_inverter_data", return_value=(1, None))
+@patch("unhcr.api_solarman.inverter_backfill_plan")
+def test_backfill_inverters_records_written_days(mock_plan, mock_insert, mock_fetch, mock_dependencies):
+    mock_logger, mock_db = mock_dependencies
+    mock_db.sql_execute.return_value = ([(1,)], None)
+    today = datetime.now(timezone.utc).date()
+    mock_plan.return_value = ([("A", today), ("A", date(2025, 3, 9))], None)
+    mock_fetch.return_value = ([{"collectTime": 0, "dataList": []}], None)
+
+    results, err = api_solarman.backfill_inverters(["A"], date(2025, 3, 9), MagicMock(), to_date=today,
+                                                   min_rows=1, concurrency=2, rate=100)
+
+    assert err is None
+    assert len(results) == 2
+    recorded = " ".join(c[0][0] for c in mock_db.sql_execute.call_args_list)
+    # the finished day is complete, today is fetched again on the next run
+    assert "('A', '2025-03-09', 1, true)" in recorded
+    assert f"('A', '{today}', 1, false)" in recorded
+
+
+def test_db_record_inverter_backfill_keeps_partial_days_open(mock_dependencies):
+    mock_logger, mock_db = mock_dependencies
+    mock_db.sql_execute.return_value = ([(1,)], None)
+
+    api_solarman.db_record_inverter_backfill(
+        MagicMock(), [("A", date(2025, 3, 9), 0), ("A", date(2025, 3, 8), 100), ("A", date(2025, 3, 7), 288)])
+
+    sql = mock_db.sql_execute.call_args[0][0]
+    # empty and partial past days are fetched again, only a full day is complete
+    assert "('A', '2025-03-09', 0, false)" in sql
+    assert "('A', '2025-03-08', 100, false)" in sql
+    assert "('A', '2025-03-07', 288, true)" in sql
+
+
+@patch("unhcr.api_solarman.db_update_weather", return_value=({"staged": 4, "inserted": 4, "updated": 0}, None))
+@patch("unhcr.api_solarman.fetch_weather_day")
+def test_ingest_weather_range_fetches_concurrently_and_writes_once(mock_fetch, mock_update):
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def fetch(device, date_str, client):
+        with lock:
+            in_flight.append(date_str)
+            peak.append(len(in_flight))
+        time.sleep(0.05)
+        with lock:
+            in_flight.remove(date_str)
+        if device.device_sn == "W2" and date_str == "2025-03-09":
+            return None, "get_weather_data ERROR: 500"
+        epoch = int(datetime.fromisoformat(date_str).replace(tzinfo=timezone.utc).timestamp())
+        return [{"device_sn": device.device_sn, "epoch": epoch, "org_epoch": epoch}], None
+
+    mock_fetch.side_effect = fetch
+    devices = pd.DataFrame({"station_id": [10, 20], "device_sn": ["W1", "W2"], "device_id": [1, 2]})
+
+    counts, err = api_solarman.ingest_weather_range(devices, date(2025, 3, 8), date(2025, 3, 10), MagicMock(),
+                                                    concurrency=4, rate=100)
+
+    assert err is None
+    assert max(peak) > 1
+    assert mock_fetch.call_count == 6
+    assert counts["failed"] == 1
+    mock_update.assert_called_once()
+    df, epoch, _ = mock_update.call_args[0]
+    assert len(df) == 5
+    assert list(df["epoch"]) == sorted(df["epoch"])
+    assert epoch == int(datetime(2025, 3, 8, tzinfo=timezone.utc).timestamp())
+
+
+@patch("unhcr.api_solarman.db_update_weather", return_value=({"staged": 4, "inserted": 4, "updated": 0}, None))
+@patch("unhcr.api_solarman.fetch_weather_day", return_value=([], None))
+def test_ingest_weather_range_plans_days_per_device(mock_fetch, mock_update):
+    devices = pd.DataFrame({"station_id": [10, 20], "device_sn": ["W1", "W2"], "device_id": [1, 2]})
+
+    api_solarman.ingest_weather_range(devices, date(2025, 3, 5), date(2025, 3, 10), MagicMock(), concurrency=1,
+                                      rate=100, starts={"W1": date(2025, 3, 9)})
+
+    requested = [(c[0][0].device_sn, c[0][1]) for c in mock_fetch.call_args_list]
+    # W1 is up to date, only W2 without its own start goes back to start_date
+    assert [day for sn, day in requested if sn == "W1"] == ["2025-03-10", "2025-03-09"]
+    assert len([day for sn, day in requested if sn == "W2"]) == 6
+    assert requested[0][1] == "2025-03-10" and requested[-1] == ("W2", "2025-03-05")
+
+
+# Test cases for the topology cache
+class _Row(tuple):
+    fields = ("name", "station_id", "device_sn", "device_id", "device_type")
+
+    @property
+    def _mapping(self):
+        return dict(zip(self.fields, self))
+
+
+def test_topology_reloads_only_on_new_version(mock_dependencies):
+    mock_logger, mock_db = mock_dependencies
+    rows = [_Row(("UNHCR SOLAR- ABUJA", 1, "A1", 11, "INVERTER")), _Row(("UNHCR SOLAR- ABUJA", 1, "W1", 12, "WEATHER_STATION")),
+            _Row(("UNHCR SOLAR- LAGOS", 2, "L1", 21, "INVERTER"))]
+    mock_db.sql_execute.side_effect = [([("v1",)], None), (rows, None), ([("v1",)], None), ([("v2",)], None), (rows[:1], None)]
+    topology = api_solarman.SolarmanTopology(check_every=0)
+
+    topology.refresh(MagicMock())
+    assert topology.site_of("L1") == (2, "UNHCR SOLAR- LAGOS")
+    assert [r["device_sn"] for r in topology.devices_of(1, "INVERTER")] == ["A1"]
+    assert list(topology.devices(dev_type="inverter", site_key="%abuja%")["device_sn"]) == ["A1"]
+
+    topology.refresh(MagicMock())  # same version, no reload
+    assert mock_db.sql_execute.call_count == 3
+    topology.refresh(MagicMock())  # a device moved
+    assert topology.site_of("L1") is None
+    assert mock_db.sql_execute.call_count == 5
+
+
+def test_topology_skips_version_check_within_interval(mock_dependencies):
+    mock_logger, mock_db = mock_dependencies
+    mock_db.sql_execute.side_effect = [([("v1",)], None), ([], None)]
+    topology = api_solarman.SolarmanTopology(check_every=3600)
+
+    topology.refresh(MagicMock())
+    topology.refresh(MagicMock())
+
+    assert mock_db.sql_execute.call_count == 2
+
+
+def test_get_topology_is_cached_per_database(mock_dependencies):
+    mock_logger, mock_db = mock_dependencies
+    mock_db.sql_execute.side_effect = lambda sql, eng: (
+        ([("v1",)], None) if sql == api_solarman.SQL_SM_TOPOLOGY_VERSION else ([], None))
+    local, prod = MagicMock(), MagicMock()
+    local.url, prod.url = "postgresql://local/db", "postgresql://prod/db"
+
+    with patch.dict(api_solarman._topologies, clear=True):
+        local_topology, _ = api_solarman.get_topology(local)
+        prod_topology, _ = api_solarman.get_topology(prod)
+        again, _ = api_solarman.get_topology(local)
+
+    assert local_topology is again
+    assert local_topology is not prod_topology
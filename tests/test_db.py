@@ -24,6 +24,7 @@ from unhcr.db import (
     update_rows,
     prospect_get_start_ts,
     update_prospect,
+    push_prospect,
     backfill_prospect,
     prospect_backfill_key,
     update_fuel_data,
@@ -264,6 +265,35 @@ def test_sql_execute_no_engine():
         sql_execute("SELECT 1", None)
 
 
+@patch('unhcr.db.set_db_engine')
+def test_get_default_engine_created_once(mock_set_engine):
+    """Test the Takum engine is created on first use and then reused"""
+    with patch('unhcr.db.default_engine', None):
+        first = unhcr.db.get_default_engine()
+        second = unhcr.db.get_default_engine()
+    assert first is second
+    mock_set_engine.assert_called_once_with(const.TAKUM_RAW_CONN_STR)
+
+
+def test_import_unhcr_is_lazy():
+    """Test importing the package loads no submodule, config or engine"""
+    import subprocess, sys
+    code = "import sys, unhcr; print(any(m.startswith('unhcr.') for m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=Path(__file__).parent.parent)
+    assert out.stdout.strip() == "False"
+
+
+
+def test_import_modules_reads_no_config():
+    """Test importing the modules parses no command line and reads no .env until a setting is used"""
+    import subprocess, sys
+    code = ("import sys; sys.argv = ['prog', '-k', 'unknown']; "
+            "import unhcr.db, unhcr.gb_eyedro, unhcr.api_solarman; from unhcr import constants as c; "
+            "print('loaded', c.is_loaded()); c.GB_API_TIMEOUT; print('loaded', c.is_loaded())")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=Path(__file__).parent.parent)
+    assert out.returncode == 0, out.stderr
+    assert [line for line in out.stdout.splitlines() if line.startswith("loaded")] == ["loaded False", "loaded True"]
+
 # Tests for db_get_max_date
 def test_get_db_max_date(db_engine):
     """Test retrieving maximum date from database"""
@@ -296,22 +326,29 @@ def test_db_update_leonics(mock_update_rows, sample_df):
     ######mock_update_rows.assert_called_once_with(max_dt, sample_df, db_engine)
 
 
-def test_update_rows_filtering(db_engine, sample_df):
+def _leonics_engine(rowcount=2):
+    """Engine whose pooled psycopg2 connection is a mock"""
+    eng = MagicMock()
+    conn = eng.raw_connection.return_value
+    conn.info = {}
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.rowcount = rowcount
+    return eng, conn, cursor
+
+
+def test_update_rows_filtering(sample_df):
     """Test filtering in update_rows"""
-    max_dt = datetime(2024, 8, 15, 11, 59)  # Just before the samples
-    
-    # Mock the sql_execute to avoid actual execution
-    with patch('unhcr.db.sql_execute') as mock_sql_execute:
-        mock_sql_execute.return_value = (MagicMock(rowcount=2), None)
-        
-        result, error = update_rows(max_dt, sample_df, db_engine)
-        
-        assert error is None
-        assert mock_sql_execute.called
-        # Check that the SQL contains both rows (since both are after max_dt)
-        sql_arg = mock_sql_execute.call_args[0][0]
-        assert "'2024-08-15 12:00'" in sql_arg
-        assert "'2024-08-15 12:01'" in sql_arg
+    max_dt = datetime(2024, 8, 15, 12, 0)  # Only the second sample is newer
+    eng, conn, cursor = _leonics_engine(rowcount=1)
+
+    result, error = update_rows(max_dt, sample_df, eng)
+
+    assert error is None
+    assert result.rowcount == 1
+    # Check that only the newer row is copied, as data and not as SQL
+    copied = cursor.copy_expert.call_args[0][1].getvalue()
+    assert copied == "2024-08-15 12:01,150,67890\n"
+    assert all("2024-08-15" not in c[0][0] for c in cursor.execute.call_args_list)
 
 
 def test_update_rows_no_data(sample_df):
@@ -324,42 +361,37 @@ def test_update_rows_no_data(sample_df):
     assert result.rowcount == 0
 
 
-@patch('unhcr.db.set_db_engine_by_name')
-@patch('unhcr.db.sql_execute')
-def test_update_rows_postgresql(mock_sql_execute, mock_set_engine, sample_df):
-    """Test update_rows with PostgreSQL and lowercase key"""
-    mock_set_engine.return_value = (MagicMock(), "test_table")
-    mock_sql_execute.return_value = (MagicMock(rowcount=2), None)
-    
+def test_update_rows_postgresql(sample_df):
+    """Test update_rows stages with COPY and merges with one ON CONFLICT statement"""
     max_dt = datetime(2024, 8, 14, 0, 0)
-    
-    result, error = update_rows(max_dt, sample_df, db_engine)
-    
+    eng, conn, cursor = _leonics_engine()
+
+    result, error = update_rows(max_dt, sample_df, eng)
+    update_rows(max_dt, sample_df, eng)
+
     assert error is None
-    assert mock_sql_execute.called
-    # Check that PostgreSQL conflict syntax is used
-    sql_arg = mock_sql_execute.call_args[0][0]
-    assert "ON CONFLICT (datetimeserver) DO UPDATE" in sql_arg
-    mock_set_engine.assert_called_once_with("postgresql")
+    assert result.rowcount == 2
+    copy_sql = cursor.copy_expert.call_args[0][0]
+    assert copy_sql.startswith("COPY leonics_raw_stage (datetimeserver, BDI1_Power_P1_kW, external_id)")
+    merge_sql = cursor.execute.call_args_list[-1][0][0]
+    assert "ON CONFLICT (datetimeserver) DO UPDATE" in merge_sql
+    # The staging table is created once per connection
+    assert sum("CREATE TEMP TABLE" in c[0][0] for c in cursor.execute.call_args_list) == 1
+    assert conn.commit.call_count == 2
 
 
-@patch('unhcr.db.set_db_engine_by_name')
-@patch('unhcr.db.sql_execute')
-def test_update_rows_mysql(mock_sql_execute, mock_set_engine, sample_df):
-    """Test update_rows with MySQL (default)"""
-    mock_set_engine.return_value = (MagicMock(), "test_table")
-    mock_sql_execute.return_value = (MagicMock(rowcount=2), None)
-    
+def test_update_rows_error(sample_df):
+    """Test update_rows rolls back and reports a failed merge"""
     max_dt = datetime(2024, 8, 14, 0, 0)
-    
-    result, error = update_rows(max_dt, sample_df, "test_table")
-    
-    assert error is None
-    mock_sql_execute.assert_called_once()
-    # Check that MySQL syntax is used
-    sql_arg = mock_sql_execute.call_args[0][0]
-    assert "ON CONFLICT (datetimeserver) DO UPDATE" in sql_arg
-    print(mock_set_engine)   #.assert
+    eng, conn, cursor = _leonics_engine()
+    cursor.execute.side_effect = Exception("boom")
+
+    result, error = update_rows(max_dt, sample_df, eng)
+
+    assert result is None
+    assert "boom" in error
+    conn.rollback.assert_called_once()
+    conn.close.assert_called_once()
 
 
 # Mocking requests.request to avoid actual API calls during testing
@@ -612,6 +644,94 @@ def test_update_prospect(mock_api_prospect, mock_sql_execute, db_engine):
     assert error is None
 
 
+def _push_sql_execute(retry=(), watermark=None):
+    """sql_execute replacement for push_prospect, records the batch states it is given"""
+    recorded = []
+
+    def execute(sql, eng, data=None):
+        if "SELECT batch_start, batch_end, rows" in sql:
+            return list(retry), None
+        if "SELECT last_ts FROM prospect_watermark" in sql:
+            return ([(watermark,)] if watermark else []), None
+        if "INSERT INTO prospect_push_batches" in sql:
+            recorded.append((data["batch_start"], data["batch_end"], data["rows"], data["status"]))
+        return [(1,)], None
+
+    return execute, recorded
+
+
+def test_push_prospect_resumes_after_watermark(mock_api_prospect):
+    """New rows follow the last sent batch and every batch is recorded pending, then sent"""
+    df = pd.DataFrame({"datetimeserver": ["2024-08-15 12:01", "2024-08-15 12:02"], "external_id": [1, 2]})
+    execute, recorded = _push_sql_execute(watermark="2024-08-15 12:00")
+    mock_api_prospect.api_in_prospect_batch.return_value = (MagicMock(status_code=200), None)
+
+    with patch("unhcr.db.sql_execute", side_effect=execute), \
+            patch("unhcr.db.stream_leonics_batches", return_value=iter([df[:1], df[1:]])) as stream:
+        res, err = push_prospect(MagicMock(), local=True, batch_size=1)
+
+    assert err is None
+    assert res == {"batches": 2, "rows": 2, "retried": 0, "failed": 0}
+    where, params, batch_size = stream.call_args[0][1:]
+    assert where == "datetimeserver > %(lo)s" and params == {"lo": "2024-08-15 12:00"} and batch_size == 1
+    sent = mock_api_prospect.api_in_prospect_batch.call_args_list[0][0]
+    assert '"external_id":"sys_1"' in sent[0] and sent[1] is True
+    assert recorded == [
+        ("2024-08-15 12:01", "2024-08-15 12:01", 1, "pending"),
+        ("2024-08-15 12:01", "2024-08-15 12:01", 1, "sent"),
+        ("2024-08-15 12:02", "2024-08-15 12:02", 1, "pending"),
+        ("2024-08-15 12:02", "2024-08-15 12:02", 1, "sent"),
+    ]
+
+
+def test_push_prospect_retries_failed_batch_alone(mock_api_prospect):
+    """A failed batch is re-read by its range under its own key, a new failure is recorded"""
+    retried = pd.DataFrame({"datetimeserver": ["2024-08-15 11:00", "2024-08-15 11:05"], "external_id": [7, 8]})
+    new = pd.DataFrame({"datetimeserver": ["2024-08-15 12:01"], "external_id": [9]})
+    execute, recorded = _push_sql_execute(retry=[("2024-08-15 11:00", "2024-08-15 11:05", 2)],
+                                          watermark="2024-08-15 12:00")
+    mock_api_prospect.api_in_prospect_batch.side_effect = [(MagicMock(), None), (None, "HTTP 503")]
+
+    with patch("unhcr.db.sql_execute", side_effect=execute), \
+            patch("unhcr.db.stream_leonics_batches", side_effect=[iter([retried]), iter([new])]) as stream:
+        res, err = push_prospect(MagicMock(), local=True, batch_size=1)
+
+    assert err is None
+    assert res == {"batches": 2, "rows": 2, "retried": 1, "failed": 1}
+    # The retried range is read as one batch
+    assert stream.call_args_list[0][0][2:] == ({"lo": "2024-08-15 11:00", "hi": "2024-08-15 11:05"}, 2)
+    assert ("2024-08-15 11:00", "2024-08-15 11:05", 2, "sent") in recorded
+    assert ("2024-08-15 12:01", "2024-08-15 12:01", 1, "failed") in recorded
+
+
+def test_push_prospect_formats_batch_keys_as_watermark(mock_api_prospect):
+    """Batch keys use the 'YYYY-MM-DD HH:MM' form of the watermark whatever the row values carry"""
+    df = pd.DataFrame({"datetimeserver": [pd.Timestamp("2024-08-15 12:01:00"), "2024-08-15 12:02:30"],
+                       "external_id": [1, 2]})
+    execute, recorded = _push_sql_execute(watermark="2024-08-15 12:00:00")
+    mock_api_prospect.api_in_prospect_batch.return_value = (MagicMock(status_code=200), None)
+
+    with patch("unhcr.db.sql_execute", side_effect=execute), \
+            patch("unhcr.db.stream_leonics_batches", return_value=iter([df])) as stream:
+        res, err = push_prospect(MagicMock(), local=True, batch_size=2)
+
+    assert err is None
+    assert stream.call_args[0][2] == {"lo": "2024-08-15 12:00"}
+    assert recorded[-1] == ("2024-08-15 12:01", "2024-08-15 12:02", 2, "sent")
+
+
+def test_record_prospect_batch_advances_watermark():
+    """A batch state and the watermark are written by one statement"""
+    with patch("unhcr.db.sql_execute", return_value=([(1,)], None)) as execute:
+        unhcr.db.db_record_prospect_batch(MagicMock(), "local", "2024-08-15 12:01", "2024-08-15 12:05", 5, "sent")
+
+    assert execute.call_count == 1
+    sql, _, data = execute.call_args[0]
+    assert "INSERT INTO prospect_push_batches" in sql and "INSERT INTO prospect_watermark" in sql
+    assert "GREATEST(prospect_watermark.last_ts, EXCLUDED.last_ts)" in sql
+    assert data["status"] == "sent" and data["attempt"] == 1
+
+
 # -----
 # Test cases for backfill_prospect
 # -----
@@ -661,3 +781,18 @@ def test_prospect_get_start_ts(
         assert result.strftime("%Y-%m-%dT%H:%M:%SZ") == expected_timestamp
     else:
         assert result == expected_timestamp
+
+
+def test_sql_execute_renders_sql_only_for_debug(db_engine):
+    """Test sql_execute keeps bound parameters and does not print or render the SQL by default"""
+    with patch("builtins.print") as mock_print, patch("unhcr.db.sql_echo") as mock_echo, \
+            patch.object(unhcr.db.logger, "isEnabledFor", return_value=False):
+        result, error = sql_execute("SELECT :x + 1", db_engine, {"x": 1})
+    assert error is None
+    assert result[0][0] == 2
+    mock_print.assert_not_called()
+    mock_echo.assert_not_called()
+
+    with patch.object(unhcr.db.logger, "isEnabledFor", return_value=True), patch.object(unhcr.db.logger, "debug") as mock_debug:
+        sql_execute("SELECT :x + 1", db_engine, {"x": 1})
+    assert mock_debug.call_args[0][0] == "SELECT 1 + 1"
@@ -3,6 +3,7 @@ import pandas as pd
 from unittest.mock import patch, MagicMock
 from unhcr import gb_eyedro
 from unhcr import constants as const
+from unhcr import db
 from sqlalchemy import text, create_engine
 import sqlite3
 import requests
@@ -15,6 +16,7 @@ def mock_dependencies():
             patch("unhcr.gb_eyedro.logger") as mock_logger, \
             patch("unhcr.gb_eyedro.err_handler") as mock_err_handler, \
             patch("unhcr.gb_eyedro.db") as mock_db:
+        mock_db.copy_merge.side_effect = db.copy_merge
         yield mock_requests, mock_logger, mock_err_handler, mock_db
 
 
@@ -101,7 +103,8 @@ def test_db_hyper_gb_gaps_success(mock_dependencies):
         conn.execute(text("INSERT INTO eyedro.gb_test_123 (epoch_secs, ts) VALUES (1, '2023-01-01 00:00:00'), (2, '2023-01-01 00:01:00'), (4, '2023-01-01 00:03:00')"))
         
 
-    result = gb_eyedro.db_hyper_gb_gaps("gb_test_123", mock_engine)
+    result, err = gb_eyedro.db_hyper_gb_gaps("gb_test_123", mock_engine)
+    assert err is None
     assert len(result) == 2
     assert result[0][0] == 'gb_test_123'
     assert result[0][1] == 2
@@ -481,9 +484,10 @@ def test_db_hyper_gb_gaps_db_error(mock_dependencies):
     mock_engine = MagicMock()
     mock_engine.raw_connection.side_effect = psycopg2.OperationalError("DB Error")
 
-    result = gb_eyedro.db_hyper_gb_gaps("gb_test_123", mock_engine)
+    result, err = gb_eyedro.db_hyper_gb_gaps("gb_test_123", mock_engine)
 
-    assert result == []
+    assert result is None
+    assert isinstance(err, psycopg2.OperationalError)
     mock_engine.raw_connection.assert_called_once()
 
 def test_db_hyper_gb_gaps_general_error(mock_dependencies):
@@ -495,9 +499,10 @@ def test_db_hyper_gb_gaps_general_error(mock_dependencies):
     mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
     mock_cursor.execute.side_effect = Exception("General Error")
 
-    result = gb_eyedro.db_hyper_gb_gaps("gb_test_123", mock_engine)
+    result, err = gb_eyedro.db_hyper_gb_gaps("gb_test_123", mock_engine)
 
-    assert result == []
+    assert result is None
+    assert str(err) == "General Error"
     mock_engine.raw_connection.assert_called_once()
     mock_conn.cursor.assert_called_once()
     mock_cursor.execute.assert_called_once()
@@ -521,3 +526,496 @@ def test_db_get_all_gb_gaps_success(mock_get_hypertables, mock_hyper_gaps_concur
     mock_df.assert_called_once()
     mock_df.return_value.to_csv.assert_called_once()
     mock_df.return_value.head.assert_called_once()
+
+
+# Test cases for the async fetch engine
+def _gb_day(epoch):
+    return {
+        "Errors": [],
+        "LastCommSecUtc": epoch + 3600,
+        "DeviceData": {
+            "A": [[[epoch, 1.0]], [[epoch, 2.0]], [[epoch, 3.0]]],
+            "Wh": [[[epoch, 10.0]], [[epoch, 20.0]], [[epoch, 30.0]]],
+        },
+    }
+
+
+@patch("unhcr.gb_eyedro.update_gb_db")
+@patch("unhcr.gb_eyedro.meter_response_empty_async")
+def test_upsert_gb_fleet_walks_each_serial(mock_fetch, mock_update, mock_dependencies):
+    epoch = 1740787200
+    end_of_data = {"Errors": [[], ["Invalid DateStartSecUtc"]]}
+
+    async def fetch(session, serial, epoch_req=None, sem=None):
+        if epoch_req is None:
+            return _gb_day(epoch)
+        return _gb_day(epoch_req) if epoch_req >= epoch - 86400 else end_of_data
+
+    mock_fetch.side_effect = fetch
+    mock_update.return_value = ([1, 0], None)
+
+    results = gb_eyedro.upsert_gb_fleet(["00980001", "00980002"], MagicMock(), concurrency=2,
+                                        epoch_cutoff=epoch - 5 * 86400, MAX_EMPTY=3)
+
+    assert [r[0] for r in results] == ["00980001", "00980002"]
+    # last comm day + one day back per serial
+    assert all(r[3] == 2 for r in results)
+    assert mock_update.call_count == 4
+
+
+@patch("unhcr.gb_eyedro.update_gb_db")
+@patch("unhcr.gb_eyedro.meter_response_empty_async")
+def test_upsert_gb_fleet_isolates_failing_serial(mock_fetch, mock_update, mock_dependencies):
+    epoch = 1740787200
+
+    async def fetch(session, serial, epoch_req=None, sem=None):
+        if serial == "00980001":
+            raise ValueError("unexpected payload")
+        return _gb_day(epoch) if epoch_req in (None, epoch) else {"Errors": [[], ["Invalid DateStartSecUtc"]]}
+
+    mock_fetch.side_effect = fetch
+    mock_update.return_value = ([1, 0], None)
+
+    results = gb_eyedro.upsert_gb_fleet(["00980001", "00980002"], MagicMock(), concurrency=2,
+                                        epoch_cutoff=epoch - 5 * 86400, MAX_EMPTY=3)
+
+    assert results[0][0] is None and "unexpected payload" in results[0][1]
+    assert results[1][0] == "00980002" and results[1][3] >= 1
+
+
+def test_meter_response_empty_async_bounded_concurrency(mock_dependencies):
+    import asyncio
+
+    in_flight = 0
+    max_in_flight = 0
+
+    class FakeResponse:
+        async def __aenter__(self):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            return self
+
+        async def __aexit__(self, *args):
+            nonlocal in_flight
+            in_flight -= 1
+
+        def raise_for_status(self):
+            pass
+
+        async def text(self):
+            return '{"Errors": []}'
+
+    session = MagicMock()
+    session.get.side_effect = lambda url: FakeResponse()
+
+    async def run():
+        sem = asyncio.Semaphore(3)
+        return await asyncio.gather(*[
+            gb_eyedro.meter_response_empty_async(session, "00980001", 1740787200 - i * 86400, sem)
+            for i in range(10)
+        ])
+
+    results = asyncio.run(run())
+
+    assert results == [{"Errors": []}] * 10
+    assert max_in_flight == 3
+
+
+# Test cases for map_gb
+def test_map_gb_aligns_phases_on_epoch(mock_dependencies):
+    epoch = 1740787200
+    device_data = {
+        "A": [[[epoch + 60, 1.5], [epoch, 1.0]], [[epoch, 2.0], [epoch + 60, 2.5]], [[epoch, 3.0], [epoch + 60, 3.5]]],
+        "Wh": [[[epoch, 10.0]], [[epoch, 20.0]], [[epoch + 120, 30.0]]],
+    }
+
+    df = gb_eyedro.map_gb(device_data)
+
+    # epoch + 120 has Wh but no amps, so it is dropped
+    assert df["epoch_secs"].tolist() == [epoch, epoch + 60]
+    assert df["epoch_secs"].dtype == "int64"
+    assert df["ts"].iloc[0] == pd.Timestamp("2025-03-01 00:00:00")
+    assert df["a_p1"].tolist() == [1.0, 1.5]
+    assert df["wh_p1"].iloc[0] == 10.0
+    assert pd.isna(df["wh_p1"].iloc[1])
+    assert (df["api_flag"] == -666).all()
+    assert list(df.columns[:2]) == ["ts", "epoch_secs"]
+
+
+def test_map_gb_empty_and_missing_amps(mock_dependencies):
+    assert gb_eyedro.map_gb({"A": [[], [], []], "Wh": [[], [], []]}).empty
+    assert gb_eyedro.map_gb({"Wh": [[[1740787200, 1.0]], [], []]}).empty
+
+
+# Test cases for update_gb_db
+def test_update_gb_db_copy_and_merge(mock_dependencies):
+    mock_engine = MagicMock()
+    mock_conn = MagicMock()
+    mock_conn.info = {}
+    mock_cursor = MagicMock()
+    mock_engine.raw_connection.return_value = mock_conn
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchone.return_value = (2, 1)
+    epoch = 1740787200
+    df = gb_eyedro.map_gb({"A": [[[epoch, 1.0], [epoch + 60, 2.0]]] * 3, "Wh": [[[epoch, 0.1]], [], []]})
+
+    res, err = gb_eyedro.update_gb_db("00980001", df, mock_engine)
+
+    assert err is None
+    assert res == [2, 1]
+    copy_sql, buf = mock_cursor.copy_expert.call_args[0]
+    assert copy_sql.startswith(f"COPY {gb_eyedro.GB_STAGE_TABLE} (ts, epoch_secs, a_p1")
+    assert buf.getvalue().splitlines()[1] == f"2025-03-01 00:01:00,{epoch + 60},2.0,2.0,2.0,,-666"
+    merge_sql = mock_cursor.execute.call_args_list[-1][0][0]
+    assert "INSERT INTO eyedro.gb_00980001" in merge_sql
+    assert "ON CONFLICT (ts, epoch_secs)" in merge_sql
+    mock_conn.commit.assert_called_once()
+    assert mock_conn.info[gb_eyedro.GB_STAGE_TABLE] is True
+
+
+def test_update_gb_db_rollback_on_error(mock_dependencies):
+    mock_engine = MagicMock()
+    mock_conn = MagicMock()
+    mock_conn.info = {}
+    mock_cursor = MagicMock()
+    mock_engine.raw_connection.return_value = mock_conn
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.copy_expert.side_effect = psycopg2.DatabaseError("copy failed")
+    df = gb_eyedro.map_gb({"A": [[[1740787200, 1.0]]] * 3, "Wh": [[[1740787200, 0.1]], [], []]})
+
+    res, err = gb_eyedro.update_gb_db("00980001", df, mock_engine)
+
+    assert res is None
+    assert isinstance(err, psycopg2.DatabaseError)
+    mock_conn.rollback.assert_called_once()
+    mock_conn.close.assert_called_once()
+    assert gb_eyedro.GB_STAGE_TABLE not in mock_conn.info
+
+
+# Test cases for the last comm map
+def test_gb_last_comm_map(mock_dependencies):
+    df = pd.DataFrame(
+        [["009-80001", "Site A", 1740787260, "ok"], ["B12-00002", "Site B", None, "ok"]],
+        columns=const.GB_SN_COLS,
+    )
+
+    assert gb_eyedro.gb_last_comm_map(df) == {"00980001": 1740787260}
+
+
+@patch("unhcr.gb_eyedro.update_gb_db")
+@patch("unhcr.gb_eyedro.meter_response_empty_async")
+def test_upsert_gb_fleet_uses_last_comm_map(mock_fetch, mock_update, mock_dependencies):
+    mock_requests, mock_logger, mock_err_handler, mock_db = mock_dependencies
+    epoch = 1740787200
+    requested = []
+
+    async def fetch(session, serial, epoch_req=None, sem=None):
+        requested.append((serial, epoch_req))
+        return _gb_day(epoch_req)
+
+    mock_fetch.side_effect = fetch
+    mock_update.return_value = ([1, 0], None)
+    # 00980001 is current in the db, 00980002 stopped one day before its last comm
+    mock_db.get_gb_epoch.side_effect = lambda s_num, engine: (
+        (epoch + 7200, None) if s_num == "00980001" else (epoch - 86400 + 600, None)
+    )
+
+    results = gb_eyedro.upsert_gb_fleet(["00980001", "00980002"], MagicMock(), epoch_cutoff=epoch - 5 * 86400,
+                                        MAX_EMPTY=3, last_comm_map={"00980001": epoch + 3600, "00980002": epoch + 3600})
+
+    # no last comm requests, 00980001 skipped, 00980002 bounded at its watermark day
+    assert requested == [("00980002", epoch), ("00980002", epoch - 86400)]
+    assert results[0] == ("00980001", 0, 0, 0, 0, 0)
+    assert results[1][3] == 1
+
+
+# Test cases for the coverage index
+def test_db_get_gb_coverage(mock_dependencies):
+    mock_requests, mock_logger, mock_err_handler, mock_db = mock_dependencies
+    mock_db.sql_execute.return_value = ([("00980001", 1740787200, 2), ("00980001", 1740700800, 0)], None)
+
+    coverage, err = gb_eyedro.db_get_gb_coverage(MagicMock(), ["00980001"])
+
+    assert err is None
+    assert coverage == {"00980001": {1740787200: 2, 1740700800: 0}}
+    assert "WHERE serial IN ('00980001')" in mock_db.sql_execute.call_args[0][0]
+
+
+@patch("unhcr.gb_eyedro.db_update_gb_coverage")
+@patch("unhcr.gb_eyedro.update_gb_db")
+@patch("unhcr.gb_eyedro.meter_response_empty_async")
+def test_upsert_gb_fleet_plans_from_coverage(mock_fetch, mock_update, mock_cov, mock_dependencies):
+    mock_requests, mock_logger, mock_err_handler, mock_db = mock_dependencies
+    epoch = 1740787200
+    requested = []
+
+    async def fetch(session, serial, epoch_req=None, sem=None):
+        requested.append(epoch_req)
+        if epoch_req == epoch - 3 * 86400:
+            return {"Errors": [], "DeviceData": {"A": [[], [], []], "Wh": [[], [], []]}}
+        return _gb_day(epoch_req)
+
+    mock_fetch.side_effect = fetch
+    mock_update.return_value = ([1, 0], None)
+    mock_cov.return_value = (1, None)
+    mock_db.get_gb_epoch.return_value = (None, None)
+    coverage = {"00980001": {epoch - 86400: gb_eyedro.GB_DAY_FULL, epoch - 2 * 86400: gb_eyedro.GB_DAY_EMPTY}}
+
+    gb_eyedro.upsert_gb_fleet(["00980001"], MagicMock(), epoch_cutoff=epoch - 3 * 86400, MAX_EMPTY=5,
+                              last_comm_map={"00980001": epoch + 3600}, coverage=coverage)
+
+    assert requested == [epoch, epoch - 3 * 86400]
+    rows = mock_cov.call_args[0][0]
+    assert rows == [("00980001", epoch, gb_eyedro.GB_DAY_PARTIAL, 1),
+                    ("00980001", epoch - 3 * 86400, gb_eyedro.GB_DAY_EMPTY, 0)]
+
+
+# Test cases for the gap-targeted backfill
+def test_db_get_gb_gap_days(mock_dependencies):
+    mock_requests, mock_logger, mock_err_handler, mock_db = mock_dependencies
+    mock_db.sql_execute.side_effect = [
+        ([(3,)], None),
+        ([("00980001", 1740787200), ("00980001", 1740700800), ("00980002", 1740787200)], None),
+    ]
+
+    gap_days, err = gb_eyedro.db_get_gb_gap_days(MagicMock(), serials=["00980001"])
+
+    assert err is None
+    assert gap_days == {"00980001": [1740787200, 1740700800]}
+    assert mock_db.sql_execute.call_args_list[0][0][0] == const.SQL_GB_GAPS_RESOLUTION
+
+
+@patch("unhcr.gb_eyedro.execute_values")
+def test_gb_serial_key_joins_gap_days_and_coverage(mock_execute_values, mock_dependencies):
+    mock_requests, mock_logger, mock_err_handler, mock_db = mock_dependencies
+    mock_db.sql_execute.side_effect = [([(1,)], None), ([("00980A14", 1740787200)], None)]
+
+    gap_days, err = gb_eyedro.db_get_gb_gap_days(MagicMock(), serials=["gb_00980a14"])
+    gb_eyedro.db_update_gb_coverage([("00980a14", 1740787200, gb_eyedro.GB_DAY_FULL, 1440)], MagicMock())
+
+    assert gap_days == {"00980A14": [1740787200]}
+    assert mock_execute_values.call_args[0][2] == [("00980A14", 1740787200, gb_eyedro.GB_DAY_FULL, 1440)]
+
+
+def test_db_resolve_gb_gaps_skips_deleted_and_counts_short_gaps(mock_dependencies):
+    mock_engine = MagicMock()
+    cursor = mock_engine.raw_connection.return_value.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [(True,), (False,)]
+
+    res, err = gb_eyedro.db_resolve_gb_gaps("00980001", [1740787200], mock_engine)
+
+    assert err is None
+    assert res == (1, 1)
+    sql = cursor.execute.call_args[0][0]
+    assert "g.deleted IS NOT TRUE" in sql
+    # a 90 s gap misses one minute, integer division would expect none
+    assert "ceil((g.epoch_secs - g.prev_epoch) / 60.0)::int - 1 AS expected" in sql
+
+
+@patch("unhcr.gb_eyedro.db_resolve_gb_gaps")
+@patch("unhcr.gb_eyedro.db_update_gb_coverage")
+@patch("unhcr.gb_eyedro.update_gb_db")
+@patch("unhcr.gb_eyedro.meter_response_empty_async")
+@patch("unhcr.gb_eyedro.db_get_gb_gap_days")
+def test_gb_backfill_gaps_requests_only_gap_days(mock_gap_days, mock_fetch, mock_update, mock_cov, mock_resolve,
+                                                 mock_dependencies):
+    day = 1740787200
+    requested = []
+
+    async def fetch(session, serial, epoch_req=None, sem=None):
+        requested.append((serial, epoch_req))
+        if epoch_req == day:
+            return _gb_day(epoch_req)
+        return None  # failed request, the day stays open
+
+    mock_gap_days.return_value = ({"00980001": [day, day - 5 * 86400]}, None)
+    mock_fetch.side_effect = fetch
+    mock_update.return_value = ([1, 0], None)
+    mock_cov.return_value = (1, None)
+    mock_resolve.return_value = ((1, 0), None)
+
+    results = gb_eyedro.gb_backfill_gaps(MagicMock())
+
+    assert sorted(requested) == [("00980001", day - 5 * 86400), ("00980001", day)]
+    assert results == [("00980001", 2, 1, 1, 0, 1, 0)]
+    assert mock_resolve.call_args[0][:2] == ("00980001", [day])
+    assert mock_cov.call_args[0][0] == [("00980001", day, gb_eyedro.GB_DAY_PARTIAL, 1)]
+
+
+# Test cases for incremental gap detection
+def test_db_hyper_gb_gaps_since_epoch_bounds_scan(mock_dependencies):
+    mock_engine = MagicMock()
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_engine.raw_connection.return_value = mock_conn
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchall.return_value = [("gb_test_123", 1740787500, 1740787200, 300)]
+
+    result, err = gb_eyedro.db_hyper_gb_gaps("gb_test_123", mock_engine, since_epoch=1740787200)
+
+    assert err is None
+    assert result == [("gb_test_123", 1740787500, 1740787200, 300)]
+    query = mock_cursor.execute.call_args[0][0]
+    assert "epoch_secs >= 1740787200" in query
+    assert "ts >= to_timestamp(1740787200)" in query
+
+
+@patch("unhcr.gb_eyedro.db_merge_gb_gaps")
+@patch("unhcr.gb_eyedro.db_hyper_gb_gaps")
+def test_db_gb_gaps_incremental_moves_watermark(mock_gaps, mock_merge, mock_dependencies):
+    mock_requests, mock_logger, mock_err_handler, mock_db = mock_dependencies
+    mock_db.sql_execute.return_value = ([(1740790800,)], None)
+    mock_gaps.return_value = ([("gb_test_123", 1740787500, 1740787200, 300), ("gb_test_123", 1740791000, 1740790800, 200)], None)
+    mock_merge.return_value = (1, None)
+    engine = MagicMock()
+
+    result = gb_eyedro.db_gb_gaps_incremental("gb_test_123", 1740787200, engine)
+
+    assert result == ("gb_test_123", 1, 1740790800)
+    mock_gaps.assert_called_once_with("gb_test_123", engine, since_epoch=1740787200)
+    # the gap past the scanned max is left for the next pass
+    mock_merge.assert_called_once_with("gb_test_123", [("gb_test_123", 1740787500, 1740787200, 300)], 1740790800, engine)
+
+
+@patch("unhcr.gb_eyedro.db_merge_gb_gaps")
+@patch("unhcr.gb_eyedro.db_hyper_gb_gaps")
+def test_db_gb_gaps_incremental_failed_scan_keeps_watermark(mock_gaps, mock_merge, mock_dependencies):
+    mock_requests, mock_logger, mock_err_handler, mock_db = mock_dependencies
+    mock_db.sql_execute.return_value = ([(1740790800,)], None)
+    mock_gaps.return_value = (None, psycopg2.OperationalError("DB Error"))
+
+    result = gb_eyedro.db_gb_gaps_incremental("gb_test_123", 1740787200, MagicMock())
+
+    assert result == ("gb_test_123", 0, 1740787200)
+    mock_merge.assert_not_called()
+
+
+def test_db_merge_gb_gaps_skips_deleted_duplicates(mock_dependencies):
+    mock_engine = MagicMock()
+    mock_cursor = mock_engine.raw_connection.return_value.cursor.return_value.__enter__.return_value
+
+    with patch("unhcr.gb_eyedro.execute_values", return_value=[(1,)]) as mock_values:
+        res, err = gb_eyedro.db_merge_gb_gaps("gb_test_123", [("gb_test_123", 1740787500, 1740787200, 300)],
+                                              1740787500, mock_engine)
+
+    assert (res, err) == (1, None)
+    sql = mock_values.call_args[0][1]
+    assert "g.hypertable_name = v.hypertable_name AND g.epoch_secs = v.epoch_secs AND g.prev_epoch = v.prev_epoch" in sql
+    assert mock_cursor.execute.call_args[0][1] == ("gb_test_123", 1740787500)
+
+
+@patch("unhcr.gb_eyedro.db_hyper_gb_gaps")
+def test_db_gb_gaps_incremental_nothing_new(mock_gaps, mock_dependencies):
+    mock_requests, mock_logger, mock_err_handler, mock_db = mock_dependencies
+    mock_db.sql_execute.return_value = ([(1740787200,)], None)
+
+    result = gb_eyedro.db_gb_gaps_incremental("gb_test_123", 1740787200, MagicMock())
+
+    assert result == ("gb_test_123", 0, 1740787200)
+    mock_gaps.assert_not_called()
+
+
+# Test cases for the consolidated eyedro.gb_1min layout
+def test_update_gb_db_long_table(mock_dependencies):
+    mock_engine = MagicMock()
+    mock_conn = MagicMock()
+    mock_conn.info = {}
+    mock_cursor = MagicMock()
+    mock_engine.raw_connection.return_value = mock_conn
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchone.return_value = (1, 0)
+    df = gb_eyedro.map_gb({"A": [[[1740787200, 1.0]]] * 3, "Wh": [[[1740787200, 0.1]], [], []]})
+
+    with patch.object(const, "GB_LONG_TABLE", True):
+        res, err = gb_eyedro.update_gb_db("00980AA1", df, mock_engine)
+
+    assert err is None
+    merge_sql = mock_cursor.execute.call_args_list[-1][0][0]
+    assert f"INSERT INTO {const.GB_1MIN_TABLE} (serial, ts, epoch_secs" in merge_sql
+    assert "SELECT '00980aa1', ts, epoch_secs" in merge_sql
+    assert "ON CONFLICT (serial, ts)" in merge_sql
+
+
+def test_gb_hourly_agg_cols_match_legacy_aggregate():
+    cols = gb_eyedro.gb_hourly_agg_cols()
+
+    assert len(cols) == 39
+    assert cols[:3] == ["avg_amps_p1", "min_amps_p1", "max_amps_p1"]
+    assert "weighted_pf_p2" in cols and "ttl_wh_p3" in cols
+    assert "GROUP BY serial, ts_hr" in gb_eyedro.SQL_GB_1MIN_TABLE
+    assert "partitioning_column => 'serial'" in gb_eyedro.SQL_GB_1MIN_TABLE
+
+
+def test_db_get_gb_hypertables_long_table_lists_views(mock_dependencies):
+    mock_requests, mock_logger, mock_err_handler, mock_db = mock_dependencies
+    mock_db.sql_execute.return_value = ([("gb_00980aa1",)], None)
+
+    with patch.object(const, "GB_LONG_TABLE", True):
+        result, err = gb_eyedro.db_get_gb_hypertables(MagicMock())
+
+    assert result == [("gb_00980aa1",)]
+    assert "information_schema.views" in mock_db.sql_execute.call_args[0][0]
+
+
+@patch("unhcr.gb_eyedro.db_create_gb_1min_table")
+def test_db_migrate_gb_to_1min_skips_migrated_serials(mock_create, mock_dependencies):
+    mock_create.return_value = (1, None)
+    mock_engine = MagicMock()
+    mock_conn = mock_engine.begin.return_value.__enter__.return_value
+    mock_conn.execute.return_value.scalar.return_value = 'v'
+
+    copied, err = gb_eyedro.db_migrate_gb_to_1min(["gb_00980AA1"], mock_engine)
+
+    assert err is None
+    assert copied == {}
+    mock_conn.execute.assert_called_once()
+
+
+# Test cases for compression and retention
+def test_db_decompress_gb_range_age_checked_in_sql(mock_dependencies):
+    mock_cursor = MagicMock()
+
+    with patch.object(const, "GB_COMPRESS_AFTER", None):
+        gb_eyedro.db_decompress_gb_range(mock_cursor, "gb_00980AA1", pd.Timestamp("2025-03-01"), pd.Timestamp("2025-03-02"))
+        mock_cursor.execute.assert_not_called()
+
+    # any Postgres interval, pd.Timedelta would reject '3 months'
+    with patch.object(const, "GB_COMPRESS_AFTER", "3 months"):
+        gb_eyedro.db_decompress_gb_range(mock_cursor, "gb_00980AA1", pd.Timestamp("2025-03-01"), pd.Timestamp("2025-03-02"))
+
+    sql, params = mock_cursor.execute.call_args[0]
+    assert sql == gb_eyedro.SQL_GB_DECOMPRESS_RANGE
+    assert "localtimestamp - %(compress_after)s::interval" in sql
+    assert params["table"] == "gb_00980aa1"
+    assert params["compress_after"] == "3 months"
+
+
+def test_db_set_gb_storage_policies_applies_missing(mock_dependencies):
+    mock_requests, mock_logger, mock_err_handler, mock_db = mock_dependencies
+    mock_db.sql_execute.return_value = ([("gb_1min", False, False), ("gb_00980aa1", True, False)], None)
+    mock_engine = MagicMock()
+    mock_conn = mock_engine.begin.return_value.__enter__.return_value
+
+    applied, err = gb_eyedro.db_set_gb_storage_policies(mock_engine, compress_after="30 days")
+
+    assert err is None
+    assert applied == {"gb_1min": ["compression"]}
+    sql = str(mock_conn.execute.call_args[0][0])
+    assert "compress_segmentby = 'serial'" in sql
+    assert "INTERVAL '30 days'" in sql
+
+
+def test_db_set_gb_storage_policies_rejects_short_retention(mock_dependencies):
+    mock_requests, mock_logger, mock_err_handler, mock_db = mock_dependencies
+    mock_db.sql_execute.return_value = ([(False,)], None)
+
+    applied, err = gb_eyedro.db_set_gb_storage_policies(MagicMock(), compress_after="3 months", retention="2 months")
+
+    assert applied is None
+    assert isinstance(err, ValueError)
+    sql, _, params = mock_db.sql_execute.call_args[0]
+    assert sql == gb_eyedro.SQL_GB_RETENTION_CHECK
+    assert params == {"retention": "2 months", "refresh": gb_eyedro.GB_CAGG_START_OFFSET, "compress_after": "3 months"}
+    assert mock_db.sql_execute.call_count == 1
@@ -1,23 +1,28 @@
-# TODO make sure to update imports as code changes
-from unhcr import utils
-from unhcr import constants
-from unhcr import api_leonics
-from unhcr import api_prospect
-from unhcr import db
-from unhcr import s3
-from unhcr import galooli_sm_fuel
-from unhcr import api_solarman
-from unhcr import err_handler
-from unhcr import app_utils
-from unhcr import gb_eyedro
-from unhcr import models
+import importlib
 
-##############################
-# Hey there - I've reviewed your changes - here's some feedback:
+# submodules are imported on first access (unhcr.gb_eyedro, from unhcr import db, ...), so `import unhcr`
+# itself parses no command line, loads no .env, opens no log file and creates no engine
+__all__ = [
+    "utils",
+    "constants",
+    "api_leonics",
+    "api_prospect",
+    "db",
+    "s3",
+    "galooli_sm_fuel",
+    "api_solarman",
+    "err_handler",
+    "app_utils",
+    "gb_eyedro",
+    "models",
+]
 
-# Here's what I looked at during the review
-# 🟢 General issues: all looks good
-# 🟢 Security: all looks good
-# 🟢 Testing: all looks good
-# 🟢 Complexity: all looks good
-# 🟢 Documentation: all looks good
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
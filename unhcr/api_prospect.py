@@ -15,25 +15,192 @@ Key Components
         and sends a POST request to the appropriate URL with the necessary headers, including the API key. 
         It includes basic error handling. The local flag determines whether to send data to the local or external API.
 
+    api_in_prospect_batch(records, local=None):
+        Sends one batch of records, already serialized as a JSON array, to the inbound endpoint as a gzip compressed
+        body over a pooled session. Returns (response, None) or (None, error) so callers can retry the batch alone.
+
+    map_columns(df):
+        Renames the DataFrame columns to the Prospect (AZURE) field names, ignoring case and underscores. The mapping
+        is computed once per (source, target) column set pair by get_column_map and cached in process.
+
     get_prospect_last_data(response, key="datetimeserver"): 
         Parses the Prospect API response and extracts the latest timestamp from the returned data. This timestamp is
         used to retrieve newer records in subsequent calls.
 """
 
+import functools
+import gzip
 import json
 import logging
-import re
+import threading
 import requests
 
 from unhcr import app_utils
 from unhcr import constants as const
 
 mods = [["app_utils", "app_utils"], ["constants", "const"]]
-res = app_utils.app_init(mods=mods, log_file="unhcr.api_prospect.log", version="0.4.8", level="INFO", override=False)
+res = app_utils.app_init(mods=mods, log_file="unhcr.api_prospect.log", version="0.4.8", level="INFO", override=False, lazy=True)
 logger = res[0]
-if const.LOCAL:  # testing with local python files
+if len(res) > 1:  # testing with local python files
     logger, app_utils, const = res
 
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Returns the module wide requests.Session, created on first use so batches reuse its connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        return _session
+
+
+# Prospect (AZURE) custom field names, the payload keys are matched to them ignoring case and underscores
+PROSPECT_COLUMNS = (
+    "In4",
+    "In5",
+    "In6",
+    "In7",
+    "In8",
+    "Out4",
+    "Out5",
+    "Out6",
+    "Out7",
+    "Out8",
+    "HVB1_SOC",
+    "BDI1_Freq",
+    "BDI2_Freq",
+    "DCgen_RPM",
+    "HVB1_Avg_V",
+    "HVB1_Batt_I",
+    "In3_door_sw",
+    "In1_BDI_Fail",
+    "DCgen_Max_RPM",
+    "DCgen_Min_RPM",
+    "Out1_CloseMC1",
+    "Out2_StartGen",
+    "DatetimeServer",
+    "In2_ATS_status",
+    "DCgen_Today_kWh",
+    "DCgen_Total_kWh",
+    "SCC1_PV_Current",
+    "SCC1_PV_Voltage",
+    "BDI1_Power_P1_kW",
+    "BDI1_Power_P2_kW",
+    "BDI1_Power_P3_kW",
+    "BDI2_Power_P1_kW",
+    "BDI2_Power_P2_kW",
+    "BDI2_Power_P3_kW",
+    "DCgen_Diode_Temp",
+    "DCgen_Fuel_Level",
+    "SCC1_Chg_Current",
+    "SCC1_Chg_Voltage",
+    "SCC1_PV_Power_kW",
+    "ana2_Inv_room_RH",
+    "ana5_Fuel_Level1",
+    "ana6_Fuel_Level2",
+    "BDI1_Batt_Voltage",
+    "DCgen_Max_Current",
+    "DCgen_Max_Voltage",
+    "LoadPM_Import_kWh",
+    "LoadPM_Total_P_kW",
+    "SCC1_Chg_Power_kW",
+    "SCC1_Today_PV_kWh",
+    "ana4_Batt_room_RH",
+    "BDI1_ACinput_P1_kW",
+    "BDI1_ACinput_P2_kW",
+    "BDI1_ACinput_P3_kW",
+    "BDI2_ACinput_P1_kW",
+    "BDI2_ACinput_P2_kW",
+    "BDI2_ACinput_P3_kW",
+    "DCgen_Ambient_Temp",
+    "DCgen_Coolant_Temp",
+    "DCgen_Oil_Pressure",
+    "LoadPM_Power_P1_kW",
+    "LoadPM_Power_P2_kW",
+    "LoadPM_Power_P3_kW",
+    "Out3_EmergencyStop",
+    "SCC1_Todate_PV_kWh",
+    "SCC1_Today_Chg_kWh",
+    "ana1_Inv_Room_Temp",
+    "BDI1_Total_Power_kW",
+    "BDI2_Total_Power_kW",
+    "DCgen_RPM_Frequency",
+    "DCgen_Throttle_Stop",
+    "FlowMeter_Fuel_Temp",
+    "SCC1_Todate_Chg_kWh",
+    "ana3_Batt_Room_Temp",
+    "DCgen_Engine_Runtime",
+    "BDI1_ACinput_Total_kW",
+    "BDI2_ACinput_Total_kW",
+    "DCgen_Alternator_Temp",
+    "DCgen_Low_Current_Stop",
+    "BDI1_ACinput_Voltage_L1",
+    "BDI1_ACinput_Voltage_L2",
+    "BDI1_ACinput_Voltage_L3",
+    "BDI2_ACinput_Voltage_L1",
+    "BDI2_ACinput_Voltage_L2",
+    "BDI2_ACinput_Voltage_L3",
+    "BDI2_Today_Batt_Chg_kWh",
+    "DCgen_High_Voltage_Stop",
+    "DCgen_Low_Voltage_Start",
+    "LoadPM_Today_Import_kWh",
+    "BDI1_Today_Supply_AC_kWh",
+    "BDI2_Todate_Batt_Chg_kWh",
+    "DCgen_Alternator_Current",
+    "DCgen_Alternator_Voltage",
+    "BDI1_Todate_Supply_AC_kWh",
+    "DCgen_Alternator_Power_kW",
+    "DCgen_LoadBattery_Current",
+    "DCgen_LoadBattery_Voltage",
+    "BDI2_Today_Batt_DisChg_kWh",
+    "DCgen_LoadBattery_Power_kW",
+    "BDI2_Todate_Batt_DisChg_kWh",
+    "DCgen_StartingBatteryVoltage",
+    "FlowMeter_Today_Fuel_consumption",
+    "FlowMeter_Total_Fuel_consumption",
+    "FlowMeter_Hourly_Fuel_consumptionRate",
+)
+
+def _column_key(name):
+    return name.replace("_", "").lower()
+
+
+def build_column_map(source, target=PROSPECT_COLUMNS):
+    """
+    Maps each source column to the target name that matches it ignoring case and underscores.
+
+    Only the columns that are renamed are returned, the first matching target wins.
+    """
+    index = {}
+    for name in target:
+        index.setdefault(_column_key(name), name)
+    return {col: index[_column_key(col)] for col in source if index.get(_column_key(col), col) != col}
+
+
+@functools.lru_cache(maxsize=32)
+def get_column_map(source, target=PROSPECT_COLUMNS):
+    """Returns the column mapping of the source (tuple) to the target columns, computed once per pair."""
+    return build_column_map(source, target)
+
+
+def map_columns(df):
+    """
+    Renames the DataFrame columns to the Prospect (AZURE) field names.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The Pandas DataFrame containing the data to be sent to the Azure API.
+
+    Returns
+    -------
+    pd.DataFrame
+        The DataFrame with the mapped column names.
+    """
+    return df.rename(columns=get_column_map(tuple(df.columns)))
 
 
 def get_prospect_url_key(local=None, out=False):
@@ -94,147 +261,6 @@ def api_in_prospect(df, local=None):
         The response from the Prospect API, or None if the request fails.
     """
 
-    def map_columns(df):
-        # AZURE dependant on field order
-        """
-        Maps the columns of the dataframe to the correct column names in the
-        correct order for the Azure API.
-
-        Parameters
-        ----------
-        df : pd.DataFrame
-            The Pandas DataFrame containing the data to be sent to the Azure API.
-
-        Returns
-        -------
-        pd.DataFrame
-            The mapped DataFrame with the columns in the correct order.
-        """
-        columns = [
-            "In4",
-            "In5",
-            "In6",
-            "In7",
-            "In8",
-            "Out4",
-            "Out5",
-            "Out6",
-            "Out7",
-            "Out8",
-            "HVB1_SOC",
-            "BDI1_Freq",
-            "BDI2_Freq",
-            "DCgen_RPM",
-            "HVB1_Avg_V",
-            "HVB1_Batt_I",
-            "In3_door_sw",
-            "In1_BDI_Fail",
-            "DCgen_Max_RPM",
-            "DCgen_Min_RPM",
-            "Out1_CloseMC1",
-            "Out2_StartGen",
-            "DatetimeServer",
-            "In2_ATS_status",
-            "DCgen_Today_kWh",
-            "DCgen_Total_kWh",
-            "SCC1_PV_Current",
-            "SCC1_PV_Voltage",
-            "BDI1_Power_P1_kW",
-            "BDI1_Power_P2_kW",
-            "BDI1_Power_P3_kW",
-            "BDI2_Power_P1_kW",
-            "BDI2_Power_P2_kW",
-            "BDI2_Power_P3_kW",
-            "DCgen_Diode_Temp",
-            "DCgen_Fuel_Level",
-            "SCC1_Chg_Current",
-            "SCC1_Chg_Voltage",
-            "SCC1_PV_Power_kW",
-            "ana2_Inv_room_RH",
-            "ana5_Fuel_Level1",
-            "ana6_Fuel_Level2",
-            "BDI1_Batt_Voltage",
-            "DCgen_Max_Current",
-            "DCgen_Max_Voltage",
-            "LoadPM_Import_kWh",
-            "LoadPM_Total_P_kW",
-            "SCC1_Chg_Power_kW",
-            "SCC1_Today_PV_kWh",
-            "ana4_Batt_room_RH",
-            "BDI1_ACinput_P1_kW",
-            "BDI1_ACinput_P2_kW",
-            "BDI1_ACinput_P3_kW",
-            "BDI2_ACinput_P1_kW",
-            "BDI2_ACinput_P2_kW",
-            "BDI2_ACinput_P3_kW",
-            "DCgen_Ambient_Temp",
-            "DCgen_Coolant_Temp",
-            "DCgen_Oil_Pressure",
-            "LoadPM_Power_P1_kW",
-            "LoadPM_Power_P2_kW",
-            "LoadPM_Power_P3_kW",
-            "Out3_EmergencyStop",
-            "SCC1_Todate_PV_kWh",
-            "SCC1_Today_Chg_kWh",
-            "ana1_Inv_Room_Temp",
-            "BDI1_Total_Power_kW",
-            "BDI2_Total_Power_kW",
-            "DCgen_RPM_Frequency",
-            "DCgen_Throttle_Stop",
-            "FlowMeter_Fuel_Temp",
-            "SCC1_Todate_Chg_kWh",
-            "ana3_Batt_Room_Temp",
-            "DCgen_Engine_Runtime",
-            "BDI1_ACinput_Total_kW",
-            "BDI2_ACinput_Total_kW",
-            "DCgen_Alternator_Temp",
-            "DCgen_Low_Current_Stop",
-            "BDI1_ACinput_Voltage_L1",
-            "BDI1_ACinput_Voltage_L2",
-            "BDI1_ACinput_Voltage_L3",
-            "BDI2_ACinput_Voltage_L1",
-            "BDI2_ACinput_Voltage_L2",
-            "BDI2_ACinput_Voltage_L3",
-            "BDI2_Today_Batt_Chg_kWh",
-            "DCgen_High_Voltage_Stop",
-            "DCgen_Low_Voltage_Start",
-            "LoadPM_Today_Import_kWh",
-            "BDI1_Today_Supply_AC_kWh",
-            "BDI2_Todate_Batt_Chg_kWh",
-            "DCgen_Alternator_Current",
-            "DCgen_Alternator_Voltage",
-            "BDI1_Todate_Supply_AC_kWh",
-            "DCgen_Alternator_Power_kW",
-            "DCgen_LoadBattery_Current",
-            "DCgen_LoadBattery_Voltage",
-            "BDI2_Today_Batt_DisChg_kWh",
-            "DCgen_LoadBattery_Power_kW",
-            "BDI2_Todate_Batt_DisChg_kWh",
-            "DCgen_StartingBatteryVoltage",
-            "FlowMeter_Today_Fuel_consumption",
-            "FlowMeter_Total_Fuel_consumption",
-            "FlowMeter_Hourly_Fuel_consumptionRate",
-        ]
-        new_cols = df.columns.tolist()
-
-        mapped = []
-        for item in new_cols:
-            # Find the closest match ignoring case
-            match = next(
-                (
-                    a
-                    for a in columns
-                    if re.sub(r"_", "", a.lower()) == item.replace("_", "").lower()
-                ),
-                item,
-            )
-            mapped.append(match)
-        print(len(mapped), len(new_cols), len(columns))
-
-        for x in range(len(mapped)):
-            df.rename(columns={new_cols[x]: mapped[x]}, inplace=True)
-        return df
-
     if df is None:
         return df
 
@@ -257,6 +283,41 @@ def api_in_prospect(df, local=None):
         return None
 
 
+def api_in_prospect_batch(records, local=None):
+    """
+    Sends one batch of records to the prospect API's inbound custom endpoint, gzip compressed.
+
+    Parameters
+    ----------
+    records : str
+        The records of the batch, serialized as a JSON array (DataFrame.to_json(orient="records")).
+    local : bool, optional
+        A flag indicating whether to send data to the local or external Prospect API. When True, sends to the local API.
+        Default is None (AZURE).
+
+    Returns
+    -------
+    tuple
+        (requests.Response, None) when Prospect accepted the batch, otherwise (None, error string).
+    """
+    try:
+        url, key = get_prospect_url_key(local)
+        url += "/v1/in/custom"
+        body = gzip.compress(('{"data": ' + records + "}").encode("utf-8"), compresslevel=6)
+        headers = {
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+        }
+        res = get_session().post(url, headers=headers, data=body, verify=const.VERIFY, timeout=120)
+        if not res.ok:
+            return None, f"api_in_prospect_batch HTTP {res.status_code}: {res.text[:200]}"
+        return res, None
+    except Exception as e:
+        logger.error(f"api_in_prospect_batch ERROR: {e}")
+        return None, f"api_in_prospect_batch ERROR: {e}"
+
+
 def get_prospect_last_data(response, key="datetimeserver"):
     """
     Retrieves the latest timestamp from the Prospect API response.
@@ -11,17 +11,25 @@ Overview:
  get_site_info: Retrieves detailed information about a specific site from the Solarman API.
 """
 
-import bisect
+from concurrent.futures import ThreadPoolExecutor
+import csv
 from datetime import datetime, UTC, timedelta, timezone
+import functools
+import hashlib
+import heapq
+import io
 import json
 import logging
+from operator import itemgetter
+import queue
+import random
+import threading
 import time
 import pandas as pd
 import re
 import requests
-from sqlalchemy import inspect, text, select
-from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import JSON, Float, Integer, Numeric, inspect, select
+from sqlalchemy.orm import Session
 
 from unhcr import app_utils
 from unhcr import constants as const
@@ -39,20 +47,16 @@ mods=[
     ["models", "models"],
 ]
 
-res = app_utils.app_init(mods=mods, log_file="unhcr.api_solarman.log", version="0.4.8", level="INFO", override=False)
+res = app_utils.app_init(mods=mods, log_file="unhcr.api_solarman.log", version="0.4.8", level="INFO", override=False, lazy=True)
 logger = res[0]
-if const.LOCAL:  # testing with local python files
+if len(res) > 1:  # testing with local python files
     logger, app_utils, const, utils, db, err_handler, models = res
 
-# Solarman API credentials (replace with your actual credentials)
-APP_ID = const.SM_APP_ID
-APP_SECRET = const.SM_APP_SECRET
-BIZ_ACCESS_TOKEN = const.SM_BIZ_ACCESS_TOKEN
-BASE_URL = const.SM_URL
-TOKEN_URL = const.SM_TOKEN_URL
-HISTORICAL_URL = const.SM_HISTORY_URL
+# Solarman API credentials and URLs are read from const (SM_APP_ID, SM_URL ...) when a request is made
 
 # Constants for the Solarman API TODO: update by calling API
+# INVERTERS, SITE_LIST and WEATHER seed device_site_history (models.db_update_device_history) and the
+# fuel reports, the current device to site lookups go through get_topology
 INVERTERS = [
     {
         "site": "ABUJA",
@@ -249,36 +253,139 @@ def db_get_sm_weather_max_epoch(db_eng, device_sn):
     Returns:
         tuple: A tuple containing the latest timestamp as an integer, and None if the query was successful, or an error message if it was not.
     """
-    sql = f"select max(org_epoch) FROM solarman.weather where device_sn = '{device_sn}'"
-    val, err = db.sql_execute(sql, db_eng)
+    sql = "select max(org_epoch) FROM solarman.weather where device_sn = :device_sn"
+    val, err = db.sql_execute(sql, db_eng, data={"device_sn": device_sn})
     if err is not None:
         return None, err
     epoch = val[0][0]
     return epoch, None
 
 
+SQL_SM_TOPOLOGY = """
+    SELECT s."name", dsh.station_id, dsh.device_sn, dsh.device_id, d.device_type
+    FROM solarman.device_site_history dsh
+    JOIN solarman.stations s ON s.id = dsh.station_id
+    JOIN solarman.devices d ON dsh.device_sn = d.device_sn
+    WHERE dsh.end_time IS NULL
+    ORDER BY dsh.station_id, dsh.device_sn
+"""
+
+# changes whenever a device moves, is added or removed. Closing or reopening an assignment is seen
+# through the open row count and max(end_time) even when the UPDATE leaves updated alone, other raw
+# edits are only seen when they bump updated (the tables are tiny, this is a cheap read)
+SQL_SM_TOPOLOGY_VERSION = """
+    SELECT (SELECT count(*) || '|' || count(*) FILTER (WHERE end_time IS NULL)
+                || '|' || coalesce(max(end_time)::text, '') || '|' || coalesce(max(updated)::text, '')
+            FROM solarman.device_site_history)
+        || '|' || (SELECT coalesce(max(updated)::text, '') FROM solarman.devices)
+        || '|' || (SELECT coalesce(max(updated)::text, '') FROM solarman.stations)
+"""
+
+
+@functools.lru_cache(maxsize=64)
+def _ilike(pattern):
+    """Compiles a SQL ILIKE pattern (% and _ wildcards) to a case insensitive regex."""
+    regex = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern)
+    return re.compile(regex, re.IGNORECASE | re.DOTALL)
+
+
+class SolarmanTopology:
+    """
+    In-process copy of the current device to site assignment (device_site_history with end_time NULL).
+
+    The join is loaded once, refresh() reloads it only when the version of device_site_history,
+    devices and stations changed, and checks that version at most every `check_every` seconds.
+    site_of and devices_of are dict lookups.
+
+    The version relies on the application bumping `updated`, except for device_site_history
+    end_time changes which it sees directly. After other raw SQL edits (a station rename, a
+    device_type change) call refresh(db_eng, force=True).
+    """
+
+    def __init__(self, check_every=60):
+        self.check_every = check_every
+        self.version = None
+        self.checked = 0.0
+        self.rows = []
+        self.by_sn = {}
+        self.by_site = {}
+        self.lock = threading.Lock()
+
+    def load(self, db_eng):
+        rows, err = db.sql_execute(SQL_SM_TOPOLOGY, db_eng)
+        if err:
+            return None, err
+        rows = [dict(row._mapping) for row in rows]
+        by_site = {}
+        for row in rows:
+            by_site.setdefault(row["station_id"], []).append(row)
+        self.rows, self.by_sn, self.by_site = rows, {row["device_sn"]: row for row in rows}, by_site
+        return self, None
+
+    def refresh(self, db_eng, force=False):
+        """Reloads the topology if its version changed, returns (self, None) or (None, error)."""
+        with self.lock:
+            now = time.monotonic()
+            if not force and self.version is not None and now - self.checked < self.check_every:
+                return self, None
+            res, err = db.sql_execute(SQL_SM_TOPOLOGY_VERSION, db_eng)
+            if err:
+                return None, err
+            version = res[0][0]
+            self.checked = now
+            if version == self.version and not force:
+                return self, None
+            res, err = self.load(db_eng)
+            if err:
+                return None, err
+            self.version = version
+            logger.debug(f"SolarMan topology loaded, {len(self.rows)} devices, version {version}")
+            return self, None
+
+    def site_of(self, sn):
+        """The current (station_id, name) of a device serial, or None."""
+        row = self.by_sn.get(str(sn))
+        return (row["station_id"], row["name"]) if row else None
+
+    def devices_of(self, station_id, dev_type=None):
+        """The current device rows of a station, optionally of one device_type."""
+        return [row for row in self.by_site.get(station_id, []) if dev_type is None or row["device_type"] == dev_type]
+
+    def devices(self, dev_type="%", site_key="%"):
+        """Device rows whose device_type and station name match the ILIKE patterns, as a DataFrame."""
+        type_re, site_re = _ilike(dev_type), _ilike(site_key)
+        rows = [row for row in self.rows if type_re.fullmatch(row["device_type"]) and site_re.fullmatch(row["name"])]
+        return pd.DataFrame(rows, columns=["name", "station_id", "device_sn", "device_id", "device_type"])
+
+
+_topologies = {}
+_topology_lock = threading.Lock()
+
+
+def get_topology(db_eng):
+    """Returns the SolarmanTopology of db_eng's database, loaded on first use and refreshed when it changed."""
+    key = str(db_eng.url)  # one cache per database
+    with _topology_lock:
+        topology = _topologies.get(key)
+        if topology is None:
+            topology = _topologies[key] = SolarmanTopology()
+    return topology.refresh(db_eng)
+
+
 def db_get_devices_site_sn_id(db_eng, dev_type="%", site_key="%"):
-    sql = """
-        WITH site_devices AS (
-            SELECT s."name", dsh.station_id, dsh.device_sn, dsh.device_id, d.device_type 
-            FROM solarman.device_site_history dsh
-            JOIN solarman.stations s ON s.id = dsh.station_id
-            JOIN solarman.devices d ON dsh.device_sn = d.device_sn
-            WHERE dsh.end_time IS NULL 
-        )
-        SELECT * FROM site_devices
-        WHERE  device_type ILIKE :dev_type AND name ILIKE :site_key
     """
+    Current devices with their site, filtered by device_type and station name ILIKE patterns.
 
-    params = {
-        "dev_type": dev_type,
-        "site_key": site_key
-    }
-    df, err = db.sql_execute(sql, db_eng, data=params)
+    Served from the cached SolarmanTopology, the join only runs again when device_site_history changed.
+
+    Returns:
+        tuple: (DataFrame with name, station_id, device_sn, device_id and device_type, None) or (None, error).
+    """
+    topology, err = get_topology(db_eng)
     if err:
         logger.error(f"db_get_devices_site_sn_id ERROR: {err}")
         return None, err
-    return pd.DataFrame(df), None
+    return topology.devices(dev_type, site_key), None
 
 
 def camel_to_snake(name):
@@ -322,27 +429,18 @@ def api_get_all_stations(db_eng=None):
     "page": 1,
     "size": 200
     })
-    url = BASE_URL + "/station/v1.0/list?language=en"
-
-    headers = {
-        "Content-Type": "application/json",
-        "User-Agent": "UNHCR_STEVE",
-        "Authorization": f"Bearer {BIZ_ACCESS_TOKEN}",
-    }
+    url = const.SM_URL + "/station/v1.0/list?language=en"
 
-    response = requests.request("POST", url, headers=headers, data=payload)
+    response = get_client().post(url, payload)
 
     res = response.json()
     if "success" not in res or res["success"] != True:
         return None, "API call not successful"
     data = res["stationList"]
-    data = convert_keys_to_snake_case(data)
     err = None
     if db_eng:
-        #TODO: upsert DB
-        ######res, err = err_handler.error_wrapper(lambda: insert_station_data_daily(db_eng, data))
-        ####db_insert_devices(db_eng, data)
-        pass
+        _, err = upsert_stations(data, db_eng)
+    data = convert_keys_to_snake_case(data)
     if err:
         return None, err
     return pd.DataFrame(data), None
@@ -373,7 +471,7 @@ def db_get_inverter_sns(db_eng):
 
 def db_insert_devices(db_eng, records=None):
     """
-    Inserts records into the devices table in the database.
+    Upserts records into the devices table in the database.
 
     Parameters
     ----------
@@ -384,32 +482,28 @@ def db_insert_devices(db_eng, records=None):
 
     Returns
     -------
-    None
+    tuple
+        (number of rows upserted, None) or (None, error message).
     """
 
-    with Session(db_eng) as session:
-        # Process each item
-        for item in records:
-            record = models.Device(
-                device_sn=item["device_sn"],
-                device_id=item["device_id"],
-                device_type=item["device_type"],
-                connect_status=item["connect_status"],
-                collection_time=int(item["collection_time"]),
-            )
-
-            # data = session.query(StationData).all()
-
-            # Add and commit record
-            session.merge(record)  # Uses upsert behavior
-            # x = str(session.query(StationData).filter(StationData.station_id == record.station_id).statement)
-            session.commit()
-
-    logger.info("Data inserted successfully!")
+    rows = [
+        {
+            "device_sn": item["device_sn"],
+            "device_id": item["device_id"],
+            "device_type": item["device_type"],
+            "connect_status": item["connect_status"],
+            "collection_time": int(item["collection_time"]),
+        }
+        for item in records or []
+    ]
+    res, err = models.db_bulk_upsert(db_eng, models.Device, rows, ["device_sn"])
+    if not err:
+        logger.info("Data inserted successfully!")
+    return res, err
 
 
 def api_get_devices(site_id, deviceType=None, db_eng=None):
-    url = BASE_URL + "/station/v1.0/device?language=en"
+    url = const.SM_URL + "/station/v1.0/device?language=en"
 
     pl = {"stationId": site_id }
     if deviceType:
@@ -417,13 +511,7 @@ def api_get_devices(site_id, deviceType=None, db_eng=None):
      #"stationId": "{{stationId_Ogoja_gh}}",
     #"deviceType": "INVERTER"
     payload = json.dumps(pl)
-    headers = {
-        "Content-Type": "application/json",
-        "User-Agent": "UNHCR_STEVE",
-        "Authorization": f"Bearer {BIZ_ACCESS_TOKEN}",
-    }
-
-    response = requests.request("POST", url, headers=headers, data=payload)
+    response = get_client().post(url, payload)
 
     res = response.json()
     if "success" not in res or res["success"] != True:
@@ -433,14 +521,74 @@ def api_get_devices(site_id, deviceType=None, db_eng=None):
     data = [{**item, "site_id": site_id} for item in data]
     err = None
     if db_eng:
-        ######res, err = err_handler.error_wrapper(lambda: insert_station_data_daily(db_eng, data))
-        db_insert_devices(db_eng, data)
-    pass
+        _, err = db_insert_devices(db_eng, data)
     if err:
         return None, err
     return data, None
 
 
+def fetch_weather_day(device, date_str, client=None):
+    """
+    Fetches the readings of one weather station from date_str, one API call and no DB access.
+
+    Consecutive readings rounding to the same 5 minute epoch are skipped.
+
+    Parameters:
+    device (namedtuple): A devices row with station_id, device_sn and device_id.
+    date_str (str): The start date for data retrieval in 'YYYY-MM-DD' format.
+    client (SolarmanClient, optional): Defaults to the shared get_client().
+
+    Returns:
+    tuple: (list of dict ordered by epoch, None) on success, otherwise (None, error message).
+    """
+    logging.info(f"Device: {device} {date_str}")
+    payload = json.dumps(
+        {
+            "station_id": device.station_id,
+            "deviceSn": device.device_sn,
+            "deviceId": device.device_id,
+            "startTime": date_str,
+            "endTime": "2099-01-01",
+            "timeType": 1,
+        }
+    )
+    response = (client or get_client()).post(const.SM_HISTORY_URL, payload)
+    if response.status_code != 200:
+        return None, f"get_weather_data ERROR: {response.status_code} {response.text}"
+    j = json.loads(response.text)
+
+    stream = []
+    last_epoch = None
+    for item in j["paramDataList"]:
+        e = round(int(item["collectTime"]) / 300) * 300
+        e += 60 * 60  # add 1 hour for Africa
+        if e == last_epoch:
+            continue
+        last_epoch = e
+        info = {
+            "station_id": device.station_id,
+            "device_sn": str(j["deviceSn"]),
+            "device_id": str(j["deviceId"]),
+            "org_epoch": item["collectTime"],
+            "epoch": e,
+        }
+        for d in item["dataList"]:
+            if d["name"] == "SN":
+                info["ts"] = datetime.fromtimestamp(e, UTC)
+            elif d["name"] in WEATHER_MAPPING:
+                field, converter = WEATHER_MAPPING[d["name"]]
+                info[field] = converter(d["value"])
+        stream.append(info)
+    # the API returns a day in collection order, sorting is a linear pass unless it did not
+    stream.sort(key=itemgetter("epoch"))
+    return stream, None
+
+
+def merge_weather_streams(streams):
+    """k-way merge of per device reading lists by epoch, later streams first on equal epochs."""
+    return list(heapq.merge(*reversed(streams), key=itemgetter("epoch")))
+
+
 def api_get_weather_data(date_str, devices):
     """
     Retrieves weather data for specified devices and date.
@@ -451,86 +599,21 @@ def api_get_weather_data(date_str, devices):
 
     Parameters:
     date_str (str): The start date for data retrieval in 'YYYY-MM-DD' format.
-    devices (list): A list of dictionaries, each containing 'station_id', 'deviceSn' and 'deviceId' keys.
+    devices (pd.DataFrame): The weather devices, with 'station_id', 'device_sn' and 'device_id' columns.
 
     Returns:
     pd.DataFrame: A DataFrame containing the weather data, or None if no data is retrieved.
     """
 
-    url = HISTORICAL_URL
-    data = []
-    first = True
-    x = -1
+    streams = []
     for device in devices.itertuples(index=False):
-        x += 1
-        if x > 0:
-            epoch_values = [item["epoch"] for item in data]
-            first = False
-
-        last_epoch = None
-        logging.info(f"Device: {device}")
-
-        payload = json.dumps(
-            {
-                "station_id": device.station_id,
-                "deviceSn": device.device_sn,
-                "deviceId": device.device_id,
-                "startTime": date_str,
-                "endTime": "2099-01-01",
-                "timeType": 1,
-            }
-        )
-        headers = {
-            "Content-Type": "application/json",
-            "User-Agent": "UNHCR_STEVE",
-            "Authorization": f"Bearer {BIZ_ACCESS_TOKEN}",
-        }
-
-        response = requests.request("POST", url, headers=headers, data=payload)
-        if response.status_code == 200:
-            j = json.loads(response.text)
-
-            for item in j["paramDataList"]:
-                # logging.info(item["collectTime"])
-                e = round(int(item["collectTime"]) / 300) * 300
-                e += 60 * 60  # add 1 hour for Africa
-                if e == last_epoch:
-                    continue
-                last_epoch = e
-                info = {
-                    "station_id": device.station_id,
-                    "device_sn": str(j["deviceSn"]),
-                    "device_id": str(j["deviceId"]),
-                    "org_epoch": item["collectTime"],
-                    "epoch": e,  # item["collectTime"]
-                }
-
-                wdata = []
-                for x in range(len(item["dataList"])):
-                    wdata.append(item["dataList"][x])
-                for d in wdata:
-                    if d["name"] == "SN":
-                        item["sn"] = d["value"]
-                        dt = datetime.fromtimestamp(
-                            e, UTC
-                        )
-                        info["ts"] = dt
-                    elif d["name"] in WEATHER_MAPPING:
-                        field, converter = WEATHER_MAPPING[d["name"]]
-                        info[field] = converter(d["value"])
-
-                if first:
-                    data.append(info)
-                else:
-                    index = bisect.bisect_left(epoch_values, info["epoch"])
-                    # Insert the new item at the correct index
-                    data.insert(index, info)
-                    epoch_values = [item["epoch"] for item in data]
-        else:
-            logging.error(
-                f"get_weather_data ERROR: {response.status_code} {response.text}"
-            )
+        stream, err = fetch_weather_day(device, date_str)
+        if err:
+            logging.error(err)
             continue
+        streams.append(stream)
+
+    data = merge_weather_streams(streams)
     if not data:
         return None
     df = pd.DataFrame(data)
@@ -542,71 +625,132 @@ def api_get_weather_data(date_str, devices):
     return df
 
 
+WEATHER_COLS = ["station_id", "device_sn", "device_id", "org_epoch", "epoch", "ts",
+                "temp_c", "panel_temp", "humidity", "rainfall", "irr", "daily_irr"]
+WEATHER_STAGE_TABLE = "weather_stage"
+
+
 def db_update_weather(df, epoch, engine):
     """
     Updates the weather database with new data.
 
-    This function processes a DataFrame of weather data, adjusts data types, and inserts
-    the data into the `solarman.weather` table. If any rows conflict on the primary key
-    (device_id, ts), it updates the existing records with new values.
+    The rows of df collected at or after epoch are streamed with COPY into a session-local
+    staging table, created once per pooled connection and emptied on commit, and merged into
+    `solarman.weather` with one statement. Rows conflicting on the primary key (device_sn, ts)
+    update the existing records.
 
     Parameters:
     df (pd.DataFrame): The DataFrame containing weather data to be inserted or updated.
+    epoch (int): Rows with an org_epoch before this are skipped.
     engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine to connect to the database.
 
     Returns:
-    tuple: A tuple containing the number of records inserted/updated and an error message, if any.
+    tuple: A dict with the staged, inserted and updated row counts and an error message, if any.
     """
 
+    counts = {"staged": 0, "inserted": 0, "updated": 0}
+    if df is None or df.empty:
+        return counts, None
     try:
-        df["station_id"] = df["station_id"].astype("int32")
-        # df["device_sn"] = df["device_sn"]
-        df["device_id"] = df["device_id"].astype("int32")  # int4
-        df["org_epoch"] = df["org_epoch"].astype("int32")  # int4
-        df["epoch"] = df["epoch"].astype("int32")  # int4
+        df = df.astype({
+            "station_id": "int32",
+            "device_id": "int32",  # int4
+            "org_epoch": "int32",
+            "epoch": "int32",
+            "temp_c": "float32",  # float4
+            "panel_temp": "float32",
+            "humidity": "float32",
+            "rainfall": "float32",
+            "irr": "float32",
+            "daily_irr": "float32",
+        })
         df["ts"] = pd.to_datetime(df["ts"])  # Ensure timestamp format
-        df["temp_c"] = df["temp_c"].astype("float32")  # float4
-        df["panel_temp"] = df["panel_temp"].astype("float32")  # float4
-        df["humidity"] = df["humidity"].astype("float32")  # float4
-        df["rainfall"] = df["rainfall"].astype("float32")  # float4
-        df["irr"] = df["irr"].astype("float32")  # float4
-        df["daily_irr"] = df["daily_irr"].astype("float32")  # float4
-
         df = df[df["org_epoch"] >= epoch]
+        if df.empty:
+            return counts, None
+        buf = io.StringIO()
+        df.to_csv(buf, columns=WEATHER_COLS, index=False, header=False)
+        buf.seek(0)
+    except Exception as e:
+        return None, f"db_update_weather ERROR: {e}"
 
-        df.to_sql(
-            "temp_weather", engine, schema="solarman", if_exists="replace", index=False
+    columns_str = ", ".join(WEATHER_COLS)
+    update_str = ", ".join(f"{col} = EXCLUDED.{col}" for col in WEATHER_COLS if col not in ("station_id", "device_sn", "ts"))
+    # xmax is 0 only for freshly inserted rows
+    merge_sql = f"""
+        WITH merged AS (
+            INSERT INTO solarman.weather ({columns_str})
+            SELECT DISTINCT ON (device_sn, ts) {columns_str} FROM {WEATHER_STAGE_TABLE}
+            ORDER BY device_sn, ts, org_epoch DESC
+            ON CONFLICT (device_sn, ts) DO UPDATE SET {update_str}, updated = now()
+            RETURNING (xmax = 0) AS inserted
         )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged;"""
+    res, err = db.copy_merge(engine, WEATHER_STAGE_TABLE, "solarman.weather", columns_str, buf, merge_sql, fetch=True)
+    if err is not None:
+        return None, f"db_update_weather ERROR: {err}"
+    counts["staged"] = len(df)
+    counts["inserted"], counts["updated"] = res
+    return counts, None
 
-        with engine.begin() as conn:
-            conn.execute(
-                text(
-                    """
-                INSERT INTO solarman.weather (station_id, device_sn, device_id, org_epoch, epoch, ts, temp_c, panel_temp, humidity, rainfall, irr, daily_irr)
-                SELECT station_id, device_sn, device_id, org_epoch, epoch, ts, temp_c, panel_temp, humidity, rainfall, irr, daily_irr FROM solarman.temp_weather
-                ON CONFLICT (device_sn, ts) DO UPDATE 
-                SET device_id = EXCLUDED.device_id,
-                    org_epoch = EXCLUDED.org_epoch,
-                    epoch = EXCLUDED.epoch,
-                    temp_c = EXCLUDED.temp_c,
-                    panel_temp = EXCLUDED.panel_temp,
-                    humidity = EXCLUDED.humidity,
-                    rainfall = EXCLUDED.rainfall,
-                    irr = EXCLUDED.irr,
-                    daily_irr = EXCLUDED.daily_irr;
-            """
-                )
-            )
-            conn.commit()
-            return len(df), None
-    except Exception as e:
-        return None, f"db_update_weather ERROR: {e}"
+
+def ingest_weather_range(devices, start_date, end_date, db_eng, concurrency=None, rate=None, logger=logger,
+                         starts=None):
+    """
+    Fetches the weather of every device and day from start_date to end_date and stores it at once.
+
+    The (device, day) requests run in a thread pool sharing one SolarmanClient, so they stay under
+    the SolarMan rate limit. The per request streams are merged by epoch and written with one
+    db_update_weather call for the whole range.
+
+    Args:
+        devices (pd.DataFrame): The weather devices, with station_id, device_sn and device_id.
+        start_date (date): Oldest day, readings collected before it are not written.
+        end_date (date): Newest day.
+        db_eng: A SQLAlchemy database engine instance.
+        concurrency (int, optional): Defaults to const.SM_API_MAX_CONCURRENCY.
+        rate (float, optional): Requests per second, defaults to const.SM_API_RATE.
+        starts (dict, optional): device_sn -> first day of that device, not before start_date.
+
+    Returns:
+        tuple: (db_update_weather counts plus the number of failed requests, None) or (None, error).
+    """
+    client = get_client() if rate is None and concurrency is None else SolarmanClient(rate=rate, concurrency=concurrency)
+    starts = starts or {}
+    work = []
+    for device in devices.itertuples(index=False):
+        first = max(start_date, starts.get(device.device_sn, start_date))
+        work += [(device, end_date - timedelta(days=i)) for i in range((end_date - first).days + 1)]
+    # newest day first across the devices
+    work = [(device, day.isoformat()) for device, day in sorted(work, key=lambda item: item[1], reverse=True)]
+
+    def fetch(device, date_str):
+        res, err = err_handler.error_wrapper(lambda: fetch_weather_day(device, date_str, client))
+        if not err:
+            res, err = res
+        if err:
+            logger.error(f"Error fetching weather for {device.device_sn} {date_str}: {err}")
+        return res
+
+    with ThreadPoolExecutor(max_workers=concurrency or const.SM_API_MAX_CONCURRENCY) as executor:
+        streams = list(executor.map(lambda item: fetch(*item), work))
+    failed = sum(stream is None for stream in streams)
+    data = merge_weather_streams([stream for stream in streams if stream])
+    if not data:
+        return {"staged": 0, "inserted": 0, "updated": 0, "failed": failed}, None
+
+    epoch = int(datetime(start_date.year, start_date.month, start_date.day, tzinfo=timezone.utc).timestamp())
+    counts, err = db_update_weather(pd.DataFrame(data), epoch, db_eng)
+    if err:
+        return None, err
+    counts["failed"] = failed
+    return counts, None
 
 
 def get_station_daily_data(
     id, start_date="2025-03-01", end_date="2025-03-31", type=2, db_eng=None
 ):
-    url = HISTORICAL_URL.replace("/device/", "/station/").replace(
+    url = const.SM_HISTORY_URL.replace("/device/", "/station/").replace(
         "/historical", "/history"
     )
 
@@ -618,13 +762,7 @@ def get_station_daily_data(
             "timeType": type,  # 2
         }
     )
-    headers = {
-        "Content-Type": "application/json",
-        "User-Agent": "UNHCR_STEVE",
-        "Authorization": f"Bearer {BIZ_ACCESS_TOKEN}",
-    }
-
-    response = requests.request("POST", url, headers=headers, data=payload)
+    response = get_client().post(url, payload)
 
     res = response.json()
     if "success" not in res or res["success"] != True:
@@ -633,9 +771,7 @@ def get_station_daily_data(
     data = [{**item, "site": id} for item in data]
     err = None
     if db_eng:
-        ######res, err = err_handler.error_wrapper(lambda: insert_station_data_daily(db_eng, data))
-        insert_station_data_daily(db_eng, data)
-    pass
+        _, err = insert_station_data_daily(db_eng, data)
     if err:
         return None, err
     return data, None
@@ -643,7 +779,7 @@ def get_station_daily_data(
 
 def insert_station_data_daily(db_eng, records=None):
     """
-    Inserts records into the station_data_daily table in the database.
+    Upserts records into the station_data_daily table in the database.
 
     Parameters
     ----------
@@ -654,298 +790,310 @@ def insert_station_data_daily(db_eng, records=None):
 
     Returns
     -------
-    None
+    tuple
+        (number of rows upserted, None) or (None, error message).
     """
 
-    Session = sessionmaker(bind=db_eng)
-    session = Session()
-
-    # Process each item
-    for item in records:
-        date_time = datetime(item["year"], item["month"], item["day"])
-
-        record = models.StationData(
-            station_id=int(item["site"]),
-            ts=date_time,
-            year=item["year"],
-            month=item["month"],
-            day=item["day"],
-            generation_power=item.get("generationPower"),
-            use_power=item.get("usePower"),
-            grid_power=item.get("gridPower"),
-            purchase_power=item.get("purchasePower"),
-            wire_power=item.get("wirePower"),
-            charge_power=item.get("chargePower"),
-            discharge_power=item.get("dischargePower"),
-            battery_power=item.get("batteryPower"),
-            battery_soc=item.get("batterySoc"),
-            irradiate_intensity=item.get("irradiateIntensity"),
-            generation_value=item.get("generationValue"),
-            generation_ratio=item.get("generationRatio"),
-            grid_ratio=item.get("gridRatio"),
-            charge_ratio=item.get("chargeRatio"),
-            use_value=item.get("useValue"),
-            use_ratio=item.get("useRatio"),
-            buy_ratio=item.get("buyRatio"),
-            use_discharge_ratio=item.get("useDischargeRatio"),
-            grid_value=item.get("gridValue"),
-            buy_value=item.get("buyValue"),
-            charge_value=item.get("chargeValue"),
-            discharge_value=item.get("dischargeValue"),
-            full_power_hours=item.get("fullPowerHours"),
-            irradiate=item.get("irradiate"),
-            theoretical_generation=item.get("theoreticalGeneration"),
-            pr=item.get("pr"),
-            cpr=item.get("cpr"),
-        )
+    rows = []
+    for item in records or []:
+        rows.append({
+            "station_id": int(item["site"]),
+            "ts": datetime(item["year"], item["month"], item["day"]),
+            "year": item["year"],
+            "month": item["month"],
+            "day": item["day"],
+            "generation_power": item.get("generationPower"),
+            "use_power": item.get("usePower"),
+            "grid_power": item.get("gridPower"),
+            "purchase_power": item.get("purchasePower"),
+            "wire_power": item.get("wirePower"),
+            "charge_power": item.get("chargePower"),
+            "discharge_power": item.get("dischargePower"),
+            "battery_power": item.get("batteryPower"),
+            "battery_soc": item.get("batterySoc"),
+            "irradiate_intensity": item.get("irradiateIntensity"),
+            "generation_value": item.get("generationValue"),
+            "generation_ratio": item.get("generationRatio"),
+            "grid_ratio": item.get("gridRatio"),
+            "charge_ratio": item.get("chargeRatio"),
+            "use_value": item.get("useValue"),
+            "use_ratio": item.get("useRatio"),
+            "buy_ratio": item.get("buyRatio"),
+            "use_discharge_ratio": item.get("useDischargeRatio"),
+            "grid_value": item.get("gridValue"),
+            "buy_value": item.get("buyValue"),
+            "charge_value": item.get("chargeValue"),
+            "discharge_value": item.get("dischargeValue"),
+            "full_power_hours": item.get("fullPowerHours"),
+            "irradiate": item.get("irradiate"),
+            "theoretical_generation": item.get("theoreticalGeneration"),
+            "pr": item.get("pr"),
+            "cpr": item.get("cpr"),
+        })
+
+    res, err = models.db_bulk_upsert(db_eng, models.StationData, rows, ["station_id", "ts"])
+    if not err:
+        logger.info("Data inserted successfully!")
+    return res, err
+
+
+# SolarMan historical dataList key -> solarman.inverter_data column
+INVERTER_KEYS = {
+    "SN1": "device_sn",
+    "INV_MOD1": "inverter_type",
+    "Pi_LV1": "output_power_level",
+    "Pr1": "rated_power",
+    "P_INF": "parallel_information",
+    "Dev_Ty1": "device_type",
+    "SYSTIM1": "system_time",
+    "PTCv1": "protocol_version",
+    "MAIN": "main_data",
+    "HMI": "hmi",
+    "LBVN": "lithium_battery_version_number",
+    "CBAVM": "control_board_activator_version_number",
+    "CBAMSV": "control_board_assisted_microcontroller_version_number",
+    "A_B_F_V": "arc_board_firmware_version",
+    "DV1": "dc_voltage_pv1",
+    "DV2": "dc_voltage_pv2",
+    "DV3": "dc_voltage_pv3",
+    "DV4": "dc_voltage_pv4",
+    "DC1": "dc_current_pv1",
+    "DC2": "dc_current_pv2",
+    "DC3": "dc_current_pv3",
+    "DC4": "dc_current_pv4",
+    "DP1": "dc_power_pv1",
+    "DP2": "dc_power_pv2",
+    "DP3": "dc_power_pv3",
+    "DP4": "dc_power_pv4",
+    "P_T_A": "total_production_active",
+    "AV1": "ac_voltage_r_u_a",
+    "AV2": "ac_voltage_s_v_b",
+    "AV3": "ac_voltage_t_w_c",
+    "AC1": "ac_current_r_u_a",
+    "AC2": "ac_current_s_v_b",
+    "AC3": "ac_current_t_w_c",
+    "A_Fo1": "ac_output_frequency_r",
+    "Et_ge0": "cumulative_production_active",
+    "Etdy_ge1": "daily_production_active",
+    "INV_O_P_L1": "inverter_output_power_l1",
+    "INV_O_P_L2": "inverter_output_power_l2",
+    "INV_O_P_L3": "inverter_output_power_l3",
+    "INV_O_P_T": "total_inverter_output_power",
+    "S_P_T": "total_solar_power",
+    "G_V_L1": "grid_voltage_l1",
+    "G_C_L1": "grid_current_l1",
+    "G_P_L1": "grid_power_l1",
+    "G_V_L2": "grid_voltage_l2",
+    "G_C_L2": "grid_current_l2",
+    "G_P_L2": "grid_power_l2",
+    "G_V_L3": "grid_voltage_l3",
+    "G_C_L3": "grid_current_l3",
+    "G_P_L3": "grid_power_l3",
+    "ST_PG1": "grid_status",
+    "CT1_P_E": "external_ct1_power",
+    "CT2_P_E": "external_ct2_power",
+    "CT3_P_E": "external_ct3_power",
+    "CT_T_E": "total_external_ct_power",
+    "PG_F1": "grid_frequency",
+    "PG_Pt1": "total_grid_power",
+    "G16": "total_grid_reactive_power",
+    "E_B_D": "daily_energy_buy",
+    "E_S_D": "daily_energy_sell",
+    "E_B_TO": "total_energy_buy",
+    "E_S_TO": "total_energy_sell",
+    "GS_A": "internal_l1_power",
+    "GS_B": "internal_l2_power",
+    "GS_C": "internal_l3_power",
+    "GS_T": "internal_power",
+    "A_RP_INV": "inverter_a_phase_reactive_power",
+    "B_RP_INV": "inverter_b_phase_reactive_power",
+    "C_RP_INV": "inverter_c_phase_reactive_power",
+    "MPPT_N": "mppt_number_of_routes_and_phases",
+    "C_V_L1": "load_voltage_l1",
+    "C_V_L2": "load_voltage_l2",
+    "C_V_L3": "load_voltage_l3",
+    "C_P_L1": "load_power_l1",
+    "C_P_L2": "load_power_l2",
+    "C_P_L3": "load_power_l3",
+    "E_Puse_t1": "total_consumption_power",
+    "E_Suse_t1": "total_consumption_apparent_power",
+    "Etdy_use1": "daily_consumption",
+    "E_C_T": "total_consumption",
+    "L_F": "load_frequency",
+    "LPP_A": "load_phase_power_a",
+    "LPP_B": "load_phase_power_b",
+    "LPP_C": "load_phase_power_c",
+    "B_ST1": "battery_status",
+    "B_V1": "battery_voltage",
+    "B_P_1": "battery_power1",
+    "BATC1": "battery_current1",
+    "B_C2": "battery_current2",
+    "B_P1": "battery_power",
+    "B_left_cap1": "soc",
+    "t_cg_n1": "total_charging_energy",
+    "t_dcg_n1": "total_discharging_energy",
+    "Etdy_cg1": "daily_charging_energy",
+    "Etdy_dcg1": "daily_discharging_energy",
+    "BRC": "battery_rated_capacity",
+    "B_TYP1": "battery_type",
+    "Batt_ME1": "battery_mode",
+    "BAT_FAC": "battery_factory",
+    "B_1S": "battery_1_status",
+    "B_CT": "battery_total_current",
+    "B_2S": "battery_2_status",
+    "BMS_B_V1": "bms_voltage",
+    "BMS_B_C1": "bms_current",
+    "BMST": "bms_temperature",
+    "BMS_C_V": "bms_charge_voltage",
+    "BMS_D_V": "bms_discharge_voltage",
+    "BMS_C_C_L": "charge_current_limit",
+    "BMS_D_C_L": "discharge_current_limit",
+    "BMS_SOC": "bms_soc",
+    "BMS_CC1": "bms_charging_max_current",
+    "BMS_DC1": "bms_discharging_max_current",
+    "Li_bf": "li_bat_flag",
+    "B_T1": "temperature_battery",
+    "AC_T": "ac_temperature",
+    "yr1": "year",
+    "mon1": "month",
+    "tdy1": "day",
+    "hou1": "hour",
+    "min1": "minute",
+    "sec1": "second",
+    "Inver_Ara": "inverter_algebra",
+    "Inver_Sd": "inverter_series_distinction",
+    "GS_A1": "gs_a1",
+    "GS_B1": "gs_b1",
+    "GS_C1": "gs_c1",
+    "GS_T1": "gs_t1",
+    "GRID_RELAY_ST1": "grid_relay_status",
+    "I_P_G_S": "inverter_power_generation_status",
+    "GEN_P_L1": "gen_power_l1",
+    "GEN_P_L2": "gen_power_l2",
+    "GEN_P_L3": "gen_power_l3",
+    "GEN_V_L1": "gen_voltage_l1",
+    "GEN_V_L2": "gen_voltage_l2",
+    "GEN_V_L3": "gen_voltage_l3",
+    "R_T_D": "gen_daily_run_time",
+    "EG_P_CT1": "generator_active_power",
+    "GEN_P_T": "total_gen_power",
+    "GEN_P_D": "daily_production_generator",
+    "GEN_P_TO": "total_production_generator",
+}
 
-        # data = session.query(StationData).all()
 
-        # Add and commit record
-        session.merge(record)  # Uses upsert behavior
-        # x = str(session.query(StationData).filter(StationData.station_id == record.station_id).statement)
-        session.commit()
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
 
-    logger.info("Data inserted successfully!")
 
+def _to_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
 
-def insert_inverter_data(db_eng=None, json_data={}):
-    if db_eng is None:
-        db_eng = db.set_local_defaultdb_engine()
-    z = ''
-    inverter_data_table = inspect(models.InverterData).local_table
-    # Define the expected keys -- the ones coming from API so we can map them to DB cols
-    DB_KEYS = [col for col in inverter_data_table.columns.keys() if col not in ['ts', 'created', 'updated']]
-    EXPECTED_KEYS = {
-        "SN1": "device_sn",
-        "INV_MOD1": "inverter_type",
-        "Pi_LV1": "output_power_level",
-        "Pr1": "rated_power",
-        "P_INF": "parallel_information",
-        "Dev_Ty1": "device_type",
-        "SYSTIM1": "system_time",
-        "PTCv1": "protocol_version",
-        "MAIN": "main_data",
-        "HMI": "hmi",
-        "LBVN": "lithium_battery_version_number",
-        "CBAVM": "control_board_activator_version_number",
-        "CBAMSV": "control_board_assisted_microcontroller_version_number",
-        "A_B_F_V": "arc_board_firmware_version",
-        "DV1": "dc_voltage_pv1",
-        "DV2": "dc_voltage_pv2",
-        "DV3": "dc_voltage_pv3",
-        "DV4": "dc_voltage_pv4",
-        "DC1": "dc_current_pv1",
-        "DC2": "dc_current_pv2",
-        "DC3": "dc_current_pv3",
-        "DC4": "dc_current_pv4",
-        "DP1": "dc_power_pv1",
-        "DP2": "dc_power_pv2",
-        "DP3": "dc_power_pv3",
-        "DP4": "dc_power_pv4",
-        "P_T_A": "total_production_active",
-        "AV1": "ac_voltage_r_u_a",
-        "AV2": "ac_voltage_s_v_b",
-        "AV3": "ac_voltage_t_w_c",
-        "AC1": "ac_current_r_u_a",
-        "AC2": "ac_current_s_v_b",
-        "AC3": "ac_current_t_w_c",
-        "A_Fo1": "ac_output_frequency_r",
-        "Et_ge0": "cumulative_production_active",
-        "Etdy_ge1": "daily_production_active",
-        "INV_O_P_L1": "inverter_output_power_l1",
-        "INV_O_P_L2": "inverter_output_power_l2",
-        "INV_O_P_L3": "inverter_output_power_l3",
-        "INV_O_P_T": "total_inverter_output_power",
-        "S_P_T": "total_solar_power",
-        "G_V_L1": "grid_voltage_l1",
-        "G_C_L1": "grid_current_l1",
-        "G_P_L1": "grid_power_l1",
-        "G_V_L2": "grid_voltage_l2",
-        "G_C_L2": "grid_current_l2",
-        "G_P_L2": "grid_power_l2",
-        "G_V_L3": "grid_voltage_l3",
-        "G_C_L3": "grid_current_l3",
-        "G_P_L3": "grid_power_l3",
-        "ST_PG1": "grid_status",
-        "CT1_P_E": "external_ct1_power",
-        "CT2_P_E": "external_ct2_power",
-        "CT3_P_E": "external_ct3_power",
-        "CT_T_E": "total_external_ct_power",
-        "PG_F1": "grid_frequency",
-        "PG_Pt1": "total_grid_power",
-        "G16": "total_grid_reactive_power",
-        "E_B_D": "daily_energy_buy",
-        "E_S_D": "daily_energy_sell",
-        "E_B_TO": "total_energy_buy",
-        "E_S_TO": "total_energy_sell",
-        "GS_A": "internal_l1_power",
-        "GS_B": "internal_l2_power",
-        "GS_C": "internal_l3_power",
-        "GS_T": "internal_power",
-        "A_RP_INV": "inverter_a_phase_reactive_power",
-        "B_RP_INV": "inverter_b_phase_reactive_power",
-        "C_RP_INV": "inverter_c_phase_reactive_power",
-        "MPPT_N": "mppt_number_of_routes_and_phases",
-        "C_V_L1": "load_voltage_l1",
-        "C_V_L2": "load_voltage_l2",
-        "C_V_L3": "load_voltage_l3",
-        "C_P_L1": "load_power_l1",
-        "C_P_L2": "load_power_l2",
-        "C_P_L3": "load_power_l3",
-        "E_Puse_t1": "total_consumption_power",
-        "E_Suse_t1": "total_consumption_apparent_power",
-        "Etdy_use1": "daily_consumption",
-        "E_C_T": "total_consumption",
-        "L_F": "load_frequency",
-        "LPP_A": "load_phase_power_a",
-        "LPP_B": "load_phase_power_b",
-        "LPP_C": "load_phase_power_c",
-        "B_ST1": "battery_status",
-        "B_V1": "battery_voltage",
-        "B_P_1": "battery_power1",
-        "BATC1": "battery_current1",
-        "B_C2": "battery_current2",
-        "B_P1": "battery_power",
-        "B_left_cap1": "soc",
-        "t_cg_n1": "total_charging_energy",
-        "t_dcg_n1": "total_discharging_energy",
-        "Etdy_cg1": "daily_charging_energy",
-        "Etdy_dcg1": "daily_discharging_energy",
-        "BRC": "battery_rated_capacity",
-        "B_TYP1": "battery_type",
-        "Batt_ME1": "battery_mode",
-        "BAT_FAC": "battery_factory",
-        "B_1S": "battery_1_status",
-        "B_CT": "battery_total_current",
-        "B_2S": "battery_2_status",
-        "BMS_B_V1": "bms_voltage",
-        "BMS_B_C1": "bms_current",
-        "BMST": "bms_temperature",
-        "BMS_C_V": "bms_charge_voltage",
-        "BMS_D_V": "bms_discharge_voltage",
-        "BMS_C_C_L": "charge_current_limit",
-        "BMS_D_C_L": "discharge_current_limit",
-        "BMS_SOC": "bms_soc",
-        "BMS_CC1": "bms_charging_max_current",
-        "BMS_DC1": "bms_discharging_max_current",
-        "Li_bf": "li_bat_flag",
-        "B_T1": "temperature_battery",
-        "AC_T": "ac_temperature",
-        "yr1": "year",
-        "mon1": "month",
-        "tdy1": "day",
-        "hou1": "hour",
-        "min1": "minute",
-        "sec1": "second",
-        "Inver_Ara": "inverter_algebra",
-        "Inver_Sd": "inverter_series_distinction",
-        "GS_A1": "gs_a1",
-        "GS_B1": "gs_b1",
-        "GS_C1": "gs_c1",
-        "GS_T1": "gs_t1",
-        "GRID_RELAY_ST1": "grid_relay_status",
-        "I_P_G_S": "inverter_power_generation_status",
-        "GEN_P_L1": "gen_power_l1",
-        "GEN_P_L2": "gen_power_l2",
-        "GEN_P_L3": "gen_power_l3",
-        "GEN_V_L1": "gen_voltage_l1",
-        "GEN_V_L2": "gen_voltage_l2",
-        "GEN_V_L3": "gen_voltage_l3",
-        "R_T_D": "gen_daily_run_time",
-        "EG_P_CT1": "generator_active_power",
-        "GEN_P_T": "total_gen_power",
-        "GEN_P_D": "daily_production_generator",
-        "GEN_P_TO": "total_production_generator",
-    }
 
-    # Initialize a dictionary to hold the mapped data
-    inverter_instances = []
-    # Iterate over each dictionary in 'dataList'
-    for item in json_data:
-        mapped_data = {}
-        for items in item["dataList"]:
-            if items["key"] in EXPECTED_KEYS:
-                # Map the key to the corresponding column name
-                if "value" in items:
-                    mapped_data[EXPECTED_KEYS[items["key"]]] = items["value"]
-
-        # Check for missing keys
-        missing_keys = [key for key in DB_KEYS if key not in mapped_data]
-        # there are typically 31 keys missng, because we do not store those in the DB
-        # if missing_keys:
-        #     raise ValueError(f"Missing keys in JSON data: {', '.join(missing_keys)}")
-
-        # Prepare the model with the expected values using the key mapping
-        dt = datetime.fromtimestamp(int(item["collectTime"]), tz=timezone.utc)
-        data = models.InverterData(ts=round_to_nearest_5_minutes(dt), **mapped_data)
-        z = mapped_data["device_sn"]
-        if data.system_time:
-            if data.system_time.startswith("00-00-00"):
-                data.system_time = None
-            else:
-                data.system_time = ("20" + data.system_time)[:16]
-        inverter_instances.append(data)
-
-    def to_plain_dict(obj, exclude_fields=None):
-        """Convert SQLAlchemy ORM object to plain dict, excluding listed fields."""
-        exclude_fields = set(exclude_fields or [])
-        return {
-            c.key: getattr(obj, c.key)
-            for c in inspect(obj).mapper.column_attrs
-            if c.key not in exclude_fields
-        }
+def _to_system_time(value):
+    # SYSTIM1 is 'yy-mm-dd hh:mm:ss', all zero when the inverter clock is not set
+    if not value or value.startswith("00-00-00"):
+        return None
+    return ("20" + value)[:16]
 
-    valid_inverters = [
-        obj for obj in inverter_instances
-        if obj.ts is not None #and obj.id is not None  # etc.
-    ]
 
-    rows = [to_plain_dict(obj, exclude_fields=['created', 'updated']) for obj in valid_inverters]
-    
-    def dedupe_by_keys(rows, keys):
-        seen = set()
-        dups = 0
-        deduped = []
-        for row in rows:
-            identifier = tuple(row[k] for k in keys)
-            if identifier not in seen:
-                seen.add(identifier)
-                deduped.append(row)
-            else:
-                dups += 1
-            last = row
-        return deduped
+INVERTER_STAGE_TABLE = "inverter_data_stage"
 
-    rows = dedupe_by_keys(rows, keys=['ts', 'device_sn'])
 
-    # Clean up internal SQLAlchemy attributes (like _sa_instance_state)
-    for row in rows:
-        row.pop('_sa_instance_state', None)
+@functools.lru_cache(maxsize=None)
+def inverter_columns():
+    """
+    Column order of the inverter rows and the precompiled dataList key index.
 
-    # Build the INSERT statement
-    update_columns = [
-        c.name for c in inverter_data_table.columns
-        if c.name not in ('ts', 'device_sn', 'created', 'updated')  # Do not try to update PKs
+    Returns:
+        tuple: (columns, {api key: (column position, converter)}). ts and device_sn lead the
+        columns, the converters follow the solarman.inverter_data column types.
+    """
+    table = inspect(models.InverterData).local_table
+    columns = ["ts", "device_sn"] + [
+        col.name for col in table.columns if col.name not in ("ts", "device_sn", "created", "updated")
     ]
+    position = {col: i for i, col in enumerate(columns)}
+    key_index = {}
+    for key, col in INVERTER_KEYS.items():
+        if col not in position:  # mapped key without a column yet
+            continue
+        col_type = table.columns[col].type
+        if col == "system_time":
+            convert = _to_system_time
+        elif isinstance(col_type, JSON):
+            convert = json.dumps
+        elif isinstance(col_type, (Float, Numeric)):
+            convert = _to_float
+        elif isinstance(col_type, Integer):  # BigInteger too
+            convert = _to_int
+        else:
+            convert = str
+        key_index[key] = (position[col], convert)
+    return columns, key_index
 
-    stmt = insert(inverter_data_table).values(rows)
-    stmt = stmt.on_conflict_do_update(
-        index_elements=['ts', 'device_sn'],
-        set_={col: getattr(stmt.excluded, col) for col in update_columns}
-    )
-    # No update
-    # stmt = stmt.on_conflict_do_nothing(index_elements=['ts', 'device_sn'])
 
-    if rows:
-        try:
-            with db_eng.begin() as conn:
-                res = conn.execute(stmt)
-                return res.rowcount, None
-        except Exception as e:
-            logger.error(f"Error inserting data: {e}")
-            return None, f"Error inserting data: {e}"
+def inverter_rows(json_data):
+    """
+    Builds typed inverter rows straight from the historical API paramDataList.
 
+    Each dataList entry is placed by the precompiled key index, no ORM objects are created.
+    Records sharing (ts, device_sn) after rounding to 5 minutes keep the first one.
+
+    Returns:
+        list of list: Rows in inverter_columns() order.
+    """
+    columns, key_index = inverter_columns()
+    rows = {}
+    for item in json_data:
+        row = [None] * len(columns)
+        for entry in item["dataList"]:
+            idx = key_index.get(entry["key"])
+            if idx is not None and "value" in entry:
+                row[idx[0]] = idx[1](entry["value"])
+        dt = datetime.fromtimestamp(int(item["collectTime"]), tz=timezone.utc)
+        row[0] = round_to_nearest_5_minutes(dt).replace(tzinfo=None)
+        rows.setdefault((row[0], row[1]), row)
+    return list(rows.values())
+
+
+def insert_inverter_data(db_eng=None, json_data={}):
+    """
+    Upserts SolarMan historical inverter records into solarman.inverter_data.
+
+    The rows from inverter_rows are streamed with COPY into a session-local staging table and
+    merged with one INSERT ... SELECT ... ON CONFLICT (ts, device_sn) DO UPDATE.
+
+    Returns:
+        tuple: (number of rows upserted, None) or (None, error message).
+    """
+    if db_eng is None:
+        db_eng = db.set_local_defaultdb_engine()
+    rows = inverter_rows(json_data)
+    if not rows:
+        return 0, None
+    columns, _ = inverter_columns()
+    columns_str = ", ".join(columns)
+    update_str = ", ".join(f"{col} = EXCLUDED.{col}" for col in columns[2:])
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+
+    merge_sql = f"""
+        INSERT INTO solarman.inverter_data ({columns_str})
+        SELECT {columns_str} FROM {INVERTER_STAGE_TABLE}
+        ON CONFLICT (ts, device_sn) DO UPDATE SET {update_str}, updated = now();"""
+    cnt, err = db.copy_merge(db_eng, INVERTER_STAGE_TABLE, "solarman.inverter_data", columns_str, buf, merge_sql)
+    if err is not None:
+        logger.error(f"Error inserting data: {err}")
+        return None, f"Error inserting data: {err}"
+    return cnt, None
 
 def get_inverter_data(
     sn=2309200154, 
@@ -976,12 +1124,10 @@ def get_inverter_data(
                if applicable. If successful, the error message is None.
     """
 
-    url = HISTORICAL_URL
-
     if days is None:
         res, err = db.sql_execute(
-            f" SELECT max(ts) FROM solarman.inverter_data WHERE device_sn = '{sn}';",
-            db_eng
+            "SELECT max(ts) FROM solarman.inverter_data WHERE device_sn = :sn;",
+            db_eng, data={"sn": str(sn)}
         )
         if err is not None:
             logger.warning(f"get_inverter_data max data ERROR: {err}")
@@ -991,30 +1137,13 @@ def get_inverter_data(
             days = (start_date - end_date).days + 1
     data = []
     for i in range(days):
-        payload = json.dumps(
-            {
-                "deviceSn": sn,  # 2309200154,
-                "startTime": start_date.isoformat(),  # "2024-12-30",
-                "endTime": (start_date + timedelta(days=1)).isoformat(),  # "2024-12-31",
-                "timeType": type,  # 1
-            }
-        )
-        headers = {
-            "Content-Type": "application/json",
-            "User-Agent": "UNHCR_STEVE",
-            "Authorization": f"Bearer {BIZ_ACCESS_TOKEN}",
-        }
-
-        z = time.time()
-        response = requests.request("POST", url, headers=headers, data=payload)
-
-        res = response.json()
-        if "success" not in res or res["success"] != True:
-            return None, f'API call not successful {response.text}, date: {start_date}, # days: {i+1}'
-        data.append(res["paramDataList"])
-        err = None
+        param_data, err = fetch_inverter_day(sn, start_date, type)
+        if err:
+            return None, f'{err}, # days: {i+1}'
+        data.append(param_data)
+        res = None
         if db_eng:
-            res, err = err_handler.error_wrapper(lambda: insert_inverter_data(db_eng, res["paramDataList"]))
+            res, err = err_handler.error_wrapper(lambda: insert_inverter_data(db_eng, param_data))
         if err:
             return None, f'Insert inverter data ERROR: {err} , date: {start_date}, # days: {i+1}'
         logger.info(f"SN: {sn} |  date: {start_date} | # rows: {res[0] if res else 0}")
@@ -1024,6 +1153,393 @@ def get_inverter_data(
     return data, None
 
 
+def fetch_inverter_day(sn, day, type=1, client=None):
+    """
+    Fetches one day of historical inverter data, one API call and no DB access.
+
+    Args:
+        sn (int or str): The serial number of the inverter device.
+        day (date): The day to fetch.
+        type (int): The timeType of the historical request.
+        client (SolarmanClient, optional): Defaults to the shared get_client().
+
+    Returns:
+        tuple: (paramDataList, None) on success, otherwise (None, error message).
+    """
+    payload = json.dumps(
+        {
+            "deviceSn": sn,
+            "startTime": day.isoformat(),
+            "endTime": (day + timedelta(days=1)).isoformat(),
+            "timeType": type,
+        }
+    )
+    response = (client or get_client()).post(const.SM_HISTORY_URL, payload)
+    res = response.json()
+    if "success" not in res or res["success"] != True:
+        return None, f'API call not successful {response.text}, date: {day}'
+    return res["paramDataList"], None
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all threads calling the SolarMan API.
+
+    Tokens refill at `rate` per second up to `burst`; acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SolarmanClient:
+    """
+    Shared SolarMan API client.
+
+    One keep-alive requests session sized for the fetch pool, the bearer token (refreshed from
+    SM_EMAIL / SM_PASSWORD when it expires or is rejected, otherwise SM_BIZ_ACCESS_TOKEN), a
+    RateLimiter taken before every call and retries with jittered exponential backoff on
+    throttling, transient server errors, connection errors and timeouts.
+    """
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    # throttling reported in an HTTP 200 body: {"success": false, "code": ..., "msg": "...frequently..."}
+    THROTTLE_CODES = ("2101019", "2101020")
+    THROTTLE_MSGS = ("frequen", "too many", "rate limit")
+
+    def __init__(self, rate=None, concurrency=None, retries=4, backoff=1.0, timeout=60):
+        pool_size = concurrency or const.SM_API_MAX_CONCURRENCY
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json", "User-Agent": "UNHCR_STEVE"})
+        self.limiter = RateLimiter(rate or const.SM_API_RATE)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.token = const.SM_BIZ_ACCESS_TOKEN
+        self.token_expires = None  # unknown for the configured business token
+        self.token_lock = threading.Lock()
+
+    def refresh_token(self):
+        """Requests a new bearer token, returns False when no account is configured or the call fails."""
+        if not (const.SM_EMAIL and const.SM_PASSWORD):
+            return False
+        body = {
+            "appSecret": const.SM_APP_SECRET,
+            "email": const.SM_EMAIL,
+            "password": hashlib.sha256(const.SM_PASSWORD.encode()).hexdigest(),
+        }
+        self.limiter.acquire()
+        response = self.session.post(f"{const.SM_TOKEN_URL}?appId={const.SM_APP_ID}&language=en", data=json.dumps(body), timeout=self.timeout)
+        res = response.json()
+        if not res.get("success") or "access_token" not in res:
+            logger.error(f"SolarMan token refresh ERROR: {response.text}")
+            return False
+        self.token = res["access_token"]
+        self.token_expires = time.time() + int(res.get("expires_in") or 0)
+        return True
+
+    def bearer(self, stale=None):
+        """Returns the current token, refreshed first if it expires within the hour or `stale` was rejected."""
+        with self.token_lock:
+            if stale is not None and stale == self.token:
+                self.refresh_token()
+            elif self.token_expires is not None and time.time() > self.token_expires - 3600:
+                self.refresh_token()
+            return self.token
+
+    def throttled(self, response):
+        """True when an HTTP 200 response carries the API's own throttling error."""
+        if response.status_code != 200:
+            return False
+        try:
+            body = response.json()
+        except ValueError:
+            return False
+        if not isinstance(body, dict) or body.get("success", True):
+            return False
+        msg = str(body.get("msg") or "").lower()
+        return str(body.get("code")) in self.THROTTLE_CODES or any(word in msg for word in self.THROTTLE_MSGS)
+
+    def post(self, url, payload):
+        """
+        POSTs a JSON payload.
+
+        Returns the last requests.Response, callers check status and "success" as before.
+        Throttled calls (HTTP 429 or the API's throttling error), transient server errors, connection
+        errors and timeouts are retried up to `retries` times, a rejected token is refreshed once.
+        The last connection error is raised when every attempt failed.
+        """
+        refreshed = False
+        for attempt in range(self.retries + 1):
+            token = self.bearer()
+            self.limiter.acquire()
+            try:
+                response = self.session.post(url, data=payload, headers={"Authorization": f"Bearer {token}"},
+                                             timeout=self.timeout)
+            except requests.RequestException as e:
+                if attempt == self.retries:
+                    raise
+                status, response = type(e).__name__, None
+            else:
+                if response.status_code == 401 and not refreshed:
+                    refreshed = True
+                    self.bearer(stale=token)
+                    continue
+                retry = response.status_code in self.RETRY_STATUS or self.throttled(response)
+                if not retry or attempt == self.retries:
+                    return response
+                status = response.status_code
+            delay = self.backoff * 2 ** attempt
+            retry_after = response.headers.get("Retry-After") if response is not None else None
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            time.sleep(random.uniform(delay / 2, delay))
+            logger.warning(f"SolarMan {status}, retry {attempt + 1} in up to {delay:.1f}s: {url}")
+        return response
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the module wide SolarmanClient, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SolarmanClient()
+        return _client
+
+
+def inverter_days_to_fetch(sns, start_date, db_eng, default_days=4):
+    """
+    Lists the (serial, day) requests needed to bring every inverter up to start_date.
+
+    The latest stored ts of all inverters is read in one query. An inverter without data gets
+    default_days days. The list is ordered newest day first, across inverters, so a concurrent
+    fetch spreads over the fleet instead of walking one inverter at a time.
+
+    Returns:
+        tuple: ([(sn, day), ...], None) or (None, error).
+    """
+    if not sns:
+        return [], None
+    sn_list = ", ".join(f"'{sn}'" for sn in sns)
+    res, err = db.sql_execute(f"""
+        SELECT sn, (SELECT max(ts) FROM solarman.inverter_data WHERE device_sn = sn)
+        FROM unnest(ARRAY[{sn_list}]::text[]) AS sn;""", db_eng)
+    if err:
+        return None, err
+    work = []
+    for sn, last_ts in res:
+        days = (start_date - last_ts.date()).days + 1 if last_ts else default_days
+        work.extend((sn, start_date - timedelta(days=i)) for i in range(max(days, 1)))
+    work.sort(key=lambda item: (item[1], item[0]), reverse=True)
+    return work, None
+
+
+def ingest_inverter_fleet(sns, start_date, db_eng, type=1, concurrency=None, rate=None, batch=8, logger=logger,
+                          work=None, on_written=None):
+    """
+    Fetches and stores inverter data for many inverters and days concurrently.
+
+    Day requests run in a thread pool of `concurrency` workers and share one SolarmanClient
+    (session, token and RateLimiter), so the fleet is fetched at the permitted API rate. Fetched
+    days go to a bounded queue, one writer thread drains it and upserts up to `batch` days per
+    insert_inverter_data call, the DB never holds up an API call.
+
+    Args:
+        sns (list): Inverter serial numbers.
+        start_date (date): Newest day to fetch, older days are added back to the last stored ts.
+        db_eng: A SQLAlchemy database engine instance.
+        concurrency (int, optional): Defaults to const.SM_API_MAX_CONCURRENCY.
+        rate (float, optional): Requests per second, defaults to const.SM_API_RATE.
+        batch (int): Maximum days written per upsert.
+        work (list, optional): (sn, day) pairs to fetch in this order instead of inverter_days_to_fetch.
+        on_written (callable, optional): Called from the writer thread with the [(sn, day, rows), ...]
+            of every successful upsert.
+
+    Returns:
+        tuple: ([(sn, day, rows written, error), ...], None) or (None, error) if the plan could not be made.
+    """
+    if work is None:
+        work, err = inverter_days_to_fetch(sns, start_date, db_eng)
+        if err:
+            return None, err
+    client = get_client() if rate is None and concurrency is None else SolarmanClient(rate=rate, concurrency=concurrency)
+    workers = concurrency or const.SM_API_MAX_CONCURRENCY
+    # bounded so fetchers wait for the writer instead of holding every fetched day in memory
+    fetched = queue.Queue(maxsize=2 * max(workers, batch))
+    results = []
+
+    def write(items):
+        rows = [row for _, _, data in items for row in data]
+        res, err = err_handler.error_wrapper(lambda: insert_inverter_data(db_eng, rows) if rows else (0, None))
+        if not err and res:
+            res, err = res
+        for sn, day, data in items:
+            results.append((sn, day, len(data), err))
+        if err:
+            logger.error(f"Insert inverter data ERROR: {err}")
+        elif on_written:
+            on_written([(sn, day, len(data)) for sn, day, data in items])
+
+    def writer():
+        done = False
+        while not done:
+            items = [fetched.get()]
+            while len(items) < batch and not fetched.empty():
+                items.append(fetched.get())
+            if None in items:
+                done = True
+                items = [item for item in items if item is not None]
+            if items:
+                write(items)
+
+    def fetch(sn, day):
+        res, err = err_handler.error_wrapper(lambda: fetch_inverter_day(sn, day, type, client))
+        if not err:
+            res, err = res
+        if err:
+            logger.error(f"Error fetching data for SN {sn} {day}: {err}")
+            results.append((sn, day, 0, err))
+            return
+        logger.info(f"SN: {sn} |  date: {day} | # rows: {len(res)}")
+        fetched.put((sn, day, res))
+
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    writer_thread.start()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda item: fetch(*item), work))
+    fetched.put(None)
+    writer_thread.join()
+    return results, None
+
+
+# 5 minute readings a stored day needs to count as complete without a backfill record, 22 of 24 hours
+DAY_COMPLETE_ROWS = 264
+
+SQL_SM_BACKFILL_TABLE = """
+CREATE TABLE IF NOT EXISTS solarman.inverter_backfill (
+    device_sn varchar(25) NOT NULL,
+    day date NOT NULL,
+    rows integer NOT NULL,
+    complete boolean NOT NULL,
+    updated timestamp NOT NULL DEFAULT now(),
+    PRIMARY KEY (device_sn, day)
+);
+SELECT 1;
+"""
+
+
+def inverter_backfill_plan(sns, from_date, to_date, db_eng, min_rows=DAY_COMPLETE_ROWS):
+    """
+    Lists the (serial, day) pairs between from_date and to_date that still have to be fetched.
+
+    A day is done when solarman.inverter_backfill marks it complete or solarman.inverter_data
+    already holds min_rows readings for it, so days loaded before the progress table existed
+    are not fetched again. Both are read in one query.
+
+    Returns:
+        tuple: ([(sn, day), ...] newest day first, None) or (None, error).
+    """
+    if not sns:
+        return [], None
+    sn_list = ", ".join(f"'{sn}'" for sn in sns)
+    res, err = db.sql_execute(SQL_SM_BACKFILL_TABLE, db_eng)
+    if err:
+        return None, err
+    res, err = db.sql_execute(f"""
+        WITH days AS (
+            SELECT sn, d::date AS day
+            FROM unnest(ARRAY[{sn_list}]::text[]) AS sn,
+                generate_series('{to_date}'::date, '{from_date}'::date, INTERVAL '-1 day') AS d
+        )
+        SELECT days.sn, days.day
+        FROM days
+        LEFT JOIN solarman.inverter_backfill b ON b.device_sn = days.sn AND b.day = days.day AND b.complete
+        WHERE b.device_sn IS NULL
+        AND (SELECT count(*) FROM solarman.inverter_data i
+             WHERE i.device_sn = days.sn AND i.ts >= days.day AND i.ts < days.day + 1) < {min_rows}
+        ORDER BY days.day DESC, days.sn DESC;""", db_eng)
+    if err:
+        return None, err
+    return [(sn, day) for sn, day in res], None
+
+
+def db_record_inverter_backfill(db_eng, done, min_rows=DAY_COMPLETE_ROWS):
+    """
+    Stores the fetched (serial, day, rows) in solarman.inverter_backfill.
+
+    A day before today (UTC) with at least min_rows readings is complete. Today's data is still
+    growing, and an empty or partial past day may be an API hiccup, so both are fetched again.
+    """
+    if not done:
+        return 0, None
+    today = datetime.now(timezone.utc).date()
+    values = ", ".join(
+        f"('{sn}', '{day}', {rows}, {str(day < today and rows >= min_rows).lower()})" for sn, day, rows in done
+    )
+    return db.sql_execute(f"""
+        INSERT INTO solarman.inverter_backfill (device_sn, day, rows, complete)
+        VALUES {values}
+        ON CONFLICT (device_sn, day) DO UPDATE
+        SET rows = EXCLUDED.rows, complete = EXCLUDED.complete, updated = now()
+        RETURNING 1;""", db_eng)
+
+
+def backfill_inverters(sns, from_date, db_eng, to_date=None, min_rows=DAY_COMPLETE_ROWS, logger=logger, **kwargs):
+    """
+    Fetches every missing inverter day between from_date and to_date, newest first.
+
+    The plan comes from inverter_backfill_plan and runs through ingest_inverter_fleet. Each
+    written batch is recorded in solarman.inverter_backfill, so a re-run or a restart after a
+    crash only fetches the days that are still missing.
+
+    Args:
+        sns (list): Inverter serial numbers.
+        from_date (date): Oldest day to backfill.
+        db_eng: A SQLAlchemy database engine instance.
+        to_date (date, optional): Newest day, defaults to today (UTC).
+        min_rows (int): Stored readings that make a day complete.
+        **kwargs: Passed to ingest_inverter_fleet (type, concurrency, rate, batch).
+
+    Returns:
+        tuple: ([(sn, day, rows written, error), ...], None) or (None, error).
+    """
+    to_date = to_date or datetime.now(timezone.utc).date()
+    work, err = inverter_backfill_plan(sns, from_date, to_date, db_eng, min_rows)
+    if err:
+        return None, err
+    logger.info(f"SolarMan backfill {from_date} - {to_date}: {len(work)} inverter days to fetch")
+
+    def record(done):
+        res, err = db_record_inverter_backfill(db_eng, done, min_rows)
+        if err:
+            logger.error(f"db_record_inverter_backfill ERROR: {err}")
+
+    return ingest_inverter_fleet(sns, to_date, db_eng, logger=logger, work=work, on_written=record, **kwargs)
+
+
 def transform_station_data(station):
     """Convert JSON keys to match DB column names and handle timestamps."""
     return {
@@ -1070,19 +1586,5 @@ def upsert_stations(stations_data, db_eng=None):
     if db_eng is None:
         db_eng = db.set_local_defaultdb_engine()
     transformed_data = [transform_station_data(st) for st in stations_data]
-
-    stmt = insert(models.Station).values(transformed_data)
-
-    update_columns = {
-        col.name: getattr(stmt.excluded, col.name)
-        for col in models.Station.__table__.columns
-        # if col.name not in ("id",)  # Exclude primary key
-    }
-
-    upsert_stmt = stmt.on_conflict_do_update(
-        index_elements=["name"], set_=update_columns  # Unique constraint field
-    )
-    # Session = sessionmaker(bind=db_eng)
-    session = Session(db_eng)
-    session.execute(upsert_stmt)
-    session.commit()
+    # name is the unique key the API is matched on, the id follows it
+    return models.db_bulk_upsert(db_eng, models.Station, transformed_data, ["name"])
@@ -15,7 +15,7 @@ def get_previous_midnight_epoch(epoch: int = None) -> int:
     return last_midnight_epoch
 
 
-def app_init(mods, log_file, version, mpath=const.MOD_PATH, level="INFO", override=True, quiet=True):
+def app_init(mods, log_file, version, mpath=None, level="INFO", override=True, quiet=True, lazy=False):
     """
     Initialize the application by setting up logging, checking the module version,
     and optionally importing local libraries for testing.
@@ -34,6 +34,9 @@ def app_init(mods, log_file, version, mpath=const.MOD_PATH, level="INFO", overri
         The logging level, by default 'INFO'.
     override : bool, optional
         If True, existing log handlers will be cleared and new ones set up, by default False.
+    lazy : bool, optional
+        If True the settings are not loaded here, local libraries are only imported when they already
+        are. Used by the unhcr modules at import, by default False.
 
     Returns
     -------
@@ -64,8 +67,8 @@ def app_init(mods, log_file, version, mpath=const.MOD_PATH, level="INFO", overri
             )
             exit(int(version.replace(".", "")))
 
-        if const.LOCAL:  # testing with local python files
-            return const.import_local_libs(mpath=mpath, mods=mods, logger=logger)
+        if (not lazy or const.is_loaded()) and const.LOCAL:  # testing with local python files
+            return const.import_local_libs(mpath=mpath or const.MOD_PATH, mods=mods, logger=logger)
     except Exception as e:
         logger.error(f"app_utils ERROR: {e}")
     return (logger,)
\ No newline at end of file
@@ -23,7 +23,8 @@ Dynamic Module Loading:
     promoting a modular code structure.
 Initialization: 
     The load_env and set_environ functions load the environment variables and populate the constants, respectively. 
-    The env_cmdline_parser function allows specifying a different .env file via command-line arguments.
+    load runs them once, on the first access of a constant, with the .env file given by the --env command-line argument.
+    Importing the module parses no command line and reads no .env file.
 """
 
 from datetime import datetime
@@ -36,72 +37,84 @@ import sys
 
 from unhcr import utils
 
-# Define constants
-PROD = None
-DEBUG = None
-LOCAL = None
-AZURE_URL = None
-MOD_PATH = None
+# Define constants, annotated only: they are bound by set_environ when load runs on first access
+PROD: bool
+DEBUG: bool
+LOCAL: bool
+AZURE_URL: str
+MOD_PATH: str
 
 # Leonics API
-LEONICS_BASE_URL = None
-LEONICS_USER_CODE = None
-LEONICS_KEY = None
+LEONICS_BASE_URL: str
+LEONICS_USER_CODE: str
+LEONICS_KEY: str
 
 # Verify SSL --- note that leonic's cert does not verify
-VERIFY = None
+VERIFY: bool
 
 # Prospect DB
-PROS_CONN_LOCAL_STR = None
-PROS_CONN_AZURE_STR = None
+PROS_CONN_LOCAL_STR: str
+PROS_CONN_AZURE_STR: str
+PROS_PUSH_BATCH_SIZE: int
+PROS_PUSH_CONCURRENCY: int
 
 # Aiven Mysql DB
-TAKUM_RAW_CONN_STR = None
-LEONICS_RAW_TABLE = None
+TAKUM_RAW_CONN_STR: str
+LEONICS_RAW_TABLE: str
 
 # Fuel DB
-AIVEN_FUEL_DB_CONN_STR=None
-AZURE_FUEL_DB_CONN_STR=None
+AIVEN_FUEL_DB_CONN_STR: str
+AZURE_FUEL_DB_CONN_STR: str
 
 # DB connection pool
-SQLALCHEMY_POOL_SIZE = None
-SQLALCHEMY_POOL_TIMEOUT = None
-SQLALCHEMY_POOL_RECYCLE = None
-SQLALCHEMY_MAX_OVERFLOW = None
+SQLALCHEMY_POOL_SIZE: int
+SQLALCHEMY_POOL_TIMEOUT: int
+SQLALCHEMY_POOL_RECYCLE: int
+SQLALCHEMY_MAX_OVERFLOW: int
 
 # Eyedro S3
-ACCESS_KEY = None
-SECRET_KEY = None
-BUCKET_NAME = None
-FOLDER_NAME = None
+ACCESS_KEY: str
+SECRET_KEY: str
+BUCKET_NAME: str
+FOLDER_NAME: str
 
 # Eyedro API
-GB_API_V1_API_BASE_URL=None
-GB_API_V1_GET_DATA=None
-GB_API_V1_EMPTY_KEY=None
-GB_API_V1_GET_DEVICE_LIST=None
-GB_API_V1_USER_KEY=None
+GB_API_V1_API_BASE_URL: str
+GB_API_V1_GET_DATA: str
+GB_API_V1_EMPTY_KEY: str
+GB_API_V1_GET_DEVICE_LIST: str
+GB_API_V1_USER_KEY: str
+GB_API_MAX_CONCURRENCY: int
+GB_API_TIMEOUT: int
+GB_LONG_TABLE: bool
+GB_COMPRESS_AFTER: str
+GB_RAW_RETENTION: str
 
 # Prospect API
-BASE_URL = None
-API_IN_KEY = None
-API_OUT_KEY = None
+BASE_URL: str
+API_IN_KEY: str
+API_OUT_KEY: str
 
 # if your running a local instance of Prospect
-LOCAL_BASE_URL = None
-AZURE_BASE_URL = None
-LOCAL_API_IN_KEY = None
-AZURE_API_IN_KEY = None
-LOCAL_API_OUT_KEY = None
+LOCAL_BASE_URL: str
+AZURE_BASE_URL: str
+LOCAL_API_IN_KEY: str
+AZURE_API_IN_KEY: str
+LOCAL_API_OUT_KEY: str
 
 # SOLARMAN NIGERIA
-SM_APP_ID = None
-SM_APP_SECRET = None
+SM_APP_ID: str
+SM_APP_SECRET: str
 # token will expire every 2 months
-SM_BIZ_ACCESS_TOKEN = None
-SM_URL = None
-SM_TOKEN_URL = None
-SM_HISTORY_URL = None
+SM_BIZ_ACCESS_TOKEN: str
+SM_URL: str
+SM_TOKEN_URL: str
+SM_HISTORY_URL: str
+SM_API_MAX_CONCURRENCY: int
+SM_API_RATE: float
+SM_WEATHER_MAX_CATCHUP_DAYS: int
+SM_EMAIL: str
+SM_PASSWORD: str
 
 environ_path = None
 
@@ -141,6 +154,10 @@ def set_environ():  # sourcery skip: extract-duplicate-method
         Connection string for local instance of Prospect data_custom table
     PROS_CONN_AZURE_STR: str
         Connection string for Azure instance of Prospect data_custom table.
+    PROS_PUSH_BATCH_SIZE : int
+        Rows per gzip compressed POST when pushing Leonics rows to Prospect.
+    PROS_PUSH_CONCURRENCY : int
+        Maximum number of Prospect push batches in flight.
     TAKUM_RAW_CONN_STR : str
         Connection string for Aiven MySQL database Leonics raw data.
     LEONICS_RAW_TABLE : str
@@ -175,6 +192,17 @@ def set_environ():  # sourcery skip: extract-duplicate-method
         Endpoint for getting device list from GB API v1.
     GB_API_V1_USER_KEY : str
         User key for GB API v1.
+    GB_API_MAX_CONCURRENCY : int
+        Maximum number of in-flight GB API v1 day requests across all serials.
+    GB_API_TIMEOUT : int
+        Timeout in seconds for a single GB API v1 day request.
+    GB_LONG_TABLE : bool
+        Write Eyedro minute data to the consolidated eyedro.gb_1min hypertable instead of eyedro.gb_{serial}.
+    GB_COMPRESS_AFTER : str
+        Age after which Eyedro hypertable chunks are compressed, a Postgres interval e.g. '3 months'. None (default)
+        leaves compression off.
+    GB_RAW_RETENTION : str
+        Age after which raw Eyedro minute chunks are dropped, e.g. '730 days'. None keeps all raw data.
     BASE_URL : str
         Base URL for Prospect API.
     API_IN_KEY : str
@@ -203,6 +231,16 @@ def set_environ():  # sourcery skip: extract-duplicate-method
         URL for obtaining SOLARMAN NIGERIA token.
     SM_HISTORY_URL : str
         URL for accessing SOLARMAN NIGERIA historical data.
+    SM_API_MAX_CONCURRENCY : int
+        Maximum number of in-flight SOLARMAN API requests.
+    SM_API_RATE : float
+        Maximum SOLARMAN API requests per second across all threads.
+    SM_WEATHER_MAX_CATCHUP_DAYS : int
+        Oldest day, counted back from today, a weather station catches up to in one run.
+    SM_EMAIL : str
+        SOLARMAN account e-mail, with SM_PASSWORD used to refresh the bearer token. None keeps SM_BIZ_ACCESS_TOKEN.
+    SM_PASSWORD : str
+        SOLARMAN account password.
     """
 
     global PROD
@@ -218,6 +256,8 @@ def set_environ():  # sourcery skip: extract-duplicate-method
 
     global PROS_CONN_LOCAL_STR
     global PROS_CONN_AZURE_STR
+    global PROS_PUSH_BATCH_SIZE
+    global PROS_PUSH_CONCURRENCY
     global TAKUM_RAW_CONN_STR
     global LEONICS_RAW_TABLE
     global AIVEN_FUEL_DB_CONN_STR
@@ -238,6 +278,11 @@ def set_environ():  # sourcery skip: extract-duplicate-method
     global GB_API_V1_EMPTY_KEY
     global GB_API_V1_GET_DEVICE_LIST
     global GB_API_V1_USER_KEY
+    global GB_API_MAX_CONCURRENCY
+    global GB_API_TIMEOUT
+    global GB_LONG_TABLE
+    global GB_COMPRESS_AFTER
+    global GB_RAW_RETENTION
 
     global BASE_URL
     global API_IN_KEY
@@ -255,6 +300,11 @@ def set_environ():  # sourcery skip: extract-duplicate-method
     global SM_URL
     global SM_TOKEN_URL
     global SM_HISTORY_URL
+    global SM_API_MAX_CONCURRENCY
+    global SM_API_RATE
+    global SM_WEATHER_MAX_CATCHUP_DAYS
+    global SM_EMAIL
+    global SM_PASSWORD
 
     PROD = os.getenv("PROD", "PROD missing") == "1"
     DEBUG = os.getenv("DEBUG", "DEBUG missing") == "1"
@@ -294,6 +344,8 @@ def set_environ():  # sourcery skip: extract-duplicate-method
     PROS_CONN_AZURE_STR = os.getenv(
         "PROS_CONN_AZURE_STR", "PROS_CONN_AZURE_STR missing"
     )
+    PROS_PUSH_BATCH_SIZE = int(os.getenv("PROS_PUSH_BATCH_SIZE") or 5000)
+    PROS_PUSH_CONCURRENCY = int(os.getenv("PROS_PUSH_CONCURRENCY") or 1)
     
 
     # Aiven Mysql DB
@@ -310,18 +362,10 @@ def set_environ():  # sourcery skip: extract-duplicate-method
         "AZURE_FUEL_DB_CONN_STR", "AZURE_FUEL_DB_CONN_STR missing"
     )
 
-    SQLALCHEMY_POOL_SIZE = int(
-        os.getenv("SQLALCHEMY_POOL_SIZE", "SQLALCHEMY_POOL_SIZE missing") or 5
-    )
-    SQLALCHEMY_POOL_TIMEOUT = int(
-        os.getenv("SQLALCHEMY_POOL_TIMEOUT", "SQLALCHEMY_POOL_TIMEOUT missing") or 30
-    )
-    SQLALCHEMY_POOL_RECYCLE = int(
-        os.getenv("SQLALCHEMY_POOL_RECYCLE", "SQLALCHEMY_POOL_RECYCLE missing") or 3600
-    )
-    SQLALCHEMY_MAX_OVERFLOW = int(
-        os.getenv("SQLALCHEMY_MAX_OVERFLOW", "SQLALCHEMY_MAX_OVERFLOW missing") or 10
-    )
+    SQLALCHEMY_POOL_SIZE = int(os.getenv("SQLALCHEMY_POOL_SIZE") or 5)
+    SQLALCHEMY_POOL_TIMEOUT = int(os.getenv("SQLALCHEMY_POOL_TIMEOUT") or 30)
+    SQLALCHEMY_POOL_RECYCLE = int(os.getenv("SQLALCHEMY_POOL_RECYCLE") or 3600)
+    SQLALCHEMY_MAX_OVERFLOW = int(os.getenv("SQLALCHEMY_MAX_OVERFLOW") or 10)
 
     # Eyedro S3
     ACCESS_KEY = os.getenv("GB_AWS_ACCESS_KEY", "GB_AWS_ACCESS_KEY missing")
@@ -335,6 +379,11 @@ def set_environ():  # sourcery skip: extract-duplicate-method
     GB_API_V1_EMPTY_KEY = os.getenv("GB_API_V1_EMPTY_KEY", "GB_API_V1_EMPTY_KEY missing")
     GB_API_V1_GET_DEVICE_LIST = os.getenv("GB_API_V1_GET_DEVICE_LIST", "GB_API_V1_GET_DEVICE_LIST missing")
     GB_API_V1_USER_KEY = os.getenv("GB_API_V1_USER_KEY", "GB_API_V1_USER_KEY missing")
+    GB_API_MAX_CONCURRENCY = int(os.getenv("GB_API_MAX_CONCURRENCY") or 20)
+    GB_API_TIMEOUT = int(os.getenv("GB_API_TIMEOUT") or 600)
+    GB_LONG_TABLE = os.getenv("GB_LONG_TABLE", "0") == "1"
+    GB_COMPRESS_AFTER = os.getenv("GB_COMPRESS_AFTER") or None
+    GB_RAW_RETENTION = os.getenv("GB_RAW_RETENTION") or None
 
     # Prospect API
     BASE_URL = os.getenv("PROS_BASE_URL", "PROS_BASE_URL missing")
@@ -365,6 +414,11 @@ def set_environ():  # sourcery skip: extract-duplicate-method
     SM_URL = os.getenv("SM_URL", "SM_URL missing")
     SM_TOKEN_URL = f"{SM_URL}/account/v1.0/token"
     SM_HISTORY_URL = f"{SM_URL}/device/v1.0/historical?language=en"
+    SM_API_MAX_CONCURRENCY = int(os.getenv("SM_API_MAX_CONCURRENCY") or 8)
+    SM_API_RATE = float(os.getenv("SM_API_RATE") or 5)
+    SM_WEATHER_MAX_CATCHUP_DAYS = int(os.getenv("SM_WEATHER_MAX_CATCHUP_DAYS") or 30)
+    SM_EMAIL = os.getenv("SM_EMAIL") or None
+    SM_PASSWORD = os.getenv("SM_PASSWORD") or None
 
     if utils.is_running_on_azure():
         PROS_CONN_AZURE_STR = PROS_CONN_LOCAL_STR.replace(AZURE_URL, "localhost")
@@ -477,14 +531,62 @@ def env_cmdline_parser():
         return None
 
 
-# loads environment variables and sets constants
-args = utils.create_cmdline_parser()
-if args is None:
-    exit(999)
-res = load_env(args.env)
-if res is None:
-    print("No .env file found or could not be loaded")
-    exit(999)
+_loaded = False
+
+
+def env_arg(argv=None, default=".env"):
+    """Returns the --env command line value, other arguments (pytest, flask, alembic ...) are ignored."""
+    argv = sys.argv[1:] if argv is None else argv
+    for i, arg in enumerate(argv):
+        if arg.startswith("--env="):
+            return arg.split("=", 1)[1]
+        if arg == "--env" and i + 1 < len(argv):
+            return argv[i + 1]
+    return default
+
+
+def load(path=None):
+    """
+    Loads the .env file and sets the constants, once.
+
+    Runs on the first access of a constant (see __getattr__), so importing unhcr or one of its
+    modules parses no command line and reads no .env file until a setting is needed.
+
+    Parameters
+    ----------
+    path : str, optional
+        The .env file, by default the --env command line value, else ".env". An explicit path
+        always (re)loads.
+
+    Returns
+    -------
+    str or None
+        The .env path without the extension, or None when no .env file was found. The constants
+        are then set from the process environment.
+    """
+    global _loaded
+    if _loaded and path is None:
+        return environ_path[:-4] if environ_path else None
+    _loaded = True
+    path = path or env_arg()
+    res = load_env(path)
+    if res is None:
+        print(f"No .env file found at {path}, using the process environment")
+        set_environ()
+    return res
+
+
+def is_loaded():
+    """True once load has run."""
+    return _loaded
+
+
+def __getattr__(name):
+    # the annotated constants are unbound until load runs
+    if name in __annotations__ and not _loaded:
+        load()
+        return globals().get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 MODULES = [
     ["models", "models"],
@@ -501,7 +603,7 @@ MODULES = [
 ]
 
 
-def import_local_libs(mods=MODULES, mpath=MOD_PATH,  logger=None):
+def import_local_libs(mods=MODULES, mpath=None,  logger=None):
     """
     Dynamically imports local modules from the specified local directory, allowing their functions and variables to be accessed globally by assigning them to the globals() dictionary.
 
@@ -523,6 +625,8 @@ def import_local_libs(mods=MODULES, mpath=MOD_PATH,  logger=None):
     -----
     This function dynamically imports modules from the specified local directory, allowing their functions and variables to be accessed globally by assigning them to the globals() dictionary.
     """
+    load()
+    mpath = mpath or MOD_PATH
     loaded_modules = []
     if not logger:
         logger = utils.log_setup('unhcr.constants.log')
@@ -605,6 +709,21 @@ else:
     TOP20_ONEDRIVE_PATH = r"E:\UNHCR\OneDrive - UNHCR\Green Data Team\07 Greenbox Management\Green Box daily tracing sheet 2025.xlsx"
 
 GB_GAPS_TABLE = "eyedro.gb_1min_gaps"
+GB_1MIN_TABLE = "eyedro.gb_1min"
+GB_COVERAGE_TABLE = "eyedro.gb_ingest_coverage"
+
+# one row per serial per UTC day: status 0 = confirmed empty, 1 = partial, 2 = fully ingested
+SQL_GB_COVERAGE_TABLE = f"""
+        CREATE TABLE IF NOT EXISTS {GB_COVERAGE_TABLE} (
+            serial TEXT NOT NULL,
+            day DATE NOT NULL,
+            status SMALLINT NOT NULL,
+            samples INT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ DEFAULT now(),
+            CONSTRAINT gb_ingest_coverage_pkey PRIMARY KEY (serial, day)
+        );
+        SELECT count(*) FROM {GB_COVERAGE_TABLE};
+    """
 
 SQL_GB_GAPS_DELETE = f"""
         DELETE FROM {GB_GAPS_TABLE} t1
@@ -632,6 +751,8 @@ SQL_GB_GAPS_TABLE = f"""
             start_ts TIMESTAMPTZ,
             end_ts TIMESTAMPTZ,
             deleted boolean DEFAULT false,
+            resolved_at TIMESTAMPTZ,
+            unrecoverable boolean DEFAULT false,
             CONSTRAINT gb_gaps_epoch_secs_prev_epoch_key UNIQUE (hypertable_name, epoch_secs, prev_epoch, deleted)
         );
         CREATE OR REPLACE FUNCTION {GB_GAPS_TABLE}()
@@ -651,3 +772,32 @@ SQL_GB_GAPS_TABLE = f"""
         FROM information_schema.columns
         WHERE table_name = '{GB_GAPS_TABLE}';
     """
+# gap backfill bookkeeping for tables created before the columns existed
+SQL_GB_GAPS_RESOLUTION = f"""
+        ALTER TABLE {GB_GAPS_TABLE} ADD COLUMN IF NOT EXISTS resolved_at TIMESTAMPTZ;
+        ALTER TABLE {GB_GAPS_TABLE} ADD COLUMN IF NOT EXISTS unrecoverable boolean DEFAULT false;
+        SELECT count(*) FROM {GB_GAPS_TABLE} WHERE resolved_at IS NULL AND NOT unrecoverable;
+    """
+# open holes (diff > 60s) expanded to the UTC days holding the missing minutes
+SQL_GB_GAP_DAYS = f"""
+        -- serial as gb_eyedro.gb_serial_key, the coverage key
+        SELECT DISTINCT upper(replace(g.hypertable_name, 'gb_', '')) AS serial,
+            extract(epoch from d)::bigint AS day_epoch
+        FROM {GB_GAPS_TABLE} g
+        CROSS JOIN LATERAL generate_series(
+            date_trunc('day', to_timestamp(g.prev_epoch + 60) AT TIME ZONE 'UTC'),
+            date_trunc('day', to_timestamp(g.epoch_secs - 60) AT TIME ZONE 'UTC'),
+            interval '1 day') AS d
+        WHERE g.resolved_at IS NULL AND NOT g.unrecoverable AND g.deleted IS NOT TRUE AND g.diff_seconds > 60
+        ORDER BY 1, 2 DESC;
+    """
+GB_GAPS_WATERMARK_TABLE = "eyedro.gb_1min_gaps_watermark"
+# last epoch_secs scanned for gaps per hypertable
+SQL_GB_GAPS_WATERMARK_TABLE = f"""
+        CREATE TABLE IF NOT EXISTS {GB_GAPS_WATERMARK_TABLE} (
+            hypertable_name TEXT PRIMARY KEY,
+            last_epoch BIGINT NOT NULL,
+            updated_at TIMESTAMPTZ DEFAULT now()
+        );
+        SELECT hypertable_name, last_epoch FROM {GB_GAPS_WATERMARK_TABLE};
+    """
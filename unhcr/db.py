@@ -3,24 +3,24 @@ Overview
     This script db.py manages database interactions for energy monitoring data. It connects to a DB database using
     SQLAlchemy and interacts with a Prospect API. The primary functions handle updating both the database and the API
     with new data, managing duplicates, and logging errors. Connection pooling is used for database efficiency.
-    A critical vulnerability exists: the update_rows function is susceptible to SQL injection.
 
 Key Components
 sql_execute(sql, engine=default_engine, data=None):
     Executes SQL queries against the DB database. Handles session management and utilizes connection pooling.
-    Important: Vulnerable to SQL injection in update_rows due to string formatting.
 
 db_update_leonics(max_dt, df, table_name, key='DatetimeServer'):
     Orchestrates the database update process. Retrieves the latest timestamp from the database, filters new data from the
     input DataFrame, and inserts the new data into the specified table. Includes error handling.
 
-update_rows(max_dt, df, table_name, key="DateTimeServer"):
-    Inserts new data into the DB database. Filters the DataFrame, formats data, and performs a bulk INSERT with an
-    ON DUPLICATE KEY UPDATE clause. The ON DUPLICATE KEY UPDATE clause is excessively long and should be refactored.
+update_rows(max_dt, df, eng):
+    Upserts new Leonics rows. Filters the DataFrame, COPYs it into a temporary staging table and merges it with one
+    INSERT ... ON CONFLICT (datetimeserver) DO UPDATE statement.
 
-update_prospect(start_ts=None, local=True, table_name=const.LEONICS_RAW_TABLE):
-    Manages updates to the Prospect API. Retrieves the latest timestamp from Prospect, queries the database for newer records,
-    and sends them to the API. This function could benefit from being broken down into smaller, more manageable functions.
+update_prospect(eng, start_ts=None, local=None) & push_prospect(eng, start_ts, local, batch_size, concurrency):
+    Manages updates to the Prospect API. Streams the rows Prospect has not received with a server-side cursor and sends
+    them in gzip compressed batches, optionally concurrently. Each batch is recorded in prospect_push_batches, the
+    durable record: failed batches are retried alone, and each sent batch moves the per-target prospect_watermark the
+    next run resumes from (read with a primary key lookup by push_prospect).
 
 set_db_engine(connection_string):
     Creates and returns a SQLAlchemy engine with connection pooling for efficient database access. Pool parameters are
@@ -56,6 +56,9 @@ WIP backfill_prospect(start_ts=None, local=True) & prospect_backfill_key(func, s
 
 from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import functools
+import io
 import logging
 import math
 import os
@@ -79,9 +82,9 @@ mods=[
     ["api_prospect", "api_prospect"],
 ]
 
-res = app_utils.app_init(mods=mods, log_file="unhcr.db.log", version="0.4.8", level="INFO", override=False)
+res = app_utils.app_init(mods=mods, log_file="unhcr.db.log", version="0.4.8", level="INFO", override=False, lazy=True)
 logger = res[0]
-if const.LOCAL:  # testing with local python files
+if len(res) > 1:  # testing with local python files
     logger, app_utils, const, utils, api_leonics, api_prospect = res
 
 default_engine = None
@@ -200,11 +203,29 @@ def get_db_session(eng):
         Session.remove()  # Remove the session from the scoped session registry
 
 
+# parsed TextClause per short SQL string, repeated queries skip re-parsing and share SQLAlchemy's compiled cache
+_text = functools.lru_cache(maxsize=512)(text)
+SQL_TEXT_CACHE_MAX_LEN = 4096
+
+
+def sql_echo(stmt, data=None):
+    """Renders stmt with its parameters inlined, for debug logs only."""
+    try:
+        if data:
+            stmt = stmt.bindparams(**data)
+        return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    except Exception:
+        return f"{stmt} {data}"
+
+
 def sql_execute(sql, engine=default_engine, data=None):
     # If no engine is provided, raise an error or use a default
     """
     Execute a SQL query against the DB database using a provided engine.
 
+    The statement runs on a pooled connection with data as bound parameters, so the driver and
+    SQLAlchemy statement caches apply. The SQL text is only rendered when DEBUG logging is on.
+
     :param str sql: A SQL query string
     :param engine: A SQLAlchemy engine
     :param data: Optional data to be passed as parameters to the query
@@ -213,40 +234,17 @@ def sql_execute(sql, engine=default_engine, data=None):
     if engine is None:
         raise ValueError("Database engine must be provided")
 
-    # Assuming get_db_session is defined correctly elsewhere
-    #####with get_db_session(engine) as session:
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    ######session.execute(text("SET search_path TO solarman;"))
+    stmt = _text(sql) if len(sql) <= SQL_TEXT_CACHE_MAX_LEN else text(sql)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(sql_echo(stmt, data))
     try:
-        if data:
-            stmt = text(sql).bindparams(**data)
-        else:
-            stmt = text(sql)
-
-        compiled = stmt.compile(
-            dialect=postgresql.dialect(),
-            compile_kwargs={"literal_binds": True}
-        )
-
-        print(str(compiled))
-        logger.debug(compiled)
-        
-        # Use SQLAlchemy's execute method
-        result = session.execute(text(sql), params=data)
-
-        # If it's a SELECT query, fetch results
-        # if sql.strip().upper().startswith("SELECT"):
-        #     res = result.fetchall()
-        #     return res, None
-
-        # # For INSERT, UPDATE, DELETE return the result
-        res = result.fetchall()
-        session.commit()
+        with engine.connect() as conn:
+            result = conn.execute(stmt, data or {})
+            res = result.fetchall()
+            conn.commit()
         return res, None
 
     except exc.SQLAlchemyError as db_error:
-        session.rollback()
         error_msg = f"Database update failed: {str(db_error)}"
         logger.error(error_msg)
         return False, {
@@ -256,7 +254,6 @@ def sql_execute(sql, engine=default_engine, data=None):
         }
 
     except ValueError as val_error:
-        session.rollback()
         error_msg = f"Data validation error: {str(val_error)}"
         logger.error(error_msg)
         return False, {
@@ -266,7 +263,6 @@ def sql_execute(sql, engine=default_engine, data=None):
         }
 
     except Exception as e:
-        session.rollback()
         error_msg = f"Unexpected error: {str(e)}"
         logger.error(error_msg)
         return False, {
@@ -274,18 +270,25 @@ def sql_execute(sql, engine=default_engine, data=None):
             "error_message": str(e),
             "sql": sql,
         }
-    finally:
-        session.close()
 
 
-default_engine = set_db_engine(const.TAKUM_RAW_CONN_STR)
+def get_default_engine():
+    """
+    Returns the Takum raw data engine, created on first use so importing db opens no connection pool.
+    """
+    global default_engine
+    if default_engine is None:
+        default_engine = set_db_engine(const.TAKUM_RAW_CONN_STR)
+    return default_engine
 
 
-def db_get_max_date(engine=default_engine):
+def db_get_max_date(engine=None):
     """
     Retrieves the latest timestamp from the database. If the database is empty or an error occurs,
     returns None and the error.
     """
+    if engine is None:
+        engine = get_default_engine()
 
     try:
         dt, err = sql_execute(
@@ -331,121 +334,118 @@ def db_update_leonics(eng, max_dt, df):
     return update_rows(max_dt, df, eng)
 
 
+LEONICS_RAW_DB_TABLE = "takum_leonics_api_raw"
+LEONICS_STAGE_TABLE = "leonics_raw_stage"
+
+
+def copy_merge(eng, stage, target, columns, buf, merge_sql, stage_sql=None, before=None, fetch=False):
+    """
+    Streams a CSV buffer into a session-local staging table with COPY and merges it with merge_sql.
+
+    The staging table is created once per pooled psycopg2 connection (remembered in conn.info) as
+    LIKE target, or with stage_sql when given, and is emptied when the transaction commits or rolls back.
+
+    Parameters
+    ----------
+    eng : sqlalchemy.engine.Engine
+        The engine of the database holding target.
+    stage : str
+        The name of the temporary staging table.
+    target : str
+        The table merged into, the staging table copies its columns.
+    columns : str
+        The comma separated column list of the CSV rows in buf.
+    buf : io.StringIO
+        The CSV rows, without header.
+    merge_sql : str
+        The statement merging stage into target.
+    stage_sql : str, optional
+        A CREATE TEMP TABLE ... ON COMMIT DELETE ROWS statement replacing the LIKE target default.
+    before : callable, optional
+        Called with the cursor before the COPY, in the same transaction.
+    fetch : bool, optional
+        Return the first row of the merge result instead of its rowcount.
+
+    Returns
+    -------
+    tuple
+        (rowcount or first row of the merge, None) on success, otherwise (None, exception).
+    """
+    conn = eng.raw_connection()  # pooled psycopg2 connection
+    try:
+        with conn.cursor() as cur:
+            if not conn.info.get(stage):
+                cur.execute(stage_sql or f"""
+                    CREATE TEMP TABLE IF NOT EXISTS {stage}
+                    (LIKE {target} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;""")
+            if before:
+                before(cur)
+            cur.copy_expert(f"COPY {stage} ({columns}) FROM STDIN WITH (FORMAT csv)", buf)
+            cur.execute(merge_sql)
+            res = cur.fetchone() if fetch else cur.rowcount
+            conn.commit()
+            conn.info[stage] = True
+        return res, None
+    except Exception as e:
+        conn.rollback()
+        return None, e
+    finally:
+        conn.close()
+
+
 def update_rows(max_dt, df, eng):
     """
-    Inserts new data into the specified DB table by filtering and formatting a DataFrame.
+    Upserts the Leonics rows newer than max_dt into takum_leonics_api_raw.
 
-    This function filters the input DataFrame for records with the specified key greater than
-    the given max_dt threshold, removes duplicates, and constructs a SQL INSERT statement.
-    The SQL statement includes an ON DUPLICATE KEY UPDATE clause to handle duplicate entries.
+    The filtered DataFrame is written with to_csv straight into a COPY to a session-local staging
+    table (created once per pooled connection, emptied on commit) and merged with one
+    INSERT ... SELECT ... ON CONFLICT (datetimeserver) DO UPDATE. No SQL is built from the values,
+    so memory and CPU stay flat however many minutes are in the window.
 
     Parameters
     ----------
     max_dt : datetime
         The maximum timestamp to filter against.
     df : pandas.DataFrame
-        The DataFrame containing the data to be inserted.
-    table_name : str
-        The name of the table to be updated.
-    key : str, optional
-        The column name of the timestamp to filter against, by default "DateTimeServer".
+        The DataFrame containing the data to be inserted, lower case Leonics column names.
+    eng : sqlalchemy.engine.Engine
+        The engine of the database holding takum_leonics_api_raw.
 
     Returns
     -------
     tuple
-        A tuple containing the result of the update attempt (SimpleNamespace) and
-        an error (None) if the update succeeds. If the update fails, returns None
-        and an error string.
+        (SimpleNamespace(rowcount=rows upserted), None) on success, otherwise (None, error string).
 
     Notes
     -----
-    - The DataFrame is filtered to exclude duplicates based on the specified key.
-    - The SQL query is generated with an ON DUPLICATE KEY UPDATE clause to update
-      existing records.
-    - SQL injection vulnerability exists due to direct string formatting in the query.
+    - Rows repeating a datetimeserver keep the first one.
+    - Timestamps are written to the minute, "err" readings are stored as NULL.
     """
 
     # Define the threshold datetime
     threshold = pd.to_datetime(max_dt.isoformat())
-    # Filter rows where datetime_column is greater than or equal to the threshold
+    # Filter rows where datetime_column is greater than the threshold
     df_filtered = df[df["datetimeserver"] > threshold]
-    l = len(df_filtered)
     df_filtered = df_filtered.drop_duplicates(subset="datetimeserver", keep="first")
-    # print(l - len(df_filtered))
-    if l == 0:
+    if len(df_filtered) == 0:
         return SimpleNamespace(rowcount=0), None
 
-    # TODO not substituting params correctly
-    # # Prepare columns and placeholders for a single insert statement
-    # columns = ', '.join(df_filtered.columns)  # Get the column names as comma-separated values
-    # placeholders = f"({', '.join([':' + col for col in df_filtered.columns])})"
-
-    # # Create the SQL query with placeholders for each value
-    # sql_query = f"INSERT INTO {table_name} ({columns}) VALUES {placeholders}"
-
-    # # Prepare parameter list
-    # param_list = []
-
-    # # Replace "err" with None in the DataFrame
-    # for idx, row in df_filtered.iterrows():
-    #     param = row.to_dict()  # Convert row to dictionary
-    #     # Replace "err" or NaN with None
-    #     for key, value in param.items():
-    #         if value == "err" or pd.isna(value):  # Handle NaN and "err" values
-    #             param[key] = None
-    #     param_list.append(param)
-
-    # # Ensure param_list is not empty before executing
-    # if param_list:
-    #     try:
-    #         # Execute the query with multiple bind parameters
-    #         res = sql_execute(text(sql_query), param_list)
-    #         if isinstance(res, str):
-    #             logger.error(f'ERROR db_update_leonics: {res}')
-    #             return None, 'Error: query result is not a string'
-    #         logger.debug(f'ROWS UPDATED: {table_name}  {res.rowcount}')
-    #         return res, None
-    #     except Exception as e:
-    #         print(f"Error occurred: {e}")
-    # else:
-    #     print("No data to insert.")
-
-    # Construct the SQL query
-    columns = ", ".join(
-        df_filtered.columns
-    )  # Get the column names as comma-separated values
-
-    # values = ", ".join(
-    #     f"({', '.join(f'\'{val.strftime('%Y-%m-%d %H:%M')}\'' if isinstance(val, pd.Timestamp) else str(val) for val in df_filtered.loc[idx])})"
-    #     for idx in df_filtered.index
-    # )
-
-    def format_value(val):
-        if isinstance(val, pd.Timestamp):
-            return f"'{val.strftime('%Y-%m-%d %H:%M')}'"
-        return str(val)
-
-    values = ", ".join(
-        f"({', '.join(format_value(val) for val in df_filtered.loc[idx])})"
-        for idx in df_filtered.index
-    )
-    values = values.replace("err", "NULL")
-    values.replace("'err'", "NULL")
-    # Full DB INSERT statement
-    sql_query = f"INSERT INTO takum_leonics_api_raw ({columns}) VALUES {values}"
-    sql_pred = " ON DUPLICATE KEY UPDATE "
-
-    default_engine, _ = set_db_engine_by_name("postgresql")
-    sql_pred = " ON CONFLICT (datetimeserver) DO UPDATE SET "
-    for col in df_filtered.columns:
-        sql_pred += f"{col} = EXCLUDED.{col}, "
-    sql_pred = sql_pred[:-2] + " RETURNING datetimeserver;"
-
-    sql_query += sql_pred
-    res, err = sql_execute(sql_query, eng)
-    assert err is None
-    logger.debug(f"ROWS UPDATED: {len(res)}")
-    return res, None
+    buf = io.StringIO()
+    df_filtered.replace("err", np.nan).to_csv(buf, index=False, header=False, date_format="%Y-%m-%d %H:%M")
+    buf.seek(0)
+    columns = ", ".join(df_filtered.columns)
+    updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in df_filtered.columns if col != "datetimeserver")
+
+    merge_sql = f"""
+        INSERT INTO {LEONICS_RAW_DB_TABLE} ({columns})
+        SELECT {columns} FROM {LEONICS_STAGE_TABLE}
+        ON CONFLICT (datetimeserver) DO UPDATE SET {updates};"""
+    cnt, err = copy_merge(eng, LEONICS_STAGE_TABLE, LEONICS_RAW_DB_TABLE, columns, buf, merge_sql)
+    if err:
+        logger.error(f"update_rows ERROR: {err}")
+        return None, f"update_rows ERROR: {err}"
+    logger.debug(f"ROWS UPDATED: {cnt}")
+    return SimpleNamespace(rowcount=cnt), None
 
 
 def prospect_get_start_ts(local=None, start_ts=None):
@@ -473,77 +473,238 @@ def prospect_get_start_ts(local=None, start_ts=None):
 
     if start_ts is not None:
         return start_ts
+    server = "datetimeserver"
+    postfix = "sys_%"
+    conn_str = const.PROS_CONN_AZURE_STR
+    if local or utils.is_running_on_azure():
+        conn_str = const.PROS_CONN_LOCAL_STR
+    prospect_engine = set_db_engine(conn_str)
+    # served by the partial expression index data_custom_sys_datetimeserver_idx
+    sql = f"select custom->>'{server}', external_id from data_custom where external_id like '{postfix}' order by custom->>'{server}' desc limit 1"
+    dt, err = sql_execute(sql, prospect_engine)
+    assert err is None
+    val = dt[0][0]
+    return datetime.strptime(val, "%Y-%m-%d %H:%M")
+
+
+PROSPECT_PUSH_TABLE = "prospect_push_batches"
+PROSPECT_WATERMARK_TABLE = "prospect_watermark"
+SQL_PROSPECT_PUSH_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {PROSPECT_WATERMARK_TABLE} (
+    target varchar(10) PRIMARY KEY,
+    last_ts varchar(50) NOT NULL,
+    updated timestamp NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS {PROSPECT_PUSH_TABLE} (
+    target varchar(10) NOT NULL,
+    batch_start varchar(50) NOT NULL,
+    batch_end varchar(50) NOT NULL,
+    rows integer NOT NULL,
+    status varchar(10) NOT NULL,
+    attempts integer NOT NULL DEFAULT 0,
+    error text,
+    updated timestamp NOT NULL DEFAULT now(),
+    PRIMARY KEY (target, batch_start)
+);
+SELECT 1;
+"""
+
+
+def prospect_ts(value):
+    """
+    Formats a datetimeserver value as the Leonics 'YYYY-MM-DD HH:MM' text.
+
+    datetimeserver, the batch keys and the watermark are varchar compared as text (GREATEST, >),
+    so every value written to or compared with them goes through this one format.
+    """
+    return pd.Timestamp(value).strftime("%Y-%m-%d %H:%M")
+
+
+def prospect_target(local=None):
+    """Name of the Prospect instance selected by the local flag, the key of its push watermark."""
+    return {True: "local", False: "external"}.get(local, "azure")
+
+
+def stream_leonics_batches(eng, where, params, batch_size):
+    """
+    Yields the takum_leonics_api_raw rows matching where as DataFrames of at most batch_size rows.
+
+    The rows are read through a server-side (named) cursor, so only one batch is held in memory
+    whatever the size of the catch-up. where uses psycopg2 %(name)s placeholders bound from params.
+    """
+    conn = eng.raw_connection()  # pooled psycopg2 connection
+    try:
+        with conn.cursor(name="prospect_push") as cur:
+            cur.itersize = batch_size
+            cur.execute(
+                f"SELECT * FROM {LEONICS_RAW_DB_TABLE} WHERE {where} ORDER BY datetimeserver", params
+            )
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns=[col[0] for col in cur.description])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def db_get_prospect_watermark(eng, target):
+    """Returns (the last datetimeserver pushed to the target or None, None), otherwise (None, error)."""
+    res, err = sql_execute(
+        f"SELECT last_ts FROM {PROSPECT_WATERMARK_TABLE} WHERE target = :target;", eng, {"target": target}
+    )
+    if err:
+        return None, err
+    return (res[0][0] if res else None), None
+
+
+def db_record_prospect_batch(eng, target, batch_start, batch_end, rows, status, error=None):
+    """
+    Upserts the state of one push batch in prospect_push_batches, a sent or failed result counts as an attempt.
+
+    A sent batch moves the target's prospect_watermark forward to its batch_end in the same statement,
+    so the watermark never runs ahead of, or behind, the recorded batches.
+    """
+    advance = f"""
+        INSERT INTO {PROSPECT_WATERMARK_TABLE} (target, last_ts)
+        SELECT :target, :batch_end FROM batch WHERE :status = 'sent'
+        ON CONFLICT (target) DO UPDATE
+        SET last_ts = GREATEST({PROSPECT_WATERMARK_TABLE}.last_ts, EXCLUDED.last_ts), updated = now()
+        RETURNING 1"""
+    return sql_execute(f"""
+        WITH batch AS (
+            INSERT INTO {PROSPECT_PUSH_TABLE} (target, batch_start, batch_end, rows, status, attempts, error)
+            VALUES (:target, :batch_start, :batch_end, :rows, :status, :attempt, :error)
+            ON CONFLICT (target, batch_start) DO UPDATE
+            SET batch_end = EXCLUDED.batch_end, rows = EXCLUDED.rows, status = EXCLUDED.status,
+                attempts = {PROSPECT_PUSH_TABLE}.attempts + EXCLUDED.attempts, error = EXCLUDED.error, updated = now()
+            RETURNING 1
+        ), watermark AS ({advance}
+        )
+        SELECT count(*) FROM batch;""", eng, {
+            "target": target, "batch_start": batch_start, "batch_end": batch_end, "rows": rows,
+            "status": status, "attempt": int(status != "pending"), "error": error,
+        })
+
+
+def push_prospect(eng, start_ts=None, local=None, batch_size=None, concurrency=None):
+    """
+    Pushes the Leonics rows Prospect has not received yet, in gzip compressed batches.
+
+    Every batch is recorded in prospect_push_batches as pending before it is sent and as sent
+    or failed once Prospect answered, so the watermark survives a crash or an outage:
+
+    1. batches that are not sent (failed, or pending when a run died) are re-read by their
+       datetimeserver range and retried alone,
+    2. new rows follow start_ts when given, else the target's prospect_watermark (the end of the
+       last sent batch), else the latest datetimeserver found in Prospect (prospect_get_start_ts).
+
+    Rows are streamed with stream_leonics_batches and at most concurrency batches are in flight,
+    so memory and throughput stay steady during a long catch-up.
+
+    Args:
+        eng: The engine of the database holding takum_leonics_api_raw and prospect_push_batches.
+        start_ts (str or datetime, optional): Push rows from this timestamp on, ignoring the watermark.
+        local (bool, optional): Local (True), external (False) or Azure (None) Prospect.
+        batch_size (int, optional): Rows per POST, defaults to const.PROS_PUSH_BATCH_SIZE.
+        concurrency (int, optional): Batches in flight, defaults to const.PROS_PUSH_CONCURRENCY.
+
+    Returns:
+        tuple: ({"batches", "rows", "retried", "failed"}, None) or (None, error).
+    """
+    batch_size = batch_size or const.PROS_PUSH_BATCH_SIZE or 5000
+    concurrency = max(1, concurrency or const.PROS_PUSH_CONCURRENCY or 1)
+    target = prospect_target(local)
+    counts = {"batches": 0, "rows": 0, "retried": 0, "failed": 0}
+
+    res, err = sql_execute(SQL_PROSPECT_PUSH_TABLE, eng)
+    if err:
+        return None, err
+    retry, err = sql_execute(f"""
+        SELECT batch_start, batch_end, rows FROM {PROSPECT_PUSH_TABLE}
+        WHERE target = :target AND status <> 'sent' ORDER BY batch_start;""", eng, {"target": target})
+    if err:
+        return None, err
+
+    if start_ts is not None:
+        where, params = "datetimeserver >= %(lo)s", {"lo": start_ts}
     else:
-        server = "datetimeserver"
-        postfix = "sys_%"
-        conn_str = const.PROS_CONN_AZURE_STR
-        if local or utils.is_running_on_azure():
-            conn_str = const.PROS_CONN_LOCAL_STR
-        prospect_engine = set_db_engine(conn_str)
-        sql = f"select custom->>'{server}', external_id from data_custom where external_id like '{postfix}' order by custom->>'{server}' desc limit 1"
-        dt, err = sql_execute(sql, prospect_engine)
-        assert err is None
-        val = dt[0][0]
-        return datetime.strptime(val, "%Y-%m-%d %H:%M")
+        watermark, err = db_get_prospect_watermark(eng, target)
+        if err:
+            return None, err
+        if watermark is not None:
+            where, params = "datetimeserver > %(lo)s", {"lo": watermark}
+        else:
+            where, params = "datetimeserver >= %(lo)s", {"lo": prospect_get_start_ts(local)}
+    params["lo"] = prospect_ts(params["lo"])
+    logger.info(f"push_prospect {target}: {len(retry)} batches to retry, new rows {where % params}")
+
+    def batches():
+        # a retried range keeps its key, unless it no longer fits in one batch
+        for batch_start, batch_end, rows in retry:
+            for n, df in enumerate(stream_leonics_batches(
+                eng, "datetimeserver >= %(lo)s AND datetimeserver <= %(hi)s",
+                {"lo": batch_start, "hi": batch_end}, max(rows, batch_size),
+            )):
+                yield (batch_start if n == 0 else None), df, True
+        for df in stream_leonics_batches(eng, where, params, batch_size):
+            yield None, df, False
+
+    def send(batch_start, batch_end, df):
+        df["external_id"] = "sys_" + df["external_id"].astype(str)
+        res, err = api_prospect.api_in_prospect_batch(df.to_json(orient="records"), local)
+        db_record_prospect_batch(eng, target, batch_start, batch_end, len(df), "failed" if err else "sent", err)
+        return len(df), err
+
+    def collect(done):
+        for future in done:
+            rows, err = future.result()
+            counts["batches"] += 1
+            if err:
+                counts["failed"] += 1
+                logger.error(f"push_prospect {target} batch failed: {err}")
+            else:
+                counts["rows"] += rows
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = set()
+        for batch_start, df, retried in batches():
+            counts["retried"] += retried
+            batch_start = batch_start or prospect_ts(df["datetimeserver"].iloc[0])
+            batch_end = prospect_ts(df["datetimeserver"].iloc[-1])
+            res, err = db_record_prospect_batch(eng, target, batch_start, batch_end, len(df), "pending")
+            if err:
+                collect(wait(in_flight).done)
+                return None, err
+            in_flight.add(executor.submit(send, batch_start, batch_end, df))
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(in_flight).done)
+
+    logger.info(f"push_prospect {target}: {counts}")
+    return counts, None
 
 
 def update_prospect(eng, start_ts=None, local=None):
     """
     Updates the Prospect API with new data entries from the database.
 
-    This function retrieves the latest data entries from the specified database table
-    since the given timestamp and sends them to the Prospect API. The data entries
-    are fetched in batches and transformed into a Pandas DataFrame before being sent
-    to the API. The function logs the update process and handles any exceptions that occur.
+    The rows are pushed by push_prospect: streamed from the database, sent in gzip compressed
+    batches of const.PROS_PUSH_BATCH_SIZE rows and tracked per batch, so a failed batch is
+    retried alone on the next run.
 
     Args:
         start_ts (str, optional): The starting timestamp for the data retrieval process. Defaults to None.
         local (bool, optional): A flag indicating whether to use the local or external Prospect API. Defaults to None.
-        table_name (str, optional): The name of the database table to query. Defaults to const.LEONICS_RAW_TABLE.
 
     Returns:
-        tuple: A tuple containing the API response and an error message (if any). Returns None and an error message if the API call fails.
-
-    Logs:
-        Various informational and error logs, including the status of API calls and any exceptions that occur.
+        tuple: The push counts ({"batches", "rows", "retried", "failed"}) and None, or None and an error.
     """
 
     logger.info(f"Starting update_prospect ts: {start_ts}  local = {local}")
-    # try:
-    start_ts = prospect_get_start_ts(local, start_ts)
-    rows, err = sql_execute(
-        f"select * FROM takum_leonics_api_raw where DatetimeServer >= '{start_ts}' order by DatetimeServer  limit 50000;",
-        eng,
-    )
-    assert err is None
-
-    # Convert the result to a Pandas DataFrame
-    columns = columns = list(rows[0]._fields) if rows else []
-    # Get column names
-    df = pd.DataFrame(rows, columns=columns)
-    postfix = "sys_"
-    # if local:
-    #     postfix='raw_'
-    df["external_id"] = df["external_id"].astype(str).apply(lambda x: postfix + x)
-
-    res = api_prospect.api_in_prospect(df, local)
-    if res is None:
-        logger.error("Prospect API failed")
-        return None, '"Prospect API failed"'
-    logger.info(f"{res.status_code}:  {res.text}")
-
-    # Save the DataFrame to a CSV file
-    #####logger = logging.getLogger()
-    if logger.getEffectiveLevel() < logging.INFO:
-        sts = start_ts.replace(" ", "_").replace(":", "HM")
-        df.to_csv(f"sys_pros_{sts}.csv", index=False)
-
-    logger.info("Data has been saved to 'sys_pros'")
-    return res, None
-
-    # except Exception as e:
-    #     logger.error(f"PROSPECT Error occurred: {e}")
-    #     return None, e
+    return push_prospect(eng, start_ts=start_ts, local=local)
 
 
 # WIP
@@ -607,7 +768,7 @@ def prospect_backfill_key(
 
     rows, err = sql_execute(
         f"select * FROM {table_name} where DatetimeServer > '{start_ts}' order by DatetimeServer limit 1450",
-        default_engine,
+        get_default_engine(),
         # {'ts':start_ts}
     )
     assert err is None
@@ -841,7 +1002,7 @@ def db_update_takum_raw(eng, token, start_ts):
         logger.error(f"db_update_leonics Error occurred: {err}")
         return None, err
     else:
-        logger.info(f"LOCAL ROWS UPDATED:  {len(res)}")
+        logger.info(f"LOCAL ROWS UPDATED:  {res.rowcount}")
 
     return start_ts, None
 
@@ -864,10 +1025,6 @@ def set_azure_defaultdb_engine():
     return azure_defaultdb_engine
 
 
-set_local_defaultdb_engine()
-set_azure_defaultdb_engine()
-
-
 def get_fuel_max_ts(site, engine):
     """
     Retrieves the latest start timestamp for a given site from the fuel database.
@@ -11,9 +11,9 @@ mods = [
     ["app_utils", "app_utils"],
     ["constants", "const"]
 ]
-res = app_utils.app_init(mods=mods, log_file="unhcr.err_handler.log", version="0.4.8", level="INFO", override=False)
+res = app_utils.app_init(mods=mods, log_file="unhcr.err_handler.log", version="0.4.8", level="INFO", override=False, lazy=True)
 logger = res[0]
-if const.LOCAL:  # testing with local python files
+if len(res) > 1:  # testing with local python files
     logger, app_utils, const = res
 
 def log_err(err, file_name, func_name, line_number, msg=None):
@@ -46,9 +46,9 @@ from unhcr import constants as const
 from unhcr import utils
 
 mods=[["app_utils", "app_utils"],["constants", "const"], ["utils", "utils"]]
-res = app_utils.app_init(mods=mods, log_file="unhcr.galooli_sm_fuel.log", version="0.4.8", level="INFO", override=False)
+res = app_utils.app_init(mods=mods, log_file="unhcr.galooli_sm_fuel.log", version="0.4.8", level="INFO", override=False, lazy=True)
 logger = res[0]
-if const.LOCAL:  # testing with local python files
+if len(res) > 1:  # testing with local python files
     logger, app_utils, const, utils = res
 
 tz = "GMT"
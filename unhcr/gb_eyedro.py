@@ -3,15 +3,16 @@ from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from functools import partial
 from itertools import chain
+import asyncio
+import io
 import json
-import time
+import aiohttp
 import numpy as np
 import pandas as pd
 import psycopg2
 from psycopg2.extras import execute_values
 import requests
 from sqlalchemy import text
-import time
 
 from unhcr import app_utils
 from unhcr import constants as const
@@ -20,9 +21,9 @@ from unhcr import err_handler
 
 run_dt = datetime.now().date()
 mods = [["app_utils", "app_utils"],["constants", "const"],["db", "db"],["err_handler", "err_handler"]]
-res = app_utils.app_init(mods=mods, log_file="unhcr.gb_eyedro.log", version="0.4.8", level="INFO", override=False)
+res = app_utils.app_init(mods=mods, log_file="unhcr.gb_eyedro.log", version="0.4.8", level="INFO", override=False, lazy=True)
 logger = res[0]
-if const.LOCAL:  # testing with local python files
+if len(res) > 1:  # testing with local python files
     logger, app_utils, const, db, err_handler = res
 
 epoch_2024 = 1704067199
@@ -31,45 +32,56 @@ epoch_2022 = 1640937599
 epoch_2021 = 1609372799
 epoch_2020 = 1577807999
 
+GB_PARAM_PREFIX = {"A": "a_p", "V": "v_p", "PF": "pf_p", "Wh": "wh_p"}
+GB_REQUIRED_COLS = ['a_p1', 'a_p2', 'a_p3']
+
+
 def map_gb(device_data):
+    """
+    Map the DeviceData section of a GB API v1 response to a DataFrame.
+
+    Each phase dataset is a list of [epoch, value] pairs. All datasets are aligned on
+    the sorted union of their epochs with numpy, so there is no per-sample Python work.
+
+    Parameters
+    ----------
+    device_data : dict
+        The "DeviceData" section of the API response, e.g. {"A": [[[epoch, value], ...], ...], ...}.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns ts (datetime64, UTC), epoch_secs (int64), the mapped phase columns and api_flag,
+        sorted by epoch_secs. Rows without amps on all three phases are dropped.
+    """
     if all(len(sublist) == 0 for sublist in device_data['Wh']):
         return pd.DataFrame()
 
-    parameter_mapping = {"A": "a_p", "V": "v_p", "PF": "pf_p", "Wh": "wh_p"}
-    records = {}
-
+    datasets = {}
     for param, lists in device_data.items():
-        param_prefix = parameter_mapping.get(param, param)  # Default to param name if not in mapping
+        param_prefix = GB_PARAM_PREFIX.get(param, param)  # Default to param name if not in mapping
         for i, dataset in enumerate(lists):
-            for timestamp, value in dataset:
-                ts_str = datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
-                if ts_str not in records:
-                    records[ts_str] = {"ts": ts_str, "epoch_secs": timestamp}  # Initialize timestamp row
-                records[ts_str][f"{param_prefix}{i + 1}"] = value
-    # Convert records dict to DataFrame
-    df = pd.DataFrame.from_dict(records, orient="index")
-    # !!! no need for this, but might use it later
-    # # Ensure missing columns (V & PF) exist with NaN
-    # expected_columns = ["ts"] + [f"{p}{i}" for p in ["a_p", "v_p", "pf_p", "wh_p"] for i in range(1, 4)]
-    # for col in expected_columns:
-    #     if col not in df:
-    #         df[col] = None  # Or df[col] = 0 for default values
+            if len(dataset) == 0:
+                continue
+            datasets[f"{param_prefix}{i + 1}"] = np.asarray(dataset, dtype=np.float64).reshape(-1, 2)
+
+    epochs = np.unique(np.concatenate([arr[:, 0] for arr in datasets.values()]).astype(np.int64))
+    columns = {"ts": pd.to_datetime(epochs, unit="s"), "epoch_secs": epochs}
+    for col, arr in datasets.items():
+        values = np.full(len(epochs), np.nan)
+        values[np.searchsorted(epochs, arr[:, 0].astype(np.int64))] = arr[:, 1]
+        columns[col] = values
+    df = pd.DataFrame(columns)
 
     # if amps are missing, drop the row Eyedro send wh when there are no amps
-    # Define the required columns
-    required_columns = ['a_p1', 'a_p2', 'a_p3']
-
-    # Check if all required columns are in the DataFrame
-    if all(col in df.columns for col in required_columns):
-        # If all required columns exist, drop rows with NaN in those columns
-        df = df.dropna(subset=required_columns)
+    if all(col in df.columns for col in GB_REQUIRED_COLS):
+        df = df.dropna(subset=GB_REQUIRED_COLS)
     else:
         # If any required columns are missing, remove all rows
-        df = df.iloc[0:0]  # This clears the DataFrame
+        df = df.iloc[0:0]
     if not df.empty:
-        df.loc[:, "api_flag"] = -666
-     # flag using new API
-    return df.sort_values("ts").reset_index(drop=True)
+        df = df.assign(api_flag=-666)  # flag using new API
+    return df.reset_index(drop=True)
 
 
 def api_get_gb_user_info():
@@ -216,7 +228,30 @@ def api_get_user_info_as_df():
     return all_serials_df, None
 
 
-def db_create_tables_1(serials, db_eng=db.set_local_defaultdb_engine()):
+def gb_last_comm_map(serials_df):
+    """
+    Build a per-serial last communication lookup from a parsed user info DataFrame.
+
+    Parameters
+    ----------
+    serials_df : pandas.DataFrame
+        The DataFrame returned by api_get_user_info_as_df, with const.GB_SN_COLS columns.
+
+    Returns
+    -------
+    dict
+        Maps the serial number without dashes to its LastCommSecUtc epoch. Serials without a
+        last communication are left out.
+    """
+    df = serials_df[["gb_serial", "epoch_utc"]].copy()
+    df["epoch_utc"] = pd.to_numeric(df["epoch_utc"], errors="coerce")
+    df = df.dropna(subset=["epoch_utc"])
+    return dict(zip(df["gb_serial"].str.replace("-", ""), df["epoch_utc"].astype("int64").tolist()))
+
+
+def db_create_tables_1(serials, db_eng=None):
+    if db_eng is None:
+        db_eng = db.set_local_defaultdb_engine()
     res = True
     err = None
     conn = db_eng.raw_connection()  # Get raw psycopg2 connection
@@ -366,7 +401,9 @@ def db_create_tables_1(serials, db_eng=db.set_local_defaultdb_engine()):
 
     return res, err
 
-def db_create_tables_2(serials, db_eng=db.set_local_defaultdb_engine()):
+def db_create_tables_2(serials, db_eng=None):
+    if db_eng is None:
+        db_eng = db.set_local_defaultdb_engine()
     res = True
     err = None
     conn = db_eng.raw_connection()  # Get raw psycopg2 connection
@@ -528,16 +565,88 @@ def log_gb_errors(errs, logger):
     return errs
 
 
-def meter_response_empty(serial, epoch=None):
+def gb_meter_url(serial, epoch=None):
     url = f'{const.GB_API_V1_API_BASE_URL}{const.GB_API_V1_GET_DATA}'
     epoch_str = f"&DateStartSecUtc={str(epoch)}" if epoch else ""
-    meter_url = f"{url}{str(serial)}{epoch_str}&DateNumSteps=1440&UserKey={const.GB_API_V1_EMPTY_KEY}"
+    return f"{url}{str(serial)}{epoch_str}&DateNumSteps=1440&UserKey={const.GB_API_V1_EMPTY_KEY}"
+
+
+def meter_response_empty(serial, epoch=None):
+    meter_url = gb_meter_url(serial, epoch)
 
-    response = requests.get(meter_url, timeout=600)
+    response = requests.get(meter_url, timeout=const.GB_API_TIMEOUT)
     response.raise_for_status()  # Raise an exception for HTTP errors
     return json.loads(response.text)
 
 
+def gb_client_session(concurrency=None):
+    """
+    Create the shared keep-alive aiohttp session used for Eyedro day requests.
+
+    Parameters
+    ----------
+    concurrency : int, optional
+        Maximum number of pooled connections, by default const.GB_API_MAX_CONCURRENCY.
+
+    Returns
+    -------
+    aiohttp.ClientSession
+        A session to be used as an async context manager.
+    """
+    concurrency = concurrency or const.GB_API_MAX_CONCURRENCY
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=const.GB_API_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def meter_response_empty_async(session, serial, epoch=None, sem=None):
+    """
+    Non-blocking version of meter_response_empty using a shared aiohttp session.
+
+    Parameters
+    ----------
+    session : aiohttp.ClientSession
+        The shared session, see gb_client_session.
+    serial : str
+        The GB serial number without dashes.
+    epoch : int, optional
+        UTC midnight epoch of the day to request. If None, the API returns the most recent day.
+    sem : asyncio.Semaphore, optional
+        Bounds the number of in-flight day requests across all serials.
+
+    Returns
+    -------
+    dict or None
+        The decoded JSON response, or None if the request failed.
+    """
+    meter_url = gb_meter_url(serial, epoch)
+    try:
+        if sem is None:
+            async with session.get(meter_url) as response:
+                response.raise_for_status()
+                return json.loads(await response.text())
+        async with sem:
+            async with session.get(meter_url) as response:
+                response.raise_for_status()
+                return json.loads(await response.text())
+    except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+        logger.debug(f"ZZZ {serial} {epoch} meter_response_empty_async ERROR: {e}")
+        return None
+
+
+async def get_last_com_epoch_async(session, s_num, sem=None, logger=logger):
+    midnight_utc = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    midnight_epoch = int(midnight_utc.timestamp())
+    data = await meter_response_empty_async(session, s_num, sem=sem)
+    if data is None:
+        return midnight_epoch, None
+    if data['Errors']:
+        log_gb_errors(data['Errors'], logger)
+        return midnight_epoch, data
+    last_comm = data['LastCommSecUtc']
+    return app_utils.get_previous_midnight_epoch(last_comm), data
+
+
 def get_last_com_epoch(s_num, logger=logger):
     # Get UTC midnight for today
     midnight_utc = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
@@ -554,14 +663,29 @@ def get_last_com_epoch(s_num, logger=logger):
     last_comm = data['LastCommSecUtc']
     return app_utils.get_previous_midnight_epoch(last_comm), data
 
+GB_STAGE_TABLE = "gb_1min_stage"
+GB_UPSERT_COLS = ['a_p1', 'a_p2', 'a_p3', 'v_p1', 'v_p2', 'v_p3', 'pf_p1', 'pf_p2', 'pf_p3', 'wh_p1', 'wh_p2', 'wh_p3', 'api_flag']
+# session-local staging table, created once per pooled connection and emptied on commit
+SQL_GB_STAGE_TABLE = f"""
+CREATE TEMP TABLE IF NOT EXISTS {GB_STAGE_TABLE} (
+    epoch_secs BIGINT,
+    ts timestamp,
+    {', '.join(f'{col} float8' for col in GB_UPSERT_COLS[:-1])},
+    api_flag integer
+) ON COMMIT DELETE ROWS;
+"""
+
+
 def update_gb_db(serial, df, engine, msg=''):
     """
     Updates the database with new data for a given serial number using an UPSERT operation.
 
-    This function takes a DataFrame containing device data and inserts it into a PostgreSQL table
-    named "gb_<serial>". If a record with the same timestamp and epoch_secs already exists, it updates
-    the existing record with new values for each parameter. The function commits the transaction after
-    successfully inserting/updating the records, and logs the number of inserted and updated rows.
+    The DataFrame is streamed with COPY FROM STDIN into a session-local staging table and merged
+    into "eyedro.gb_<serial>" with a single INSERT ... SELECT ... ON CONFLICT (ts, epoch_secs).
+    With const.GB_LONG_TABLE set the rows go to "eyedro.gb_1min" keyed by (serial, ts) instead.
+    Compressed chunks the rows fall into are decompressed first, see db_decompress_gb_range.
+    The DataFrame may hold any number of days. The staging table is emptied when the transaction
+    commits or rolls back.
 
     Args:
         serial (str): The serial number of the device.
@@ -574,25 +698,21 @@ def update_gb_db(serial, df, engine, msg=''):
     """
 
     columns_str = ", ".join(df.columns)
-    # Use ON CONFLICT for UPSERT (Insert or Update)
-    upsert_sql = f"""
+    update_str = ",\n        ".join(f"{col} = EXCLUDED.{col}" for col in GB_UPSERT_COLS)
+    if const.GB_LONG_TABLE:
+        target = f"{const.GB_1MIN_TABLE} (serial, {columns_str})"
+        select_str = f"'{serial.replace('gb_', '').lower()}', {columns_str}"
+        conflict = "serial, ts"
+    else:
+        target = f"eyedro.gb_{serial} ({columns_str})"
+        select_str = columns_str
+        conflict = "ts, epoch_secs"
+    merge_sql = f"""
 WITH insert_attempt AS (
-    INSERT INTO eyedro.gb_{serial} ({columns_str})
-    VALUES %s
-    ON CONFLICT (ts, epoch_secs) DO UPDATE SET
-        a_p1 = EXCLUDED.a_p1,
-        a_p2 = EXCLUDED.a_p2,
-        a_p3 = EXCLUDED.a_p3,
-        v_p1 = EXCLUDED.v_p1,
-        v_p2 = EXCLUDED.v_p2,
-        v_p3 = EXCLUDED.v_p3,
-        pf_p1 = EXCLUDED.pf_p1,
-        pf_p2 = EXCLUDED.pf_p2,
-        pf_p3 = EXCLUDED.pf_p3,
-        wh_p1 = EXCLUDED.wh_p1,
-        wh_p2 = EXCLUDED.wh_p2,
-        wh_p3 = EXCLUDED.wh_p3,
-        api_flag = EXCLUDED.api_flag
+    INSERT INTO {target}
+    SELECT {select_str} FROM {GB_STAGE_TABLE}
+    ON CONFLICT ({conflict}) DO UPDATE SET
+        {update_str}
     RETURNING xmax = 0 AS inserted
 )
 SELECT 
@@ -600,44 +720,472 @@ SELECT
     COUNT(*) FILTER (WHERE NOT inserted) AS updated_count
 FROM insert_attempt;
 """
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S')
+    buf.seek(0)
+
+    table = const.GB_1MIN_TABLE if const.GB_LONG_TABLE else f'eyedro.gb_{serial}'
+    res, err = db.copy_merge(
+        engine, GB_STAGE_TABLE, table, columns_str, buf, merge_sql, stage_sql=SQL_GB_STAGE_TABLE,
+        before=lambda cur: db_decompress_gb_range(cur, table.split('.')[1], df['ts'].min(), df['ts'].max()), fetch=True)
+    if err is not None:
+        logger.error(f"ZZZ {serial} update_gb_db error during UPSERT: {err}")
+        return None, err
+    inserted_count, updated_count = res
+    logger.info(f'{serial} {df["ts"].min()} {df["ts"].max()} In: {inserted_count}, Up: {updated_count} ✅ {msg}')
+    return [inserted_count, updated_count], None
 
-    conn = engine.raw_connection()  # Get raw psycopg2 connection
-    try:
-        with conn.cursor() as cur:
-            # cur.executemany(upsert_sql, df.to_records(index=False).tolist())
-            execute_values(cur, upsert_sql, df.to_records(index=False).tolist(),page_size=1500)
-            #xx = cur.rowcount
-                    # Fetch the inserted count
-            ######cur.execute("SELECT COUNT(*) FROM insert_attempt")  # Correct query to count
-            # Get the inserted count from RETURNING
-            #inserted_count = len(cur.fetchall()) # cur.rowcount #cur.fetchone()[0]  # Fetch single row result
-            inserted_count, updated_count = cur.fetchone()  
-            #print(f"Inserted: {inserted_count}, Updated: {updated_count}")
 
-            # Use rowcount to get total affected rows (inserts + updates)
-            # total_affected = len(df)
+GB_1MIN_COLS = ['epoch_secs', 'ts'] + GB_UPSERT_COLS
 
-            # # Calculate updated count
-            # updated_count = total_affected - inserted_count
 
-            # Commit transaction
-            conn.commit()
+def gb_hourly_agg_sql():
+    """
+    Select list of the hourly continuous aggregate.
 
-    except psycopg2.DatabaseError as e:
-        conn.rollback()  # Rollback on failure
-        logger.error(f"ZZZ {serial} update_gb_db Database error during UPSERT: {e}")
-        return None, e
+    Same columns as the per serial eyedro.gb_{serial}_hourly aggregates, so the per serial views
+    over eyedro.gb_1min_hourly are drop in replacements.
+    """
+    def valid(col):
+        return f"FILTER (WHERE {col} IS NOT NULL AND {col}::TEXT <> 'NaN')"
+
+    aggs = []
+    for name, prefix in (('amps', 'a_p'), ('volts', 'v_p')):
+        for p in (1, 2, 3):
+            col = f'{prefix}{p}'
+            aggs += [f"{fn}(ABS({col})) {valid(col)} AS {fn.lower()}_{name}_p{p}" for fn in ('AVG', 'MIN', 'MAX')]
+    for p in (1, 2, 3):
+        aggs += [f"ABS(SUM(pf_p{p} * a_p{p})) / NULLIF(SUM(ABS(a_p{p})) {valid(f'a_p{p}')}, 0) AS weighted_pf_p{p}"]
+        aggs += [f"{fn}(ABS(pf_p{p})) {valid(f'pf_p{p}')} AS {fn.lower()}_pf_p{p}" for fn in ('MIN', 'MAX')]
+    for p in (1, 2, 3):
+        col = f'wh_p{p}'
+        aggs += [f"{fn}(ABS({col})) {valid(col)} AS {fn.lower()}_{col}" for fn in ('AVG', 'MIN', 'MAX')]
+        aggs += [f"SUM(ABS({col})) {valid(col)} AS ttl_{col}"]
+    return aggs
+
+
+def gb_hourly_agg_cols():
+    return [agg.rsplit(' AS ', 1)[1] for agg in gb_hourly_agg_sql()]
+
+
+# one hypertable for the whole fleet, space partitioned by serial, and a single hourly aggregate
+SQL_GB_1MIN_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {const.GB_1MIN_TABLE} (
+    serial TEXT NOT NULL,
+    epoch_secs BIGINT NOT NULL,
+    ts timestamp NOT NULL,
+    {', '.join(f'{col} float8 NULL' for col in GB_UPSERT_COLS[:-1])},
+    api_flag integer NULL,
+    CONSTRAINT gb_1min_pkey PRIMARY KEY (serial, ts)
+);
+
+SELECT create_hypertable('{const.GB_1MIN_TABLE}', 'ts', partitioning_column => 'serial', number_partitions => 8,
+    chunk_time_interval => INTERVAL '7 days', if_not_exists => TRUE);
+
+CREATE INDEX IF NOT EXISTS gb_1min_serial_ts_idx ON {const.GB_1MIN_TABLE} USING btree (serial, ts DESC);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS {const.GB_1MIN_TABLE}_hourly
+WITH (timescaledb.continuous) AS
+SELECT
+    serial,
+    time_bucket('1h', ts) AS ts_hr,
+    {(',' + chr(10) + '    ').join(gb_hourly_agg_sql())}
+FROM {const.GB_1MIN_TABLE}
+where a_p1 is not null and a_p2 is not null and a_p3 is not null
+GROUP BY serial, ts_hr
+WITH NO DATA;
+
+SELECT add_continuous_aggregate_policy(
+    '{const.GB_1MIN_TABLE}_hourly',
+    start_offset => INTERVAL '15 days',
+    end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '6 hours',
+    if_not_exists => TRUE
+    );
+
+SELECT count(*) FROM {const.GB_1MIN_TABLE}_hourly WHERE false;
+"""
+
+
+def db_create_gb_1min_table(db_eng=None):
+    if db_eng is None:
+        db_eng = db.set_local_defaultdb_engine()
+    res, err = db.sql_execute(f'select epoch_secs from {const.GB_1MIN_TABLE} limit 1;', db_eng)
+    if err:
+        res, err = db.sql_execute(SQL_GB_1MIN_TABLE, db_eng)
+        if err:
+            logger.error(err)
+            return None, err
+    logger.debug(res)
+    return res, err
+
+
+def sql_gb_serial_views(serial):
+    """
+    SQL for the per serial views over the consolidated tables.
+
+    eyedro.gb_{serial} and eyedro.gb_{serial}_hourly keep the names and columns of the per serial
+    hypertable and continuous aggregate, so the gaps scan, the web app and ad hoc queries keep working.
+    """
+    serial = serial.replace("gb_", "").lower()
+    return f"""
+CREATE OR REPLACE VIEW eyedro.gb_{serial} AS
+SELECT {', '.join(GB_1MIN_COLS)}
+FROM {const.GB_1MIN_TABLE}
+WHERE serial = '{serial}';
+
+CREATE OR REPLACE VIEW eyedro.gb_{serial}_hourly AS
+SELECT ts_hr, {', '.join(gb_hourly_agg_cols())}
+FROM {const.GB_1MIN_TABLE}_hourly
+WHERE serial = '{serial}';
+"""
+
+
+def db_migrate_gb_to_1min(serials, db_eng=None, logger=logger):
+    """
+    Moves the per serial eyedro.gb_{serial} hypertables into eyedro.gb_1min.
+
+    Per serial and in one transaction: the rows are copied over, the old hypertable is renamed to
+    gb_{serial}_legacy, its continuous aggregate to gb_{serial}_hourly_legacy (and its refresh policy
+    removed), and views with the old names are created over the consolidated tables. Serials without
+    a table only get the views, already migrated serials are left alone, so the function can be run
+    for the whole fleet on every ingest. The legacy tables are kept, drop them once the data is checked.
+
+    Args:
+        serials (list of str): Serial numbers, with or without the 'gb_' prefix.
+        db_eng (sqlalchemy.engine.base.Engine): The SQLAlchemy engine.
+
+    Returns:
+        tuple: ({serial: rows copied}, None) or (partial result, error) on the first failing serial.
+    """
+    if db_eng is None:
+        db_eng = db.set_local_defaultdb_engine()
+    res, err = db_create_gb_1min_table(db_eng)
+    if err:
+        return None, err
+
+    copied = {}
+    for serial in serials:
+        serial = serial.replace("gb_", "").lower()
+        try:
+            with db_eng.begin() as conn:
+                relkind = conn.execute(text("""
+                    SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                    WHERE n.nspname = 'eyedro' AND c.relname = :name"""), {'name': f'gb_{serial}'}).scalar()
+                if relkind == 'v':
+                    continue
+                cnt = 0
+                if relkind == 'r':
+                    found = set(conn.execute(text("""
+                        SELECT column_name FROM information_schema.columns
+                        WHERE table_schema = 'eyedro' AND table_name = :name"""), {'name': f'gb_{serial}'}).scalars())
+                    cols = ', '.join(col for col in GB_1MIN_COLS if col in found)
+                    cnt = conn.execute(text(f"""
+                        INSERT INTO {const.GB_1MIN_TABLE} (serial, {cols})
+                        SELECT '{serial}', {cols} FROM eyedro.gb_{serial}
+                        ON CONFLICT (serial, ts) DO NOTHING""")).rowcount
+                    if conn.execute(text(f"SELECT to_regclass('eyedro.gb_{serial}_hourly')")).scalar():
+                        conn.execute(text(f"SELECT remove_continuous_aggregate_policy('eyedro.gb_{serial}_hourly', if_exists => true)"))
+                        conn.execute(text(f"ALTER MATERIALIZED VIEW eyedro.gb_{serial}_hourly RENAME TO gb_{serial}_hourly_legacy"))
+                    conn.execute(text(f"ALTER TABLE eyedro.gb_{serial} RENAME TO gb_{serial}_legacy"))
+                conn.execute(text(sql_gb_serial_views(serial)))
+            copied[serial] = cnt
+            logger.info(f'{serial} migrated to {const.GB_1MIN_TABLE}: {cnt} rows')
+        except Exception as e:
+            logger.error(f"ZZZ {serial} db_migrate_gb_to_1min error: {e}")
+            return copied, e
+    return copied, None
+
+
+# refresh window of the hourly continuous aggregates, raw data younger than this may still be re-aggregated
+GB_CAGG_START_OFFSET = '15 days'
+
+SQL_GB_HYPERTABLE_POLICIES = """
+SELECT h.hypertable_name, h.compression_enabled,
+    EXISTS (SELECT 1 FROM timescaledb_information.jobs j
+            WHERE j.proc_name = 'policy_retention'
+            AND j.hypertable_schema = h.hypertable_schema AND j.hypertable_name = h.hypertable_name) AS has_retention
+FROM timescaledb_information.hypertables h
+WHERE h.hypertable_schema = 'eyedro' AND h.hypertable_name like 'gb_%'
+ORDER BY h.hypertable_name;
+"""
+
+# compressed chunks of a hypertable overlapping [ts_min, ts_max], none when ts_min is younger than compress_after
+SQL_GB_DECOMPRESS_RANGE = """
+SELECT decompress_chunk(format('%%I.%%I', chunk_schema, chunk_name)::regclass, if_compressed => true)
+FROM timescaledb_information.chunks
+WHERE %(ts_min)s < localtimestamp - %(compress_after)s::interval
+AND hypertable_schema = 'eyedro' AND hypertable_name = %(table)s AND is_compressed
+AND range_end > %(ts_min)s AND range_start <= %(ts_max)s;
+"""
+
+# a retention must outlive the aggregate refresh and compression windows, compared as Postgres intervals
+SQL_GB_RETENTION_CHECK = """
+SELECT CAST(:retention AS interval) > GREATEST(CAST(:refresh AS interval), CAST(:compress_after AS interval));
+"""
+
+
+def gb_compression_sql(table_name, compress_after):
+    """
+    SQL enabling columnar compression on an eyedro hypertable and its age based policy.
+
+    eyedro.gb_1min is segmented by serial, so each compressed batch holds one meter. The per serial
+    tables hold a single meter already and are only ordered. Primary key columns have to be in the
+    segment by or order by list.
+    """
+    if table_name == const.GB_1MIN_TABLE.split('.')[1]:
+        settings = "timescaledb.compress_segmentby = 'serial', timescaledb.compress_orderby = 'ts DESC'"
+    else:
+        settings = "timescaledb.compress_orderby = 'ts DESC, epoch_secs'"
+    return f"""
+ALTER TABLE eyedro.{table_name} SET (timescaledb.compress, {settings});
+SELECT add_compression_policy('eyedro.{table_name}', compress_after => INTERVAL '{compress_after}', if_not_exists => true);
+"""
+
+
+def db_decompress_gb_range(cur, table_name, ts_min, ts_max):
+    """
+    Decompresses the chunks of eyedro.<table_name> a late backfill writes into.
+
+    Called on the psycopg2 cursor of the upsert, before the merge, so the ON CONFLICT update works
+    on any TimescaleDB version. The compression policy compresses the chunks again on its next run.
+    Nothing is done without const.GB_COMPRESS_AFTER, and the age check against it runs in Postgres,
+    so any interval Postgres accepts (e.g. '3 months') works.
+    """
+    if not const.GB_COMPRESS_AFTER:
+        return 0
+    cur.execute(SQL_GB_DECOMPRESS_RANGE, {'table': table_name.lower(), 'ts_min': ts_min, 'ts_max': ts_max,
+                                          'compress_after': const.GB_COMPRESS_AFTER})
+    return cur.rowcount
+
+
+def db_refresh_gb_caggs(table_name, until, db_eng):
+    """Materializes every continuous aggregate on eyedro.<table_name> up to the given interval ago."""
+    res, err = db.sql_execute(f"""SELECT view_schema, view_name FROM timescaledb_information.continuous_aggregates
+    WHERE hypertable_schema = 'eyedro' AND hypertable_name = '{table_name}';""", db_eng)
+    if err:
+        return None, err
+    # refresh_continuous_aggregate can not run inside a transaction
+    with db_eng.connect().execution_options(isolation_level='AUTOCOMMIT') as procedure_conn:
+        for view_schema, view_name in res:
+            procedure_conn.execute(text(
+                f"CALL refresh_continuous_aggregate('{view_schema}.{view_name}', NULL, localtimestamp - INTERVAL '{until}')"))
+    return len(res), None
+
+
+def db_set_gb_storage_policies(db_eng=None, compress_after=None, retention=None, logger=logger):
+    """
+    Enables compression and, optionally, raw data retention on the eyedro gb_% hypertables.
+
+    Covers the per serial tables, whichever function or script created them, the legacy tables and
+    eyedro.gb_1min. Only the missing settings are applied, so the steady state cost is one catalog query.
+    Before a retention policy is added the continuous aggregates of the table are materialized up to
+    the retention horizon, the hourly and daily rollups keep the history the raw chunks lose.
+
+    Args:
+        db_eng (sqlalchemy.engine.base.Engine): The SQLAlchemy engine.
+        compress_after (str, optional): Interval, e.g. '30 days'. Defaults to const.GB_COMPRESS_AFTER.
+        retention (str, optional): Interval, e.g. '730 days'. Defaults to const.GB_RAW_RETENTION,
+            None adds no retention policy.
+
+    Returns:
+        tuple: ({table_name: [applied settings]}, None) or (partial result, error).
+    """
+    if db_eng is None:
+        db_eng = db.set_local_defaultdb_engine()
+    compress_after = compress_after or const.GB_COMPRESS_AFTER
+    retention = retention or const.GB_RAW_RETENTION
+    if retention:
+        res, err = db.sql_execute(SQL_GB_RETENTION_CHECK, db_eng, {
+            'retention': retention, 'refresh': GB_CAGG_START_OFFSET, 'compress_after': compress_after or '0 days'})
+        if err:
+            logger.error(err)
+            return None, err
+        if not res[0][0]:
+            err = ValueError(f"retention {retention} must be longer than the aggregate refresh window {GB_CAGG_START_OFFSET} "
+                             f"and the compression window {compress_after}")
+            logger.error(err)
+            return None, err
+
+    res, err = db.sql_execute(SQL_GB_HYPERTABLE_POLICIES, db_eng)
+    if err:
+        logger.error(err)
+        return None, err
+
+    applied = {}
+    for table_name, compression_enabled, has_retention in res:
+        try:
+            if compress_after and not compression_enabled:
+                with db_eng.begin() as conn:
+                    conn.execute(text(gb_compression_sql(table_name, compress_after)))
+                applied.setdefault(table_name, []).append('compression')
+            if retention and not has_retention:
+                cnt, err = db_refresh_gb_caggs(table_name, retention, db_eng)
+                if err:
+                    raise err
+                with db_eng.begin() as conn:
+                    conn.execute(text(f"SELECT add_retention_policy('eyedro.{table_name}', drop_after => INTERVAL '{retention}', if_not_exists => true)"))
+                applied.setdefault(table_name, []).append('retention')
+        except Exception as e:
+            logger.error(f"ZZZ {table_name} db_set_gb_storage_policies error: {e}")
+            return applied, e
+    logger.info(f'storage policies applied: {applied}')
+    return applied, None
+
+
+GB_DAY_EMPTY = 0
+GB_DAY_PARTIAL = 1
+GB_DAY_FULL = 2
+GB_FULL_DAY_SAMPLES = 1440
+
+
+def gb_serial_key(serial):
+    """The coverage and gap key of a serial: no 'gb_' prefix or dashes, upper case like the fleet serials."""
+    return serial.replace("gb_", "").replace("-", "").upper()
+
+
+def db_create_gb_coverage_table(db_eng=None):
+    if db_eng is None:
+        db_eng = db.set_local_defaultdb_engine()
+    res, err = db.sql_execute(const.SQL_GB_COVERAGE_TABLE, db_eng)
+    if err:
+        logger.error(err)
+        return None, err
+    return res, err
+
+
+def db_get_gb_coverage(db_eng, serials=None):
+    """
+    Load the ingest coverage index for the given serials.
+
+    Parameters
+    ----------
+    db_eng : sqlalchemy.engine.base.Engine
+        The engine connected to the eyedro database.
+    serials : list of str, optional
+        Serial numbers without dashes, by default all serials.
+
+    Returns
+    -------
+    tuple
+        ({serial: {day_epoch: status}}, None) or (None, err), keyed by gb_serial_key. Days not in
+        the index have never been requested.
+    """
+    where = ""
+    if serials is not None:
+        where = "WHERE serial IN (" + ", ".join(f"'{gb_serial_key(s)}'" for s in serials) + ")"
+    sql = f"SELECT serial, extract(epoch from day)::bigint, status FROM {const.GB_COVERAGE_TABLE} {where};"
+    res, err = db.sql_execute(sql, db_eng)
+    if err:
+        logger.error(f"db_get_gb_coverage ERROR: {err}")
+        return None, err
+    coverage = {}
+    for serial, day, status in res:
+        coverage.setdefault(serial, {})[day] = status
+    return coverage, None
+
+
+def db_update_gb_coverage(rows, db_eng):
+    """
+    Upsert (serial, day_epoch, status, samples) rows into the coverage index.
+
+    A day never moves down, e.g. a partial response does not overwrite a fully ingested day.
+    Serials are stored by gb_serial_key.
+    """
+    if not rows:
+        return 0, None
+    rows = [(gb_serial_key(serial), *rest) for serial, *rest in rows]
+    sql = f"""
+    INSERT INTO {const.GB_COVERAGE_TABLE} (serial, day, status, samples)
+    SELECT serial, (to_timestamp(day_epoch) AT TIME ZONE 'UTC')::date, status, samples
+    FROM (VALUES %s) AS v(serial, day_epoch, status, samples)
+    ON CONFLICT (serial, day) DO UPDATE SET
+        status = GREATEST({const.GB_COVERAGE_TABLE}.status, EXCLUDED.status),
+        samples = GREATEST({const.GB_COVERAGE_TABLE}.samples, EXCLUDED.samples),
+        updated_at = now();
+    """
+    conn = db_eng.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            execute_values(cur, sql, rows)
+        conn.commit()
     except Exception as e:
-        conn.rollback()  # Rollback on any other failure
-        logger.error(f"ZZZ {serial} update_gb_db Unexpected error: {e}")
+        conn.rollback()
+        logger.error(f"db_update_gb_coverage ERROR: {e}")
         return None, e
     finally:
         conn.close()
-    logger.info(f'{serial} {df["ts"].min()} {df["ts"].max()} In: {inserted_count}, Up: {updated_count} ✅ {msg}')
-    return [inserted_count, updated_count], None
+    return len(rows), None
+
+
+def gb_day_status(df):
+    samples = len(df)
+    if samples == 0:
+        return GB_DAY_EMPTY, 0
+    return (GB_DAY_FULL if samples >= GB_FULL_DAY_SAMPLES else GB_DAY_PARTIAL), samples
 
 
 def upsert_gb_data(s_num, engine, epoch_cutoff = epoch_2020, epoch_start = None, MAX_EMPTY=30, msg='', logger=logger):
+    """
+    Blocking wrapper around upsert_gb_data_async for a single serial.
+
+    Returns:
+        tuple: (s_num, ttl_cnt, err_cnt, ttl_inserted, ttl_updated, ttl_empty)
+    """
+    return upsert_gb_fleet([s_num], engine, concurrency=1, epoch_cutoff=epoch_cutoff, epoch_start=epoch_start,
+                           MAX_EMPTY=MAX_EMPTY, msg=msg, logger=logger)[0]
+
+
+async def upsert_gb_data_async(s_num, engine, session, sem=None, db_sem=None, epoch_cutoff = epoch_2020, epoch_start = None, MAX_EMPTY=30, msg='', logger=logger, batch_days=7, last_comm=None, coverage=None):
+    """
+    Walks one serial back one day at a time from its last communication and upserts each day.
+
+    Requests go through the shared session and semaphore so many serials can be walked
+    concurrently. The blocking database writes run in worker threads bounded by db_sem.
+
+    Args:
+        s_num (str): The GB serial number without dashes.
+        engine (sqlalchemy.engine.base.Engine): The engine connected to the eyedro database.
+        session (aiohttp.ClientSession): The shared session, see gb_client_session.
+        sem (asyncio.Semaphore, optional): Bounds the in-flight API requests.
+        db_sem (asyncio.Semaphore, optional): Bounds the concurrent database writes.
+        epoch_cutoff (int, optional): Stop walking back at this epoch.
+        epoch_start (int, optional): Start walking back from this epoch instead of the last communication.
+        MAX_EMPTY (int, optional): Stop after this many consecutive empty days.
+        batch_days (int, optional): Number of fetched days written per update_gb_db call.
+        last_comm (int, optional): LastCommSecUtc from the user info call, see gb_last_comm_map.
+            When given, the per-serial last communication request is skipped, a serial that has
+            not reported since the DB watermark is skipped and the walk stops at the watermark day.
+        coverage (dict, optional): {day_epoch: status} for this serial, see db_get_gb_coverage.
+            When given, fully ingested and confirmed empty days are not requested and the status
+            of every requested day is written back to the coverage index.
+
+    Returns:
+        tuple: (s_num, ttl_cnt, err_cnt, ttl_inserted, ttl_updated, ttl_empty)
+    """
+    async def in_db_thread(func, *args):
+        if db_sem is None:
+            return await asyncio.to_thread(func, *args)
+        async with db_sem:
+            return await asyncio.to_thread(func, *args)
+
+    async def flush():
+        nonlocal pending, cov_rows, ttl_inserted, ttl_updated
+        if pending:
+            df, pending = pd.concat(pending, ignore_index=True), []
+            cnt, err = await in_db_thread(update_gb_db, s_num, df, engine, msg)
+            if err:
+                # days with data stay uncovered so the next run fetches them again
+                cov_rows = [row for row in cov_rows if row[2] == GB_DAY_EMPTY]
+            if cnt:
+                ttl_inserted += cnt[0]
+                ttl_updated += cnt[1]
+        if cov_rows:
+            rows, cov_rows = cov_rows, []
+            await in_db_thread(db_update_gb_coverage, rows, engine)
+
+    pending = []
+    cov_rows = []
     no_data_cnt = 0
     ttl_cnt = 0
     err_cnt = 0
@@ -647,114 +1195,114 @@ def upsert_gb_data(s_num, engine, epoch_cutoff = epoch_2020, epoch_start = None,
     ttl_empty = 0
     MAX_BUSY = 7
     MAX_ERR = 15
-    epoch, data = get_last_com_epoch(s_num, logger)
-    if epoch < epoch_cutoff: # or s_num == '00980639':
+    if last_comm is not None and epoch_start is None:
+        epoch_db, err = await asyncio.to_thread(db.get_gb_epoch, s_num, engine)
+        if not err and epoch_db:
+            if epoch_db >= last_comm:
+                logger.info(f"{s_num} no new data since {datetime.fromtimestamp(epoch_db, timezone.utc).isoformat()} {msg}")
+                return s_num, ttl_cnt, err_cnt, ttl_inserted, ttl_updated, ttl_empty
+            # the watermark day may be partial so it is fetched again
+            epoch_cutoff = max(epoch_cutoff, app_utils.get_previous_midnight_epoch(epoch_db))
+        # no data yet: the first day request is the last comm day
+        epoch, data = app_utils.get_previous_midnight_epoch(last_comm), None
+    else:
+        epoch, data = await get_last_com_epoch_async(session, s_num, sem, logger)
+    if epoch < epoch_cutoff:
         logger.info(f"ZZZ {s_num} last com before cutoff: {datetime.fromtimestamp(epoch, timezone.utc).isoformat()}\n{datetime.fromtimestamp(epoch_cutoff, timezone.utc).isoformat()}" )
         return s_num, ttl_cnt, err_cnt, ttl_inserted, ttl_updated, ttl_empty
-    #!!!!! epoch = get_db_epoch(s_num, engine, max=True)
-    #!!!!! epoch = 1740535260
     if data and "DeviceData" in data:
         df = map_gb(data["DeviceData"])
         if not df.empty:
-            cnt, err = update_gb_db(s_num, df, engine, msg)
+            cnt, err = await in_db_thread(update_gb_db, s_num, df, engine, msg)
             if err:
                 logger.error(f"ZZZ {s_num}  {epoch} ERRORS: {err}")
                 return s_num, ttl_cnt, err_cnt, ttl_inserted, ttl_updated, ttl_empty
             ttl_inserted += cnt[0]
             ttl_updated += cnt[1]
             ttl_cnt += 1
-            print(cnt, ttl_cnt, epoch, s_num)
-        ####!!!! max_epoch_db = get_db_epoch(s_num, engine, max=True)
-        #!!! min_epoch_db = get_db_epoch(s_num, local_engine, max=False)
-    
+
     logger.info(f"{s_num} last com: {datetime.fromtimestamp(epoch, timezone.utc).isoformat()} cutoff: {datetime.fromtimestamp(epoch_cutoff, timezone.utc).isoformat()}" )
     if data and "Errors" in data:
         if len(data["Errors"]) == 0:
             epoch -= 86400
         else:
             logger.error(f"last_comm TRY AGAIN ZZZ {s_num}  {epoch} ERRORS: {data['Errors']}")
-    elif data is None:
+    elif data is None and last_comm is None:
         logger.error(f"data None TRY AGAIN ZZZ {s_num}  {epoch}")
-    ####epoch = min_epoch_db # start where we left off
+    # a day is only confirmed empty once the meter has reported after it
+    last_seen = last_comm if last_comm is not None else (data or {}).get('LastCommSecUtc')
     if epoch_start:
         epoch = epoch_start
         try:
             sql = f'select min(epoch_secs), min(ts) from eyedro.gb_{s_num};'
-            res, err = db.sql_execute(sql, engine)
+            res, err = await asyncio.to_thread(db.sql_execute, sql, engine)
             if res[0][0] and res[0][0] < epoch_start:
                 epoch = app_utils.get_previous_midnight_epoch(res[0][0])
         except: 
             pass
 
     while epoch >= epoch_cutoff and err_cnt < MAX_ERR and busy_cnt < MAX_BUSY:  #2024-01-01
-        # if ttl_cnt > 7:
-        #     #!!!!if epoch <= max_epoch_db and min_epoch_db <= epoch_cutoff:
-        #     #    return ttl_cnt, err_cnt, ttl_inserted, ttl_updated
-        #     return ttl_cnt, err_cnt, ttl_inserted, ttl_updated
-
-        #     epoch = min_epoch_db
-        #     ttl_cnt = -200
-        data = meter_response_empty(s_num, epoch)
+        if coverage is not None and coverage.get(epoch) in (GB_DAY_FULL, GB_DAY_EMPTY):
+            if coverage[epoch] == GB_DAY_EMPTY:
+                ttl_empty += 1
+                if ttl_empty >= MAX_EMPTY:
+                    break
+            else:
+                ttl_empty = 0
+            epoch -= 86400
+            continue
+        data = await meter_response_empty_async(session, s_num, epoch, sem)
         ttl_cnt += 1
         # these first 3 errors will retry
         if data is None:
             no_data_cnt += 1
             err_cnt += 1
             logger.error(f"{err_cnt} ZZZ {s_num} {epoch} ERROR: NO DATA: {no_data_cnt}")
-            ###epoch -= 86400
-            time.sleep(.5)
+            await asyncio.sleep(.5)
             continue
         if 'Errors' in data and len(data['Errors']) != 0:
             gb_err = log_gb_errors(data['Errors'], logger)
             if 'Invalid DateStartSecUtc' in str(gb_err[1]):
+                await flush()
                 logger.info(f'Invalid DateStartSecUtc NORMAL END OF DATA  {s_num} {epoch} {ttl_cnt} {err_cnt} {ttl_inserted} {ttl_updated} {ttl_empty}')
                 return s_num, ttl_cnt, err_cnt, ttl_inserted, ttl_updated, ttl_empty
             err_cnt += 1
             logger.error(f"{err_cnt} ZZZ {s_num}  {epoch} ERRORS: {gb_err}")
             if 'API Error' in gb_err[1]:
                 print(f'{s_num} {epoch}  ERROR: API Error. Contact Eyedro Admin.')
-                time.sleep(.5)
+                await asyncio.sleep(.5)
             if  'API busy' in gb_err[1]:
                 print(f'{s_num} {epoch}  BUSY: ERROR: API Error. Contact Eyedro Admin.')
                 busy_cnt += 1
-                time.sleep(2)
+                await asyncio.sleep(2)
             continue
         if 'DeviceData' not in data:
             err_cnt += 1
             no_data_cnt += 1
             logger.error(f"{err_cnt} ZZZ {s_num} {epoch} ERROR: NO DATA IN RESPONSE: {no_data_cnt}")
-            time.sleep(.5)
+            await asyncio.sleep(.5)
             continue
         else:
             df = map_gb(data["DeviceData"])
+            if coverage is not None:
+                status, samples = gb_day_status(df)
+                if status != GB_DAY_EMPTY or (last_seen and epoch + 86400 <= last_seen):
+                    cov_rows.append((s_num, epoch, status, samples))
             if not df.empty:
-                cnt, err = update_gb_db(s_num, df, engine, msg)
+                pending.append(df)
                 ttl_empty = 0
                 err_cnt = 0
                 busy_cnt = 0
-                #!!! if gaps:
-                #     columns = ['a_p1', 'a_p2', 'a_p3']
-                #     existing_columns = [col for col in columns if col in df.columns] 
-                #     if existing_columns:
-                #         df_filtered = df[df[existing_columns].isna().any(axis=1)]  # Select rows with NaN in any of the existing columns
-                #         df_filtered.loc[:, ~df_filtered.columns.isin(['ts', 'epoch_secs'])] = None
-
-                #         cnt1, err1 = update_gb_db(s_num, df_filtered, engine, msg)
-                #         print(epoch,datetime.fromtimestamp(epoch, timezone.utc).date(), s_num, err, err1)
-                if cnt:
-                    ttl_inserted += cnt[0]
-                    ttl_updated += cnt[1]
+                if len(pending) >= batch_days:
+                    await flush()
             else:
                 ttl_empty += 1
                 if ttl_empty >= MAX_EMPTY:
                     logger.warning(f"ZZZ {s_num} {ttl_empty} data empty: {datetime.fromtimestamp(epoch, timezone.utc).isoformat()}\n{datetime.fromtimestamp(epoch_cutoff, timezone.utc).isoformat()}" )
                     break
         epoch -= 86400
-        # event = keyboard.read_event(suppress=True) if keyboard.is_pressed('space') else None
-        # if event and event.event_type == keyboard.KEY_DOWN:
-        #     print("Key pressed! Skipping execution and continuing loop.")
-        #     break
 
+    await flush()
     if busy_cnt >= MAX_BUSY or err_cnt >= MAX_ERR or ttl_empty >= MAX_EMPTY:
         if busy_cnt >= MAX_BUSY:
             msg = 'BUSY'
@@ -766,7 +1314,58 @@ def upsert_gb_data(s_num, engine, epoch_cutoff = epoch_2020, epoch_start = None,
     return s_num, ttl_cnt, err_cnt, ttl_inserted, ttl_updated, ttl_empty
 
 
-def db_create_gb_gaps_table(db_eng=db.set_local_defaultdb_engine()):
+async def upsert_gb_fleet_async(serials, engine, concurrency=None, logger=logger, last_comm_map=None, coverage=None, **kwargs):
+    """
+    Walks every serial concurrently over one shared keep-alive session.
+
+    At most `concurrency` day requests are in flight across the whole fleet, and
+    database writes are bounded by the engine's pool size.
+
+    Args:
+        serials (list of str): GB serial numbers without dashes.
+        engine (sqlalchemy.engine.base.Engine): The engine connected to the eyedro database.
+        concurrency (int, optional): In-flight request budget, by default const.GB_API_MAX_CONCURRENCY.
+        last_comm_map (dict, optional): serial -> LastCommSecUtc, see gb_last_comm_map. Serials not
+            in the map fall back to a last communication request.
+        coverage (dict, optional): The coverage index from db_get_gb_coverage. When given, each
+            serial plans its days from it and records what it fetched.
+        **kwargs: Passed through to upsert_gb_data_async (epoch_cutoff, epoch_start, MAX_EMPTY, msg).
+
+    Returns:
+        list of tuple: One upsert_gb_data_async result per serial, in input order. A serial whose
+            walk raised gets (None, error) and does not stop the others.
+    """
+    concurrency = concurrency or const.GB_API_MAX_CONCURRENCY
+    sem = asyncio.Semaphore(concurrency)
+    db_sem = asyncio.Semaphore(const.SQLALCHEMY_POOL_SIZE or 5)
+    msg = kwargs.pop('msg', '')
+    async with gb_client_session(concurrency) as session:
+        tasks = [
+            upsert_gb_data_async(s_num, engine, session, sem=sem, db_sem=db_sem,
+                                 msg=msg or f'{i}/{len(serials)}', logger=logger,
+                                 last_comm=(last_comm_map or {}).get(s_num),
+                                 coverage=None if coverage is None else coverage.setdefault(gb_serial_key(s_num), {}), **kwargs)
+            for i, s_num in enumerate(serials, start=1)
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    for i, (s_num, res) in enumerate(zip(serials, results)):
+        if isinstance(res, Exception):
+            logger.error(f"{s_num} upsert_gb_data_async ERROR: {res!r}")
+            results[i] = (None, f"{s_num} ERROR: {res!r}")
+    return results
+
+
+def upsert_gb_fleet(serials, engine, concurrency=None, logger=logger, last_comm_map=None, coverage=None, **kwargs):
+    """
+    Blocking entry point for upsert_gb_fleet_async, for use from cron scripts.
+    """
+    return asyncio.run(upsert_gb_fleet_async(serials, engine, concurrency=concurrency, logger=logger,
+                                             last_comm_map=last_comm_map, coverage=coverage, **kwargs))
+
+
+def db_create_gb_gaps_table(db_eng=None):
+    if db_eng is None:
+        db_eng = db.set_local_defaultdb_engine()
     res, err = db.sql_execute(f'select epoch_secs from {const.GB_GAPS_TABLE} limit 1;', db_eng)
     if err:
         res, err = db.sql_execute(const.SQL_GB_GAPS_TABLE, db_eng)
@@ -778,9 +1377,10 @@ def db_create_gb_gaps_table(db_eng=db.set_local_defaultdb_engine()):
     return res, err
 
 
-def db_get_gb_hypertables(db_eng=db.set_local_defaultdb_engine()):
+def db_get_gb_hypertables(db_eng=None):
     """
     Gets all hypertables in the "eyedro" schema that have a name like 'gb_%'.
+    With const.GB_LONG_TABLE set the per serial views over eyedro.gb_1min are returned instead.
     
     Parameters:
     end (datetime): The end date for the query.
@@ -788,11 +1388,18 @@ def db_get_gb_hypertables(db_eng=db.set_local_defaultdb_engine()):
     Returns:
     list of str: A list of hypertable names.
     """
+    if db_eng is None:
+        db_eng = db.set_local_defaultdb_engine()
+    if const.GB_LONG_TABLE:
+        # per serial views over eyedro.gb_1min, see db_migrate_gb_to_1min
+        return db.sql_execute("""SELECT table_name FROM information_schema.views
+    where table_schema = 'eyedro' and table_name like 'gb_%' and table_name not like '%_hourly';""", db_eng)
     return db.sql_execute("""SELECT hypertable_name FROM timescaledb_information.hypertables 
-    where hypertable_schema = 'eyedro' and hypertable_name like 'gb_%';""", db_eng)
+    where hypertable_schema = 'eyedro' and hypertable_name like 'gb_%'
+    and hypertable_name <> 'gb_1min' and hypertable_name not like '%_legacy';""", db_eng)
 
 
-def db_hyper_gb_gaps(hypertable_name, db_eng=db.set_local_defaultdb_engine()):
+def db_hyper_gb_gaps(hypertable_name, db_eng=None, since_epoch=None):
     """
     Collects all hypergaps in the "eyedro" schema and writes the results to a CSV file.
     
@@ -804,7 +1411,19 @@ def db_hyper_gb_gaps(hypertable_name, db_eng=db.set_local_defaultdb_engine()):
     is included in the results.
     
     The results are written to a CSV file in the "data/gaps" directory. The file is named "eyedro_data_gaps.csv".
+
+    If since_epoch is given only rows from since_epoch on are scanned. The row at since_epoch is
+    included so the first new row is compared with it (one-row overlap), and the ts bound lets
+    TimescaleDB skip the older chunks.
+
+    Returns:
+        tuple: ([(hypertable, epoch_secs, prev_epoch, diff_seconds), ...], None) or (None, err).
     """
+    if db_eng is None:
+        db_eng = db.set_local_defaultdb_engine()
+    where = ""
+    if since_epoch is not None:
+        where = f"WHERE ts >= to_timestamp({int(since_epoch)}) AT TIME ZONE 'UTC' - INTERVAL '1 minute' AND epoch_secs >= {int(since_epoch)}"
     try:
         conn = db_eng.raw_connection()
         with conn.cursor() as cursor:
@@ -813,6 +1432,7 @@ def db_hyper_gb_gaps(hypertable_name, db_eng=db.set_local_defaultdb_engine()):
                 SELECT epoch_secs, 
                     LAG(epoch_secs) OVER (ORDER BY epoch_secs) AS prev_epoch
                 FROM eyedro.{hypertable_name}
+                {where}
             )
             SELECT '{hypertable_name}' AS hypertable, epoch_secs, prev_epoch, (epoch_secs - prev_epoch) AS diff_seconds
             FROM ordered_epochs
@@ -821,29 +1441,29 @@ def db_hyper_gb_gaps(hypertable_name, db_eng=db.set_local_defaultdb_engine()):
 
             cursor.execute(query)
             rows = cursor.fetchall()
-            print(f"Processed hypertable {hypertable_name}, gaps found: {len(rows)}")
-        conn.close()
-        return rows
+            logger.debug(f"Processed hypertable {hypertable_name}, gaps found: {len(rows)}")
+        return rows, None
 
     except psycopg2.OperationalError as e:
-        err = e
-        print(f"Database connection error: {e}")
+        logger.error(f"ZZZ {hypertable_name} db_hyper_gb_gaps connection error: {e}")
+        return None, e
     except psycopg2.DatabaseError as e:
-        err = e
-        print(f"Database query error: {e}")
+        logger.error(f"ZZZ {hypertable_name} db_hyper_gb_gaps query error: {e}")
+        return None, e
     except Exception as e:
-        err = e
-        print(f"Unexpected error: {e}")
+        logger.error(f"ZZZ {hypertable_name} db_hyper_gb_gaps ERROR: {e}")
+        return None, e
     finally:
         if 'conn' in locals() and conn:
             conn.close()
 
-    return []
 
-
-def hyper_gb_gaps_concur(ht_names, chunks=10, src='local', db_eng=db.set_local_defaultdb_engine()):
+def hyper_gb_gaps_concur(ht_names, chunks=10, src='local', db_eng=None):
+    if db_eng is None:
+        db_eng = db.set_local_defaultdb_engine()
     def process_chunk(chunk, param1):
-        return [db_hyper_gb_gaps(item[0], db_eng=param1) for item in chunk]  # Apply function to each item
+        # a table that failed to scan contributes no rows
+        return [db_hyper_gb_gaps(item[0], db_eng=param1)[0] or [] for item in chunk]
 
     # ht_names = []
     # for item in res:
@@ -897,6 +1517,281 @@ def db_get_all_gb_gaps(src='local'):
     print(f"✅ Data gaps found in {len(df)} rows. Results saved to 'eyedro_data_gaps.csv'.")
 
 
+def db_get_gb_gaps_watermarks(db_eng):
+    """
+    Returns ({hypertable_name: last_epoch}, None) or (None, err). Creates the watermark table if needed.
+    """
+    res, err = db.sql_execute(const.SQL_GB_GAPS_WATERMARK_TABLE, db_eng)
+    if err:
+        logger.error(f"db_get_gb_gaps_watermarks ERROR: {err}")
+        return None, err
+    return {name: last_epoch for name, last_epoch in res}, None
+
+
+def db_merge_gb_gaps(hypertable_name, rows, last_epoch, db_eng):
+    """
+    Merge newly found gaps into the gaps table and move the table's watermark, in one transaction.
+
+    Parameters
+    ----------
+    hypertable_name : str
+        The scanned hypertable, e.g. 'gb_00980001'.
+    rows : list of tuple
+        (hypertable, epoch_secs, prev_epoch, diff_seconds) rows from db_hyper_gb_gaps.
+    last_epoch : int
+        The newest epoch_secs scanned.
+
+    Returns
+    -------
+    tuple
+        (number of new gaps, None) or (None, err).
+    """
+    # a gap already in the table is skipped whatever its deleted flag, the unique constraint includes deleted
+    gaps_sql = f"""
+    INSERT INTO {const.GB_GAPS_TABLE} (hypertable_name, epoch_secs, prev_epoch, diff_seconds, days)
+    SELECT v.hypertable_name, v.epoch_secs, v.prev_epoch, v.diff_seconds, v.days
+    FROM (VALUES %s) AS v(hypertable_name, epoch_secs, prev_epoch, diff_seconds, days)
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {const.GB_GAPS_TABLE} g
+        WHERE g.hypertable_name = v.hypertable_name AND g.epoch_secs = v.epoch_secs AND g.prev_epoch = v.prev_epoch)
+    ON CONFLICT ON CONSTRAINT gb_gaps_epoch_secs_prev_epoch_key DO NOTHING
+    RETURNING 1;
+    """
+    watermark_sql = f"""
+    INSERT INTO {const.GB_GAPS_WATERMARK_TABLE} (hypertable_name, last_epoch)
+    VALUES (%s, %s)
+    ON CONFLICT (hypertable_name) DO UPDATE SET last_epoch = EXCLUDED.last_epoch, updated_at = now();
+    """
+    values = [(name, epoch, prev, diff, str(diff // 86400)) for name, epoch, prev, diff in rows]
+    conn = db_eng.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            inserted = 0
+            if values:
+                inserted = len(execute_values(cur, gaps_sql, values, fetch=True))
+            cur.execute(watermark_sql, (hypertable_name, int(last_epoch)))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"ZZZ {hypertable_name} db_merge_gb_gaps ERROR: {e}")
+        return None, e
+    finally:
+        conn.close()
+    return inserted, None
+
+
+def db_gb_gaps_incremental(hypertable_name, since_epoch, db_eng):
+    """
+    Find the gaps added to one hypertable since its watermark and merge them into the gaps table.
+
+    Returns
+    -------
+    tuple
+        (hypertable_name, new gaps, new watermark). The watermark is unchanged if nothing new was scanned.
+    """
+    res, err = db.sql_execute(
+        f"SELECT max(epoch_secs) FROM eyedro.{hypertable_name}"
+        + (f" WHERE ts >= to_timestamp({int(since_epoch)}) AT TIME ZONE 'UTC' - INTERVAL '1 minute';" if since_epoch else ";"),
+        db_eng)
+    if err or not res or res[0][0] is None or (since_epoch and res[0][0] <= since_epoch):
+        return hypertable_name, 0, since_epoch
+    last_epoch = res[0][0]
+    rows, err = db_hyper_gb_gaps(hypertable_name, db_eng, since_epoch=since_epoch)
+    if err:
+        # the watermark stays put so the range is scanned again on the next pass
+        return hypertable_name, 0, since_epoch
+    # rows past last_epoch arrived during the scan, the next pass picks them up
+    rows = [row for row in rows if row[1] <= last_epoch]
+    inserted, err = db_merge_gb_gaps(hypertable_name, rows, last_epoch, db_eng)
+    if err:
+        return hypertable_name, 0, since_epoch
+    return hypertable_name, inserted, last_epoch
+
+
+def db_update_all_gb_gaps(db_eng=None, max_workers=10):
+    """
+    Incremental gap detection for all "gb" hypertables.
+
+    Each table is scanned from its watermark in eyedro.gb_1min_gaps_watermark (the whole table on
+    the first pass) and the new gaps are merged into the gaps table, so a pass costs O(new data).
+    Days rewritten by a backfill below the watermark are settled by gb_backfill_gaps.
+
+    Returns:
+        list of tuple: (hypertable_name, new gaps, watermark) per hypertable.
+    """
+    if db_eng is None:
+        db_eng = db.set_local_defaultdb_engine()
+    ht_names, err = db_get_gb_hypertables(db_eng)
+    if err:
+        return []
+    watermarks, err = db_get_gb_gaps_watermarks(db_eng)
+    if err:
+        return []
+    res, err = db_create_gb_gaps_table(db_eng)
+    if err:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda ht: db_gb_gaps_incremental(ht[0], watermarks.get(ht[0]), db_eng), ht_names))
+    logger.info(f"✅ incremental gaps: {sum(r[1] for r in results)} new in {len(results)} hypertables")
+    return results
+
+
+def db_get_gb_gap_days(db_eng, serials=None):
+    """
+    Collapse the open holes in the gaps table into the (serial, day) pairs that need a request.
+
+    Parameters
+    ----------
+    db_eng : sqlalchemy.engine.base.Engine
+        The engine connected to the eyedro database.
+    serials : list of str, optional
+        Only plan these serials, by default every serial with open gaps.
+
+    Returns
+    -------
+    tuple
+        ({serial: [day_epoch, ...]}, None) with days newest first, or (None, err).
+    """
+    res, err = db.sql_execute(const.SQL_GB_GAPS_RESOLUTION, db_eng)
+    if err:
+        logger.error(f"db_get_gb_gap_days ERROR: {err}")
+        return None, err
+    res, err = db.sql_execute(const.SQL_GB_GAP_DAYS, db_eng)
+    if err:
+        logger.error(f"db_get_gb_gap_days ERROR: {err}")
+        return None, err
+    wanted = None if serials is None else {gb_serial_key(s) for s in serials}
+    gap_days = {}
+    for serial, day in res:
+        if wanted is None or serial in wanted:
+            gap_days.setdefault(serial, []).append(day)
+    return gap_days, None
+
+
+def db_resolve_gb_gaps(serial, days, db_eng):
+    """
+    Re-check the open gaps of one serial after its days were fetched again.
+
+    Only gaps whose every day is in `days` are checked. A gap is resolved when all of its
+    missing minutes are now in the table, otherwise the API has nothing more and it is marked
+    unrecoverable.
+
+    Returns
+    -------
+    tuple
+        ((resolved, unrecoverable), None) or (None, err).
+    """
+    table = f"gb_{serial.lower()}"
+    sql = f"""
+    WITH checked AS (
+        SELECT g.ctid AS row_id,
+            (SELECT count(*) FROM eyedro.{table} t
+             WHERE t.ts > to_timestamp(g.prev_epoch) AT TIME ZONE 'UTC'
+               AND t.ts < to_timestamp(g.epoch_secs) AT TIME ZONE 'UTC') AS found,
+            ceil((g.epoch_secs - g.prev_epoch) / 60.0)::int - 1 AS expected
+        FROM {const.GB_GAPS_TABLE} g
+        WHERE g.hypertable_name = '{table}' AND g.resolved_at IS NULL AND NOT g.unrecoverable AND g.deleted IS NOT TRUE
+          AND g.diff_seconds > 60
+          AND NOT EXISTS (
+            SELECT 1 FROM generate_series(
+                date_trunc('day', to_timestamp(g.prev_epoch + 60) AT TIME ZONE 'UTC'),
+                date_trunc('day', to_timestamp(g.epoch_secs - 60) AT TIME ZONE 'UTC'),
+                interval '1 day') AS d
+            WHERE extract(epoch from d)::bigint <> ALL(%(days)s))
+    )
+    UPDATE {const.GB_GAPS_TABLE} g SET
+        resolved_at = CASE WHEN c.found >= c.expected THEN now() END,
+        unrecoverable = c.found < c.expected
+    FROM checked c
+    WHERE g.ctid = c.row_id
+    RETURNING g.resolved_at IS NOT NULL;
+    """
+    conn = db_eng.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, {"days": list(days)})
+            rows = cur.fetchall()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"ZZZ {serial} db_resolve_gb_gaps ERROR: {e}")
+        return None, e
+    finally:
+        conn.close()
+    resolved = sum(1 for row in rows if row[0])
+    return (resolved, len(rows) - resolved), None
+
+
+async def backfill_gb_days_async(serial, days, engine, session, sem=None, db_sem=None, logger=logger):
+    """
+    Request only the given days of one serial, upsert them in one write and settle its gaps.
+
+    Returns:
+        tuple: (serial, days requested, days fetched, inserted, updated, resolved, unrecoverable)
+    """
+    async def in_db_thread(func, *args):
+        if db_sem is None:
+            return await asyncio.to_thread(func, *args)
+        async with db_sem:
+            return await asyncio.to_thread(func, *args)
+
+    responses = await asyncio.gather(*[meter_response_empty_async(session, serial, day, sem) for day in days])
+    fetched, frames, cov_rows = [], [], []
+    for day, data in zip(days, responses):
+        if data is None or data.get('Errors') or 'DeviceData' not in data:
+            logger.warning(f"ZZZ {serial} {day} gap day not fetched: {None if data is None else data.get('Errors')}")
+            continue
+        df = map_gb(data["DeviceData"])
+        fetched.append(day)
+        status, samples = gb_day_status(df)
+        cov_rows.append((serial, day, status, samples))
+        if not df.empty:
+            frames.append(df)
+
+    cnt = [0, 0]
+    if frames:
+        cnt, err = await in_db_thread(update_gb_db, serial, pd.concat(frames, ignore_index=True), engine, 'gaps')
+        if err:
+            return serial, len(days), 0, 0, 0, 0, 0
+    await in_db_thread(db_update_gb_coverage, cov_rows, engine)
+    settled, err = await in_db_thread(db_resolve_gb_gaps, serial, fetched, engine) if fetched else ((0, 0), None)
+    if err:
+        settled = (0, 0)
+    logger.info(f"{serial} gap days: {len(days)} fetched: {len(fetched)} resolved: {settled[0]} unrecoverable: {settled[1]}")
+    return serial, len(days), len(fetched), cnt[0], cnt[1], settled[0], settled[1]
+
+
+def gb_backfill_gaps(db_eng, serials=None, concurrency=None, logger=logger):
+    """
+    Gap-targeted backfill: request only the (serial, day) pairs holding open gaps.
+
+    Args:
+        db_eng (sqlalchemy.engine.base.Engine): The engine connected to the eyedro database.
+        serials (list of str, optional): Only backfill these serials.
+        concurrency (int, optional): In-flight request budget, by default const.GB_API_MAX_CONCURRENCY.
+
+    Returns:
+        list of tuple: One backfill_gb_days_async result per serial with open gaps.
+    """
+    gap_days, err = db_get_gb_gap_days(db_eng, serials)
+    if err:
+        return []
+    logger.info(f"gap backfill: {len(gap_days)} serials, {sum(len(d) for d in gap_days.values())} days")
+
+    async def run():
+        concur = concurrency or const.GB_API_MAX_CONCURRENCY
+        sem = asyncio.Semaphore(concur)
+        db_sem = asyncio.Semaphore(const.SQLALCHEMY_POOL_SIZE or 5)
+        async with gb_client_session(concur) as session:
+            return await asyncio.gather(*[
+                backfill_gb_days_async(serial, days, db_eng, session, sem, db_sem, logger)
+                for serial, days in gap_days.items()
+            ])
+
+    return asyncio.run(run())
+
+
 
 """ TimescaleDB Notes
 what does this do ?    SELECT add_continuous_aggregate_policy(
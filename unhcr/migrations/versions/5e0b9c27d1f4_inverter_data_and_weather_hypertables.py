@@ -0,0 +1,103 @@
+"""Inverter data and weather hypertables
+
+Turns solarman.inverter_data and solarman.weather into TimescaleDB hypertables (7 day chunks on ts,
+existing rows migrated), compresses chunks older than 30 days segmented by device_sn, and adds
+hourly and daily continuous aggregates over the power, energy and weather columns used by the
+reports. The aggregates are created WITH NO DATA and filled by their refresh policies.
+
+Upserts into compressed chunks need TimescaleDB 2.11 or later.
+
+Revision ID: 5e0b9c27d1f4
+Revises: acdd6468e03f
+Create Date: 2025-06-02 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '5e0b9c27d1f4'
+down_revision: Union[str, None] = 'acdd6468e03f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHUNK_INTERVAL = '7 days'
+COMPRESS_AFTER = '30 days'
+
+# instantaneous readings are averaged, daily and lifetime counters keep their last (max) value
+INVERTER_AVG_COLS = [
+    'total_solar_power', 'total_inverter_output_power', 'total_grid_power', 'total_consumption_power',
+    'total_gen_power', 'battery_power', 'soc',
+]
+INVERTER_MAX_COLS = [
+    'daily_production_active', 'cumulative_production_active', 'daily_consumption', 'daily_energy_buy',
+    'daily_energy_sell', 'daily_charging_energy', 'daily_discharging_energy', 'daily_production_generator',
+]
+WEATHER_AVG_COLS = ['temp_c', 'panel_temp', 'humidity', 'irr']
+WEATHER_MAX_COLS = ['rainfall', 'daily_irr']
+
+# (table, average columns, max columns)
+HYPERTABLES = [
+    ('inverter_data', INVERTER_AVG_COLS, INVERTER_MAX_COLS),
+    ('weather', WEATHER_AVG_COLS, WEATHER_MAX_COLS),
+]
+
+# (suffix, bucket, refresh start_offset, end_offset, schedule_interval)
+CAGGS = [
+    ('hourly', '1 hour', '3 days', '1 hour', '1 hour'),
+    ('daily', '1 day', '10 days', '1 day', '1 day'),
+]
+
+
+def cagg_sql(table, avg_cols, max_cols, suffix, bucket):
+    aggs = ',\n        '.join(
+        [f'avg({col}) AS {col}' for col in avg_cols]
+        + [f'max({col}) AS {col}' for col in max_cols]
+    )
+    return f"""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS solarman.{table}_{suffix}
+    WITH (timescaledb.continuous) AS
+    SELECT device_sn, time_bucket('{bucket}', ts) AS bucket,
+        {aggs},
+        count(*) AS samples
+    FROM solarman.{table}
+    GROUP BY device_sn, bucket
+    WITH NO DATA;
+    """
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS timescaledb;")
+    for table, avg_cols, max_cols in HYPERTABLES:
+        op.execute(f"""
+            SELECT create_hypertable('solarman.{table}', 'ts', chunk_time_interval => INTERVAL '{CHUNK_INTERVAL}',
+                migrate_data => true, if_not_exists => true);
+        """)
+        op.execute(f"""
+            ALTER TABLE solarman.{table} SET (timescaledb.compress,
+                timescaledb.compress_segmentby = 'device_sn', timescaledb.compress_orderby = 'ts DESC');
+        """)
+        op.execute(f"SELECT add_compression_policy('solarman.{table}', INTERVAL '{COMPRESS_AFTER}', if_not_exists => true);")
+        for suffix, bucket, start_offset, end_offset, schedule in CAGGS:
+            op.execute(cagg_sql(table, avg_cols, max_cols, suffix, bucket))
+            op.execute(f"""
+                SELECT add_continuous_aggregate_policy('solarman.{table}_{suffix}',
+                    start_offset => INTERVAL '{start_offset}', end_offset => INTERVAL '{end_offset}',
+                    schedule_interval => INTERVAL '{schedule}', if_not_exists => true);
+            """)
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    TimescaleDB cannot turn a hypertable back into a plain table in place, the tables stay
+    hypertables with their chunks decompressed.
+    """
+    for table, _, _ in HYPERTABLES:
+        for suffix, *_ in CAGGS:
+            op.execute(f"DROP MATERIALIZED VIEW IF EXISTS solarman.{table}_{suffix};")
+        op.execute(f"SELECT remove_compression_policy('solarman.{table}', if_exists => true);")
+        op.execute(f"SELECT decompress_chunk(c, if_compressed => true) FROM show_chunks('solarman.{table}') c;")
+        op.execute(f"ALTER TABLE solarman.{table} SET (timescaledb.compress = false);")
@@ -0,0 +1,80 @@
+"""data_custom datetimeserver index
+
+Adds a partial expression index on the Leonics (external_id 'sys_%') rows of Prospect's data_custom
+table, ordered by custom->>'datetimeserver', so db.prospect_get_start_ts and ad hoc lookups of the
+latest pushed row read one index entry instead of sorting the table.
+
+data_custom lives in the Prospect databases, not in the database this chain migrates, so the index is
+built over const.PROS_CONN_LOCAL_STR and const.PROS_CONN_AZURE_STR. A Prospect database that is not
+configured, not reachable or has no data_custom table is logged and skipped, so the chain still upgrades
+in dev, CI and on hosts without Prospect access; re-run the upgrade SQL there by hand when needed.
+
+The key stays text: a cast to timestamp is not immutable and can not be indexed, and the Leonics
+'YYYY-MM-DD HH:MM' values sort the same as text and as time. The index is built CONCURRENTLY.
+
+Revision ID: 9b3f6a1d2c47
+Revises: 5e0b9c27d1f4
+Create Date: 2025-06-09 09:41:17.502736
+
+"""
+import logging
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from unhcr import constants as const
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b3f6a1d2c47'
+down_revision: Union[str, None] = '5e0b9c27d1f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX = 'data_custom_sys_datetimeserver_idx'
+
+logger = logging.getLogger(__name__)
+
+
+def prospect_urls() -> list:
+    """The configured Prospect connection strings, local first, without duplicates."""
+    urls = [const.PROS_CONN_LOCAL_STR, const.PROS_CONN_AZURE_STR]
+    return list(dict.fromkeys(url for url in urls if url and not url.endswith(" missing")))
+
+
+def on_prospect(sql: str) -> int:
+    """Runs sql on each Prospect database holding data_custom, returns how many it ran on."""
+    done = 0
+    for url in prospect_urls():
+        try:
+            eng = sa.create_engine(url, isolation_level="AUTOCOMMIT", poolclass=sa.pool.NullPool)
+        except Exception as e:
+            logger.warning(f"{INDEX}: skipping a Prospect database, bad connection string: {e}")
+            continue
+        try:
+            with eng.connect() as conn:
+                if not conn.execute(sa.text("SELECT to_regclass('data_custom') IS NOT NULL")).scalar():
+                    logger.warning(f"{INDEX}: skipping {eng.url.host}, no data_custom table")
+                    continue
+                conn.execute(sa.text(sql))
+                done += 1
+        except sa.exc.SQLAlchemyError as e:
+            logger.warning(f"{INDEX}: skipping {eng.url.host}: {e}")
+        finally:
+            eng.dispose()
+    return done
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not on_prospect(f"""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX}
+        ON data_custom ((custom ->> 'datetimeserver') DESC)
+        WHERE external_id LIKE 'sys_%';
+    """):
+        logger.warning(f"{INDEX}: no reachable Prospect database with data_custom, index not built")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    on_prospect(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX};")
@@ -70,6 +70,7 @@ For Production:
 from datetime import datetime, timezone
 import sys
 from sqlalchemy import TIMESTAMP, BigInteger, Column, ForeignKey, Index, Integer, Float, String, DateTime, JSON, Numeric, UniqueConstraint, create_engine, func, inspect, select, text
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import declarative_base, Session
 
 from unhcr import db
@@ -496,7 +497,9 @@ from alembic import command
 from sqlalchemy.schema import MetaData
 import os
 
-def check_db_schema(eng=db.set_local_defaultdb_engine(), alembic_cfg=None):
+def check_db_schema(eng=None, alembic_cfg=None):
+    if eng is None:
+        eng = db.set_local_defaultdb_engine()
     err = None
     res = []
     try:
@@ -556,7 +559,9 @@ def migration_exists(msg, migration_dir):
     #return any(migration_file_name in f for f in os.listdir(migration_dir))
 
 
-def create_migration(msg, versions, eng=db.set_local_defaultdb_engine(), sql=True):
+def create_migration(msg, versions, eng=None, sql=True):
+    if eng is None:
+        eng = db.set_local_defaultdb_engine()
     err = None
     res = []
     try:
@@ -725,7 +730,9 @@ def create_migration(msg, versions, eng=db.set_local_defaultdb_engine(), sql=Tru
         os.chdir("../../")
     return res, err
 
-def create_solarman_migration(msg, eng=db.set_local_defaultdb_engine()):
+def create_solarman_migration(msg, eng=None):
+    if eng is None:
+        eng = db.set_local_defaultdb_engine()
     if not msg:
         return None, print("No message provided.")
 
@@ -741,6 +748,46 @@ def create_solarman_migration(msg, eng=db.set_local_defaultdb_engine()):
 
 
 
+UPSERT_BATCH = 1000
+
+
+def db_bulk_upsert(eng, model, rows, index_elements, batch=UPSERT_BATCH):
+    """
+    Upserts rows into the table of model with one INSERT ... ON CONFLICT DO UPDATE per batch.
+
+    All batches share one transaction. Rows repeating a conflict key keep the last one, the
+    non-key columns of existing rows are overwritten and updated is set to now().
+
+    Args:
+        eng (sqlalchemy.engine.Engine): The database engine.
+        model: The declarative model of the target table.
+        rows (list of dict): Column name -> value, all with the same keys.
+        index_elements (list of str): The primary key or unique columns to conflict on.
+        batch (int): Rows per statement.
+
+    Returns:
+        tuple: (number of rows upserted, None) or (None, error message).
+    """
+    table = model.__table__
+    rows = list({tuple(row[k] for k in index_elements): row for row in rows}.values())
+    if not rows:
+        return 0, None
+    update_cols = [col for col in rows[0] if col not in index_elements and col not in ("created", "updated")]
+    cnt = 0
+    try:
+        with eng.begin() as conn:
+            for i in range(0, len(rows), batch):
+                stmt = insert(table).values(rows[i:i + batch])
+                set_ = {col: stmt.excluded[col] for col in update_cols}
+                if "updated" in table.columns:
+                    set_["updated"] = func.now()
+                stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
+                cnt += conn.execute(stmt).rowcount
+        return cnt, None
+    except Exception as e:
+        return None, f"db_bulk_upsert {table.fullname} ERROR: {e}"
+
+
 def db_update_device_history(site_id, eng, utc=datetime(2024, 10, 1, 0, 0, 0, tzinfo=timezone.utc)):
     site_devices = []
     for s in SITE_ID:
@@ -760,22 +807,18 @@ def db_update_device_history(site_id, eng, utc=datetime(2024, 10, 1, 0, 0, 0, tz
         # Query all devices
         devices = session.scalars(select(Device).filter(Device.device_sn.in_(device_sns))).all()
 
-        # Save results
-        for device in devices:
-        #   print(f"Device SN: {device.device_sn}, ID: {device.device_id}, Type: {device.device_type}")
-        
-    
-            new_history = DeviceSiteHistory(
-            station_id=site_id,  # Replace with actual station_id
-            device_sn=device.device_sn,  # Replace with actual device_sn
-            device_id=device.device_id,  # Replace with actual device_id
-            comment="Site online around Oct 1st 2024",
-            start_time=utc,  # Current time as start time
-            end_time=None  # Still at this site
-            )
-
-            # Add to session and commit
-            session.merge(new_history)
-            session.commit()
-    return devices, None        
-    pass
+    rows = [
+        {
+            "station_id": site_id,
+            "device_sn": device.device_sn,
+            "device_id": device.device_id,
+            "comment": "Site online around Oct 1st 2024",
+            "start_time": utc,
+            "end_time": None,  # Still at this site
+        }
+        for device in devices
+    ]
+    _, err = db_bulk_upsert(eng, DeviceSiteHistory, rows, ["station_id", "device_sn", "start_time"])
+    if err:
+        return None, err
+    return devices, None
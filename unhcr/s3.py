@@ -23,9 +23,9 @@ from unhcr import app_utils
 from unhcr import constants as const
 
 mods=[["app_utils", "app_utils"],["constants", "const"]]
-res = app_utils.app_init(mods=mods, log_file="unhcr.s3.log", version="0.4.8", level="INFO", override=False)
+res = app_utils.app_init(mods=mods, log_file="unhcr.s3.log", version="0.4.8", level="INFO", override=False, lazy=True)
 logger = res[0]
-if const.LOCAL:  # testing with local python files
+if len(res) > 1:  # testing with local python files
     logger, app_utils, const = res
 
 # from unhcr import constants as const
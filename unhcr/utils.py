@@ -248,7 +248,8 @@ def log_setup(log_file, level="INFO", override=False):
     log_path = '/home/unhcr_admin/code/logs/' if is_ubuntu() else 'E:/_UNHCR/CODE/LOGS'
     log_path = os.path.expanduser(log_path)  # expands ~ to /home/you or C:\Users\you
     log_file_path = os.path.join(log_path, log_file)
-    file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
+    # delay: the file is opened on the first record, not when the module importing us is loaded
+    file_handler = logging.FileHandler(log_file_path, encoding="utf-8", delay=True)
     config_log_handler(file_handler, level, formatter, logger)
     # Set the overall logging level
     logger.setLevel(getattr(logging, level))
@@ -256,10 +257,6 @@ def log_setup(log_file, level="INFO", override=False):
     return logger
 
 
-# init logging
-log_setup(log_file)
-
-
 def ts2Epoch(dt, offset_hrs=0):
     """
     Convert a date string to epoch time in seconds, adjusted for a given time offset
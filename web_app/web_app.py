@@ -9,6 +9,7 @@ from flask import (
     request,
     redirect,
     flash,
+    g,
     Response,
     session as flask_session,
     url_for
@@ -416,7 +417,6 @@ class DynamicTableView(ModelView):
         # Build base query
         query = self.session.query(model)
         self.count_query = self.session.query(func.count()).select_from(model)
-        count = self.count_query.scalar()
         combined_filter = self.get_filters_from_request(request, model)
 
         # Apply the combined filter if any  'SELECT eyedro.gb_0098063d.epoch_secs AS eyedro_gb_0098063d_epoch_secs, eyedro.gb_0098063d.ts AS eyedro_gb_0098063d_ts, eyedro.gb_0098063d.a_p1 AS eyedro_gb_0098063d_a_p1, eyedro.gb_0098063d.a_p2 AS eyedro_gb_0098063d_a_p2, eyedro.gb_0098063d.a_p3 AS eyedro_gb_0098063d_a_p3, eyedro.gb_0098063d.v_p1 AS eyedro_gb_0098063d_v_p1, eyedro.gb_0098063d.v_p2 AS eyedro_gb_0098063d_v_p2, eyedro.gb_0098063d.v_p3 AS eyedro_gb_0098063d_v_p3, eyedro.gb_0098063d.pf_p1 AS eyedro_gb_0098063d_pf_p1, eyedro.gb_0098063d.pf_p2 AS eyedro_gb_0098063d_pf_p2, eyedro.gb_0098063d.pf_p3 AS eyedro_gb_0098063d_pf_p3, eyedro.gb_0098063d.wh_p1 AS eyedro_gb_0098063d_wh_p1, eyedro.gb_0098063d.wh_p2 AS eyedro_gb_0098063d_wh_p2, eyedro.gb_0098063d.wh_p3 AS eyedro_gb_0098063d_wh_p3, eyedro.gb_0098063d.api_flag AS eyedro_gb_0098063d_api_flag \nFROM eyedro.gb_0098063d \nWHERE CAST(eyedro.gb_0098063d.ts AS DATE) BETWEEN %(param_1)s AND %(param_2)s AND eyedro.gb_0098063d.a_p1 < %(a_p1_1)s AND eyedro.gb_0098063d.a_p2 < %(a_p2_1)s'
@@ -429,6 +429,10 @@ class DynamicTableView(ModelView):
 
             # Get the count with filters applied
             count = self.session.scalar(self.count_query)
+        else:
+            count = self.get_estimated_count(model)
+        # per request, the view instance is shared by every request
+        g.row_count = count
         
         
         # Apply pagination at the database level
@@ -547,8 +551,39 @@ class DynamicTableView(ModelView):
 
 
 
+    def get_estimated_count(self, model):
+        """Row count of an unfiltered table, estimated from statistics above a million rows.
+
+        Hypertables (solarman.inverter_data, solarman.weather, eyedro.gb_*) use the TimescaleDB
+        estimate over their chunks, so browsing them does not count every row on each page.
+        """
+        table = model.__table__
+        params = {"schema": table.schema, "table": table.name}
+        reltuples = "(SELECT reltuples::BIGINT FROM pg_class WHERE oid = to_regclass(format('%I.%I', :schema, :table)))"
+        # timescaledb_information only exists, and only parses, where the extension is installed
+        has_timescale = self.session.scalar(text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'timescaledb')"))
+        if has_timescale:
+            sql = f"""
+            SELECT CASE WHEN EXISTS (SELECT 1 FROM timescaledb_information.hypertables
+                                     WHERE hypertable_schema = :schema AND hypertable_name = :table)
+                THEN approximate_row_count(format('%I.%I', :schema, :table)::regclass)
+                ELSE {reltuples}
+            END
+            """
+        else:
+            sql = f"SELECT {reltuples}"
+        estimate = self.session.scalar(text(sql), params)
+        if estimate is not None and estimate > 1_000_000:
+            return estimate
+        return self.session.scalar(self.count_query)
+
+
     def get_count_query(self, model):
         """Construct a query to get the total row count."""
+        # get_list already counted this request's rows
+        row_count = g.get("row_count") if has_request_context() else None
+        if row_count is not None:
+            return row_count
         return self.session.scalar(self.count_query) #self.session.query(func.count()).select_from(model)
         
 
@@ -798,14 +833,14 @@ def get_tables_with_counts(schema_name):
     query = text("""
         SELECT
         c.relname AS table_name,
-        c.reltuples::BIGINT AS estimated_rows,
+        GREATEST(c.reltuples, 0)::BIGINT AS estimated_rows,
         pg_size_pretty(pg_total_relation_size(c.oid)) AS total_size
         FROM
         pg_class c
         JOIN pg_namespace n ON n.oid = c.relnamespace
         WHERE
         n.nspname = :schema
-        AND c.relkind = 'r'  -- 'r' = regular table
+        AND c.relkind IN ('r', 'v')  -- 'r' = regular table, 'v' = view (eyedro.gb_{serial} over eyedro.gb_1min)
         ORDER BY
         pg_total_relation_size(c.oid) DESC;
     """)